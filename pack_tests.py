@@ -7,9 +7,26 @@
 import os
 import sys
 import argparse
+import hashlib
+import json
+import struct
+import time
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+# 压缩包内记录每个成员 SHA-256 的清单文件
+MANIFEST_NAME = "MANIFEST.sha256.json"
+
+# 与 zipfile.ZIP_DEFLATED 默认一致的压缩级别
+COMPRESS_LEVEL = 6
+
+# 直接写入已压缩字节要用到 zipfile 的私有成员（_lock、_writecheck、_didModify、start_dir、fp），
+# 只在验证过的 CPython 版本（3.8 - 3.13）上使用；其它版本或缺少这些成员时改用公开接口 writestr 重新压缩
+RAW_COPY_VERSIONS = ((3, 8), (3, 13))
+RAW_COPY_ATTRS = ("_lock", "_writecheck", "_didModify", "start_dir", "fp", "filelist", "NameToInfo")
 
 def get_test_files() -> List[str]:
     """获取测试文件列表"""
@@ -22,57 +39,245 @@ def get_test_files() -> List[str]:
         # Python 测试文件
         "testing-ai/test_humaneval.py",
         "testing-ai/test_jailbreak.py",
-        "testing-web/test_SwagLabs.py"
+        "testing-web/test_SwagLabs.py",
+        "testing-web/web_timing.py",
+        "testing-web/catalog.json"
     ]
 
-def pack_tests(base_dir: Path, output_path: Path) -> bool:
+def glob_test_files(base_dir: Path, patterns: List[str]) -> List[str]:
+    """
+    按 glob 模式（支持 **）收集文件列表
+    
+    Args:
+        base_dir: 项目根目录
+        patterns: 相对于项目根目录的 glob 模式
+        
+    Returns:
+        去重并排序后的相对路径列表；某个模式没有匹配到文件时抛出 FileNotFoundError，
+        模式是绝对路径或通过 .. 跳出项目根目录时抛出 ValueError
+    """
+    for pattern in patterns:
+        if not pattern or Path(pattern).is_absolute() or Path(pattern).drive:
+            raise ValueError(f"模式必须是相对于项目根目录的路径: {pattern!r}")
+        if ".." in Path(pattern).parts:
+            raise ValueError(f"模式不能用 .. 跳出项目根目录: {pattern}")
+    files = set()
+    for pattern in patterns:
+        matched = [p for p in base_dir.glob(pattern) if p.is_file()]
+        if not matched:
+            raise FileNotFoundError(f"模式没有匹配到任何文件: {pattern}")
+        files.update(p.relative_to(base_dir).as_posix() for p in matched)
+    return sorted(files)
+
+def read_manifest(zipf: zipfile.ZipFile) -> Dict[str, Dict]:
+    """读取压缩包内的清单，没有清单时返回空字典"""
+    try:
+        return json.loads(zipf.read(MANIFEST_NAME).decode("utf-8"))["files"]
+    except (KeyError, ValueError):
+        return {}
+
+def _read_raw_member(fp, zinfo: zipfile.ZipInfo) -> bytes:
+    """读取成员已压缩的原始字节（跳过本地文件头，不解压）"""
+    fp.seek(zinfo.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"本地文件头损坏: {zinfo.filename}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    fp.seek(name_len + extra_len, os.SEEK_CUR)
+    return fp.read(zinfo.compress_size)
+
+def raw_copy_supported(zipf: zipfile.ZipFile) -> bool:
+    """当前解释器能否安全地直接写入已压缩的字节"""
+    low, high = RAW_COPY_VERSIONS
+    return (sys.implementation.name == "cpython"
+            and low <= sys.version_info[:2] <= high
+            and all(hasattr(zipf, attr) for attr in RAW_COPY_ATTRS))
+
+def _write_raw_member(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, raw: bytes):
+    """
+    把已压缩好的字节作为一个成员写入压缩包
+    
+    不支持直接写入时（见 RAW_COPY_VERSIONS）解压后用 writestr 重新压缩，结果相同但更慢。
+    """
+    if not raw_copy_supported(zipf):
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(raw, -15)
+        elif zinfo.compress_type == zipfile.ZIP_STORED:
+            data = raw
+        else:
+            raise zipfile.BadZipFile(f"不支持的压缩方式 {zinfo.compress_type}: {zinfo.filename}")
+        zipf.writestr(zinfo, data, compress_type=zinfo.compress_type,
+                      compresslevel=COMPRESS_LEVEL)
+        return
+    with zipf._lock:
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+        zinfo.header_offset = zipf.fp.tell()
+        zipf.fp.write(zinfo.FileHeader())
+        zipf.fp.write(raw)
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+def _prepare_member(file_path: Path, arcname: str,
+                    previous: Optional[Dict]) -> Tuple[str, str, Optional[zipfile.ZipInfo], Optional[bytes]]:
+    """
+    计算文件的 SHA-256，内容与上次打包一致时标记为复用，否则压缩（在线程池中执行）
+    
+    Returns:
+        (sha256, 状态, ZipInfo, 压缩后的字节)，复用时后两项为 None
+    """
+    data = file_path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if previous is not None and previous.get("sha256") == digest:
+        return digest, "reused", None, None
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    raw = compressor.compress(data) + compressor.flush()
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(raw)
+    zinfo.CRC = zlib.crc32(data)
+    return digest, "compressed", zinfo, raw
+
+def _copy_zinfo(old: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """复制旧成员的元数据（不带旧的 extra 字段和数据描述符标志）"""
+    zinfo = zipfile.ZipInfo(old.filename, old.date_time)
+    zinfo.compress_type = old.compress_type
+    zinfo.external_attr = old.external_attr
+    zinfo.create_system = old.create_system
+    zinfo.file_size = old.file_size
+    zinfo.compress_size = old.compress_size
+    zinfo.CRC = old.CRC
+    return zinfo
+
+def pack_tests(base_dir: Path, output_path: Path, incremental: bool = False,
+               patterns: Optional[List[str]] = None, jobs: Optional[int] = None) -> bool:
     """
     打包测试文件
     
+    压缩包内会附带 MANIFEST.sha256.json，记录每个成员的 SHA-256 和大小。
+    增量模式下，内容未变化的成员直接从旧压缩包复制已压缩的字节，
+    只有变化的文件会在线程池中并行压缩。
+    
     Args:
         base_dir: 项目根目录
         output_path: 输出ZIP文件的路径
+        incremental: 是否复用旧压缩包中未变化的成员
+        patterns: glob 模式列表，为 None 时使用 get_test_files()
+        jobs: 压缩线程数，默认为 CPU 核数
         
     Returns:
         是否成功
     """
-    test_files = get_test_files()
+    start = time.perf_counter()
+    try:
+        test_files = glob_test_files(base_dir, patterns) if patterns else get_test_files()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return False
     
-    # 如果输出文件已存在，删除它
-    if output_path.exists():
-        output_path.unlink()
-        print(f"✓ 删除已存在的文件: {output_path}")
+    # 先检查文件是否都存在，失败时不改动已有的压缩包
+    for file_path_str in test_files:
+        if not (base_dir / file_path_str).exists():
+            print(f"✗ 文件不存在: {file_path_str}", file=sys.stderr)
+            return False
     
-    # 创建ZIP文件
+    # 增量模式读取旧压缩包；两种模式都在最后用临时文件整体替换已存在的压缩包
+    old_zip = None
+    previous: Dict[str, Dict] = {}
+    if output_path.exists() and incremental:
+        try:
+            old_zip = zipfile.ZipFile(output_path, 'r')
+            previous = read_manifest(old_zip)
+        except zipfile.BadZipFile:
+            print(f"✗ 旧压缩包已损坏，改为全量打包: {output_path}", file=sys.stderr)
+    
+    # 先写到临时文件，成功后再替换，打包失败时旧压缩包保持不变
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
     try:
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path_str in test_files:
-                file_path = base_dir / file_path_str
-                
-                if file_path.exists():
-                    # 添加文件到ZIP，保持相对路径
-                    arcname = file_path_str.replace(os.sep, '/')
-                    zipf.write(file_path, arcname=arcname)
-                    print(f"✓ 已添加: {file_path_str}")
+        arcnames = [f.replace(os.sep, '/') for f in test_files]
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            prepared = list(pool.map(
+                lambda item: _prepare_member(
+                    base_dir / item[0], item[1],
+                    previous.get(item[1]) if old_zip and item[1] in old_zip.NameToInfo else None),
+                zip(test_files, arcnames)))
+        
+        manifest = {}
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for arcname, (digest, status, zinfo, raw) in zip(arcnames, prepared):
+                if status == "reused":
+                    old_info = old_zip.getinfo(arcname)
+                    zinfo = _copy_zinfo(old_info)
+                    raw = _read_raw_member(old_zip.fp, old_info)
+                    print(f"✓ 未变化，已复用: {arcname}")
                 else:
-                    print(f"✗ 文件不存在: {file_path_str}", file=sys.stderr)
-                    return False
+                    print(f"✓ 已添加: {arcname}")
+                # 添加文件到ZIP，保持相对路径
+                _write_raw_member(zipf, zinfo, raw)
+                manifest[arcname] = {"sha256": digest, "size": zinfo.file_size}
+            zipf.writestr(MANIFEST_NAME, json.dumps(
+                {"algorithm": "sha256", "files": manifest}, indent=2, ensure_ascii=False))
+        
+        if old_zip is not None:
+            old_zip.close()
+            old_zip = None
+        os.replace(tmp_path, output_path)
         
         # 获取ZIP文件信息
         file_size = output_path.stat().st_size
         file_size_kb = file_size / 1024
+        reused = sum(1 for _, status, _, _ in prepared if status == "reused")
         
         print(f"\n✓ 打包成功!")
         print(f"\nZIP文件信息:")
         print(f"  文件名: {output_path.name}")
         print(f"  大小: {file_size_kb:.2f} KB")
         print(f"  路径: {output_path.absolute()}")
+        print(f"  成员: {len(prepared)} 个（复用 {reused} 个，压缩 {len(prepared) - reused} 个）")
+        print(f"  耗时: {(time.perf_counter() - start) * 1000:.1f} ms")
         
         return True
         
     except Exception as e:
         print(f"✗ 打包失败: {e}", file=sys.stderr)
+        if tmp_path.exists():
+            tmp_path.unlink()
         return False
+    finally:
+        if old_zip is not None:
+            old_zip.close()
+
+def verify_archive(archive_path: Path) -> List[str]:
+    """
+    按清单校验压缩包内每个成员的 SHA-256（在内存中流式解压，不落盘）
+    
+    Args:
+        archive_path: ZIP文件的路径
+        
+    Returns:
+        问题列表，为空表示校验通过
+    """
+    problems = []
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        manifest = read_manifest(zipf)
+        if not manifest:
+            return [f"缺少清单文件: {MANIFEST_NAME}"]
+        members = {name for name in zipf.namelist() if name != MANIFEST_NAME}
+        for name in sorted(members - manifest.keys()):
+            problems.append(f"清单中没有该成员: {name}")
+        for name, entry in manifest.items():
+            if name not in members:
+                problems.append(f"缺少成员: {name}")
+                continue
+            digest = hashlib.sha256()
+            with zipf.open(name) as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            if digest.hexdigest() != entry["sha256"]:
+                problems.append(f"SHA-256 不匹配: {name}")
+    return problems
 
 def main():
     """主函数"""
@@ -84,6 +289,9 @@ def main():
   python pack_tests.py
   python pack_tests.py -o my_tests.zip
   python pack_tests.py --output ../test_files.zip
+  python pack_tests.py --incremental
+  python pack_tests.py -p "unittest-cpp/*.cc" -p "testing-*/test_*.py"
+  python pack_tests.py --verify test_files.zip
         '''
     )
     
@@ -99,8 +307,41 @@ def main():
         help='项目根目录 (默认: 当前目录)'
     )
     
+    parser.add_argument(
+        '-i', '--incremental',
+        action='store_true',
+        help='增量打包：复用旧压缩包中内容未变化的成员'
+    )
+    
+    parser.add_argument(
+        '-p', '--pattern',
+        action='append',
+        help='用 glob 模式（相对于项目根目录）指定文件，可重复使用 (默认: 内置文件列表)'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='并行压缩的线程数 (默认: CPU 核数)'
+    )
+    
+    parser.add_argument(
+        '--verify',
+        metavar='ZIP',
+        help='按清单校验ZIP文件的完整性，不进行打包'
+    )
+    
     args = parser.parse_args()
     
+    if args.verify:
+        problems = verify_archive(Path(args.verify))
+        for problem in problems:
+            print(f"✗ {problem}", file=sys.stderr)
+        if not problems:
+            print(f"✓ 校验通过: {args.verify}")
+        sys.exit(1 if problems else 0)
+    
     # 获取路径
     base_dir = Path(args.directory).resolve()
     output_path = Path(args.output).resolve()
@@ -114,7 +355,8 @@ def main():
     print()
     
     # 执行打包
-    success = pack_tests(base_dir, output_path)
+    success = pack_tests(base_dir, output_path, incremental=args.incremental,
+                         patterns=args.pattern, jobs=args.jobs)
     
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,257 @@
+"""
+离线批处理任务 - 大规模生成的 Batch 模式
+
+把 generate_code / call_llm 的请求写成 OpenAI Batch 格式的 JSONL 文件
+（每行 {"custom_id", "method", "url", "body"}），提交到批处理接口，轮询直到完成，
+再按 custom_id 把输出拼回各个任务，交给原有的验证和报告流程。
+
+后端:
+    openai  OpenAI 兼容的 /v1/batches 接口（files.create + batches.create）
+    local   本地替身：读取同一个 JSONL 文件，用线程池逐条调用 chat.completions，
+            按 Batch 输出格式写结果文件，用于不支持 Batch 接口的服务或离线调试；
+            请求经过 TokenBudget 限流（LLM_TPM_LIMIT / LLM_RPM_LIMIT）并记录补全长度历史
+
+使用方法:
+    python test_humaneval.py --batch local
+    python test_jailbreak.py --batch openai
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 批处理任务的终止状态
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_batch_file(requests: List[Tuple[str, Dict]], path: str) -> str:
+    """
+    把请求写成 Batch 输入文件
+
+    参数:
+        requests: [(custom_id, 请求体)]，请求体即 chat.completions.create 的参数
+        path: 输出 JSONL 路径
+
+    返回:
+        str: 文件路径
+    """
+    ids = [custom_id for custom_id, _ in requests]
+    if len(ids) != len(set(ids)):
+        raise ValueError("custom_id 必须唯一")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def parse_output_lines(text: str) -> Dict[str, Dict]:
+    """把 Batch 输出文件解析为 {custom_id: 记录}"""
+    records = {}
+    for line in text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            records[record["custom_id"]] = record
+    return records
+
+
+def choice_texts(record: Optional[Dict]) -> List[Optional[str]]:
+    """从一条输出记录中取出所有 choice 的文本，失败的请求返回 [None]"""
+    if not record or record.get("error") or not record.get("response"):
+        return [None]
+    response = record["response"]
+    if response.get("status_code") != 200:
+        return [None]
+    return [choice["message"]["content"] for choice in response["body"]["choices"]]
+
+
+class OpenAIBatchBackend:
+    """OpenAI 兼容的 /v1/batches 接口"""
+
+    # 服务端的批处理通常要几分钟到几小时
+    poll_interval = 5.0
+
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path: str, keys: Optional[Dict[str, str]] = None) -> str:
+        """提交输入文件；keys 只用于本地后端，服务端自己限流"""
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+        }
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        records = {}
+        # 成功和失败的请求分别在 output_file 和 error_file 中
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                records.update(parse_output_lines(self.client.files.content(file_id).text))
+        return records
+
+
+class LocalBatchBackend:
+    """
+    本地 Batch 替身
+
+    在后台线程池中处理输入文件，输出格式与 OpenAI Batch 相同，
+    因此轮询和结果拼接的代码与真实接口完全一致。
+
+    每个请求与同步调用一样经过 token_budget.prepare / record：按 TPM / RPM 限流，
+    并按 submit 传入的 keys（custom_id -> 历史记录的 key）更新补全长度历史。
+    """
+
+    # 请求在本进程中执行，完成得很快，不需要像服务端那样慢慢轮询
+    poll_interval = 0.2
+
+    def __init__(self, client, token_budget=None, max_workers=8):
+        self.client = client
+        self.token_budget = token_budget
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _call(self, keys: Dict[str, str], line: Dict) -> Dict:
+        record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": line["custom_id"]}
+        body = line["body"]
+        key = keys.get(line["custom_id"], "batch")
+        reserved = self.token_budget.prepare(body, key) if self.token_budget else 0
+        try:
+            response = self.client.chat.completions.create(**body)
+            if self.token_budget:
+                self.token_budget.record(key, response, reserved, body["max_tokens"])
+            record["response"] = {"status_code": 200, "body": response.model_dump()}
+            record["error"] = None
+        except Exception as e:
+            if self.token_budget:
+                self.token_budget.release(reserved)
+            record["response"] = None
+            record["error"] = {"code": type(e).__name__, "message": str(e)}
+        return record
+
+    def _run(self, batch_id: str, lines: List[Dict], keys: Dict[str, str]):
+        job = self._jobs[batch_id]
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for record in pool.map(functools.partial(self._call, keys), lines):
+                    with self._lock:
+                        job["records"][record["custom_id"]] = record
+                        job["completed" if record["error"] is None else "failed"] += 1
+            with open(job["output_path"], "w", encoding="utf-8") as f:
+                for record in job["records"].values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            status = "completed"
+        except Exception as e:
+            # 不更新状态的话 run_batch 会一直轮询到超时
+            job["error"] = f"{type(e).__name__}: {e}"
+            status = "failed"
+        with self._lock:
+            job["status"] = status
+
+    def submit(self, path: str, keys: Optional[Dict[str, str]] = None) -> str:
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        self._jobs[batch_id] = {
+            "status": "in_progress",
+            "records": {},
+            "completed": 0,
+            "failed": 0,
+            "total": len(lines),
+            "error": None,
+            "output_path": os.path.splitext(path)[0] + ".output.jsonl",
+        }
+        threading.Thread(target=self._run, args=(batch_id, lines, keys or {}),
+                         daemon=True).start()
+        return batch_id
+
+    def status(self, batch_id: str) -> Dict:
+        job = self._jobs[batch_id]
+        with self._lock:
+            return {key: job[key] for key in ("status", "completed", "failed", "total", "error")}
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        job = self._jobs[batch_id]
+        if job["status"] != "completed":
+            # 输出文件没有写出，返回已经完成的部分
+            with self._lock:
+                return dict(job["records"])
+        with open(job["output_path"], encoding="utf-8") as f:
+            return parse_output_lines(f.read())
+
+
+def create_backend(name: str, client, token_budget=None):
+    """按名称创建 Batch 后端；token_budget 用于本地后端的限流和补全长度历史"""
+    if name == "openai":
+        return OpenAIBatchBackend(client)
+    if name == "local":
+        return LocalBatchBackend(client, token_budget)
+    raise ValueError(f"未知的 Batch 后端: {name}")
+
+
+def run_batch(backend, requests: List[Tuple[str, Dict]], path: str,
+              keys: Optional[Dict[str, str]] = None, poll_interval: Optional[float] = None,
+              timeout=24 * 3600) -> Dict[str, Dict]:
+    """
+    写入 Batch 文件、提交、轮询直到完成，返回 {custom_id: 输出记录}
+
+    参数:
+        backend: OpenAIBatchBackend 或 LocalBatchBackend
+        requests: [(custom_id, 请求体)]
+        path: Batch 输入文件路径
+        keys: {custom_id: 补全长度历史的 key}，与同步调用的 key 一致
+        poll_interval: 轮询间隔（秒），默认使用后端的 poll_interval
+        timeout: 最长等待时间（秒）
+    """
+    poll_interval = poll_interval or backend.poll_interval
+    write_batch_file(requests, path)
+    batch_id = backend.submit(path, keys)
+    print(f"📦 已提交 Batch {batch_id}: {len(requests)} 个请求 ({path})")
+
+    deadline = time.time() + timeout
+    last = None
+    while True:
+        status = backend.status(batch_id)
+        progress = (status["status"], status["completed"], status["failed"])
+        if progress != last:
+            print(f"   ⏳ {status['status']}: {status['completed']}/{status['total']} 完成，"
+                  f"{status['failed']} 失败")
+            last = progress
+        if status["status"] in TERMINAL_STATUSES:
+            break
+        if time.time() > deadline:
+            raise TimeoutError(f"Batch {batch_id} 在 {timeout} 秒内没有完成")
+        time.sleep(poll_interval)
+
+    if status["status"] != "completed":
+        reason = f": {status['error']}" if status.get("error") else ""
+        print(f"❌ Batch {batch_id} 状态为 {status['status']}{reason}")
+    records = backend.results(batch_id)
+    missing = [custom_id for custom_id, _ in requests if custom_id not in records]
+    if missing:
+        print(f"⚠️ {len(missing)} 个请求没有输出，按生成失败处理")
+    return records
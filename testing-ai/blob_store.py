@@ -0,0 +1,202 @@
+"""
+内容寻址的文本存储 - 完整的 prompt / 响应 / 生成代码按 sha256 去重、压缩后存入 SQLite
+
+测试结果里只保留哈希（见 records.py），完整文本放在 reports/blobs.db，需要审计时再取出:
+- 相同内容只存一次（大量相同的拒绝回复、重复查询的同一个 prompt）
+- 安装了 zstandard 时用 zstd 压缩，否则用 zlib
+- 可以设置一个原始内容字典（例如全部 Jailbreak 策略模板），压缩时作为共享前缀，
+  模板在每个 prompt 中重复的部分几乎不占空间；字典本身也作为一个 blob 保存
+
+使用方法:
+    store = BlobStore()
+    digest = store.put(response)
+    text = store.get(digest)
+    python blob_store.py stats
+    python blob_store.py show <哈希前缀>
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_BLOB_DB = os.path.join("reports", "blobs.db")
+
+# 短于该长度的文本不压缩（压缩头的开销大于收益）
+MIN_COMPRESS_SIZE = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash        TEXT PRIMARY KEY,
+    codec       TEXT NOT NULL,
+    dictionary  TEXT,
+    size        INTEGER NOT NULL,
+    data        BLOB NOT NULL
+);
+"""
+
+
+class BlobStore:
+    """
+    SQLite 中的内容寻址文本存储（线程安全，首次使用时才打开数据库）
+
+    参数:
+        path: 数据库路径
+        level: 压缩级别
+    """
+
+    def __init__(self, path=DEFAULT_BLOB_DB, level=10):
+        self.path = path
+        self.level = level
+        self._conn = None
+        self._lock = threading.Lock()
+        # 已知哈希 -> 同一个 str 对象，重复内容的记录共享同一个哈希字符串
+        self._known = {}
+        self._dictionary = None
+        self._dictionaries = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def set_dictionary(self, text: str) -> str:
+        """设置压缩字典（之后写入的 blob 使用），返回字典的哈希"""
+        digest = self._store(text.encode("utf-8"), "raw", None)
+        self._dictionary = (digest, text.encode("utf-8"))
+        return digest
+
+    def _compress(self, raw: bytes):
+        """返回 (codec, 字典哈希, 数据)"""
+        if len(raw) < MIN_COMPRESS_SIZE:
+            return "raw", None, raw
+        dict_hash, zdict = self._dictionary or (None, None)
+        if zstandard is not None:
+            kwargs = {"dict_data": zstandard.ZstdCompressionDict(
+                zdict, dict_type=zstandard.DICT_TYPE_RAWCONTENT)} if zdict else {}
+            data = zstandard.ZstdCompressor(level=self.level, **kwargs).compress(raw)
+            codec = "zstd"
+        else:
+            compressor = zlib.compressobj(min(self.level, 9), zdict=zdict) if zdict \
+                else zlib.compressobj(min(self.level, 9))
+            data = compressor.compress(raw) + compressor.flush()
+            codec = "zlib"
+        if len(data) >= len(raw):
+            return "raw", None, raw
+        return codec, dict_hash, data
+
+    def _dictionary_bytes(self, digest: str) -> bytes:
+        if digest not in self._dictionaries:
+            row = self._db().execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(f"压缩字典不存在: {digest}")
+            self._dictionaries[digest] = bytes(row[0])
+        return self._dictionaries[digest]
+
+    def _store(self, raw: bytes, codec: Optional[str], dictionary: Optional[str]) -> str:
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            known = self._known.get(digest)
+            if known is not None:
+                return known
+            if codec is None:
+                codec, dictionary, data = self._compress(raw)
+            else:
+                data = raw
+            self._db().execute(
+                "INSERT OR IGNORE INTO blobs (hash, codec, dictionary, size, data) "
+                "VALUES (?, ?, ?, ?, ?)", (digest, codec, dictionary, len(raw), data))
+            self._conn.commit()
+            self._known[digest] = digest
+            return digest
+
+    def put(self, text: str) -> str:
+        """保存文本，返回 sha256 哈希；内容已存在时不重复写入"""
+        return self._store(text.encode("utf-8"), None, None)
+
+    def get(self, digest: str) -> str:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT codec, dictionary, data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(f"blob 不存在: {digest}")
+            codec, dictionary, data = row
+            zdict = self._dictionary_bytes(dictionary) if dictionary else None
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("读取 zstd 压缩的 blob 需要安装 zstandard 包")
+            kwargs = {"dict_data": zstandard.ZstdCompressionDict(
+                zdict, dict_type=zstandard.DICT_TYPE_RAWCONTENT)} if zdict else {}
+            raw = zstandard.ZstdDecompressor(**kwargs).decompress(data)
+        elif codec == "zlib":
+            decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+            raw = decompressor.decompress(data) + decompressor.flush()
+        else:
+            raw = bytes(data)
+        return raw.decode("utf-8")
+
+    def find(self, prefix: str) -> Optional[str]:
+        """按哈希前缀查找完整哈希"""
+        row = self._db().execute("SELECT hash FROM blobs WHERE hash LIKE ? LIMIT 2",
+                                 (prefix + "%",)).fetchall()
+        return row[0][0] if len(row) == 1 else None
+
+    def stats(self) -> Dict:
+        count, size, stored = self._db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+        ).fetchone()
+        return {"blobs": count, "size": size, "stored": stored}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='查看测试结果引用的完整文本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python blob_store.py stats
+  python blob_store.py show 3f2a9c
+        '''
+    )
+    parser.add_argument('--db', default=DEFAULT_BLOB_DB, help='数据库路径 (默认: reports/blobs.db)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='blob 数量与压缩率')
+    p = sub.add_parser('show', help='输出一个 blob 的完整文本')
+    p.add_argument('hash', help='哈希或唯一的哈希前缀')
+    args = parser.parse_args()
+
+    store = BlobStore(args.db)
+    if args.command == 'stats':
+        s = store.stats()
+        ratio = s["stored"] / s["size"] if s["size"] else 0.0
+        print(f"📦 {s['blobs']} 个 blob，原始 {s['size']} 字节，存储 {s['stored']} 字节"
+              f"（{ratio:.1%}）")
+    else:
+        digest = store.find(args.hash)
+        if digest is None:
+            print(f"❌ 没有找到唯一匹配 {args.hash} 的 blob")
+            return
+        print(store.get(digest))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
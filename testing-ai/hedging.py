@@ -0,0 +1,356 @@
+"""
+对冲请求 - 降低慢 LLM 调用造成的长尾延迟
+
+串行测试循环里，一个慢响应会卡住整个循环；即使并发，整次运行的结束时间也由 p99 的那次调用决定。
+HedgedClient 包装 chat.completions.create:
+- 按 (模型, max_tokens 档位) 记录最近完整返回的主请求延迟
+- 请求超过该档位延迟的分位数（默认 p95）还没有返回时，再发一个相同的请求（可以发往备用端点）；
+  慢响应的比例超过 1 - 分位数时（例如 10% 的请求卡住而分位数是 p95），分位数本身就落在慢尾上，
+  所以阈值另外不超过中位数的 max_ratio 倍（默认 3 倍）
+- 先成功返回的结果胜出，另一个请求被取消（asyncio 任务取消会关闭对应的 HTTP 连接）
+- 额外请求数不超过总请求数的 budget 比例（另加少量突发额度）；
+  配置了 TPM / RPM 限流时，只有不需要等待配额时才发对冲请求，请求结束后按实际用量结算预留的配额
+- 统计对冲率、对冲胜出次数和节省的时间: 对冲胜出时按 shadow_rate 的比例抽样，
+  不取消主请求而让它在后台跑完，用它的真实延迟减去对冲结果的延迟得到实测节省，
+  再按抽样的平均节省乘以对冲胜出次数估计总节省
+
+对外接口与 OpenAI 客户端相同（client.chat.completions.create(**body)），
+所以 generate_code、call_llm 和评判请求不需要修改；其它属性（files、batches 等）转发给同步客户端。
+
+配置（.env）:
+    LLM_HEDGE_BASE_URL   备用端点，不设置时对冲请求发往主端点
+    LLM_HEDGE_API_KEY    备用端点的 API 密钥（默认与主端点相同）
+    LLM_HEDGE_MODEL      备用端点上的模型名（默认与请求相同）
+
+使用方法:
+    python test_humaneval.py --hedge
+    python test_jailbreak.py --hedge --hedge-quantile 0.9 --hedge-budget 0.05
+    python mock_llm_server.py --slow-rate 0.05 --slow-delay 8   # 本地测试
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import profiling
+
+
+class LatencyTracker:
+    """按档位保存最近 window 次请求的延迟（线程安全）"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency: float):
+        with self._lock:
+            values = self._latencies.setdefault(key, [])
+            values.append(latency)
+            del values[:-self.window]
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._latencies.get(key, []))
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._latencies.get(key, []))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **body):
+        return self._owner.create(**body)
+
+
+class _Chat:
+    def __init__(self, owner):
+        self.completions = _Completions(owner)
+
+
+class HedgedClient:
+    """
+    带对冲请求的 chat.completions 客户端
+
+    参数:
+        primary: 主端点的异步客户端（AsyncOpenAI 或接口相同的对象）
+        secondary: 备用端点的异步客户端，None 时对冲请求也发往主端点
+        fallback: 同步客户端，HedgedClient 没有的属性（files、batches 等）转发给它
+        quantile: 触发对冲的延迟分位数
+        max_ratio: 对冲阈值不超过档位延迟中位数的倍数，None 表示不限制
+        min_samples: 档位内少于该样本数时使用 initial_delay
+        initial_delay: 没有足够历史时的对冲等待时间（秒）
+        budget: 对冲请求数占总请求数的上限比例
+        burst: 预算之外允许的少量突发对冲请求
+        limiter: TokenRateLimiter，对冲请求只在不需要等待配额时发出
+        counter: TokenCounter，估计对冲请求占用的 token 数
+        secondary_model: 备用端点上使用的模型名
+        shadow_rate: 对冲胜出时不取消主请求、用于实测节省时间的抽样比例
+    """
+
+    def __init__(self, primary, secondary=None, fallback=None, quantile=0.95, max_ratio=3.0,
+                 min_samples=20, initial_delay=10.0, budget=0.1, burst=3, limiter=None,
+                 counter=None, secondary_model: Optional[str] = None, shadow_rate=0.2,
+                 window=200, seed=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.fallback = fallback
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.budget = budget
+        self.burst = burst
+        self.limiter = limiter
+        self.counter = counter
+        self.secondary_model = secondary_model
+        self.shadow_rate = shadow_rate
+        self.random = random.Random(seed)
+        # 事件循环只持有任务的弱引用，后台跑完的主请求要在这里保留强引用
+        self._shadows = set()
+        # 只记录完整返回的主请求（被取消的主请求延迟未知，不参与阈值）
+        self.tracker = LatencyTracker(window)
+        self.chat = _Chat(self)
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "skipped_budget": 0,
+                      "skipped_rate_limit": 0, "shadow_samples": 0, "shadow_saved": 0.0}
+        self._latencies: List[float] = []
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="hedging-loop",
+                                             daemon=True)
+        self._loop_thread.start()
+
+    def __getattr__(self, name):
+        if name != "fallback" and self.fallback is not None:
+            return getattr(self.fallback, name)
+        raise AttributeError(name)
+
+    # ---------- 阈值与预算 ----------
+
+    @staticmethod
+    def bucket(body: Dict) -> str:
+        """延迟主要取决于模型和补全长度，max_tokens 按 2 的幂分档"""
+        max_tokens = body.get("max_tokens") or 0
+        return f"{body.get('model')}:{max(1, int(max_tokens)).bit_length()}"
+
+    def threshold(self, key: str) -> float:
+        if self.tracker.count(key) < self.min_samples:
+            return self.initial_delay
+        delay = self.tracker.quantile(key, self.quantile)
+        if self.max_ratio is not None:
+            delay = min(delay, self.max_ratio * self.tracker.quantile(key, 0.5))
+        return delay
+
+    def _allow_hedge(self, body: Dict) -> Optional[int]:
+        """
+        检查预算并预留限流配额
+
+        返回:
+            Optional[int]: 预留的 token 数（没有限流器时为 0），不允许对冲时返回 None
+        """
+        with self._lock:
+            if self.stats["hedged"] >= self.budget * self.stats["requests"] + self.burst:
+                self.stats["skipped_budget"] += 1
+                return None
+        tokens = 0
+        if self.limiter is not None:
+            tokens = (body.get("max_tokens") or 0) * body.get("n", 1)
+            if self.counter is not None:
+                tokens += self.counter.count_messages(body["messages"])
+            if not self.limiter.try_acquire(tokens):
+                with self._lock:
+                    self.stats["skipped_rate_limit"] += 1
+                return None
+        with self._lock:
+            self.stats["hedged"] += 1
+        return tokens
+
+    @staticmethod
+    def _used_tokens(task) -> int:
+        """已完成请求的实际 token 用量；被取消、出错或没有 usage 时为 0"""
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            return 0
+        usage = getattr(task.result(), "usage", None)
+        return usage.total_tokens if usage is not None else 0
+
+    def _settle(self, reserved: int, actual: int):
+        if self.limiter is not None:
+            self.limiter.settle(reserved, actual)
+
+    # ---------- 请求 ----------
+
+    def create(self, **body):
+        """同步接口: 在后台事件循环中执行对冲请求并等待结果"""
+        # --profile 时事件循环线程的采样记入调用方所在的 generate / judge 阶段
+        with profiling.waiting_on(self._loop_thread.ident):
+            return asyncio.run_coroutine_threadsafe(self._create(body), self._loop).result()
+
+    def _hedge_request(self, body: Dict):
+        if self.secondary is None:
+            return self.primary.chat.completions.create(**body)
+        if self.secondary_model:
+            body = dict(body, model=self.secondary_model)
+        return self.secondary.chat.completions.create(**body)
+
+    async def _create(self, body: Dict):
+        key = self.bucket(body)
+        delay = self.threshold(key)
+        start = time.perf_counter()
+        with self._lock:
+            self.stats["requests"] += 1
+
+        primary = asyncio.ensure_future(self.primary.chat.completions.create(**body))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        reserved = None if done else self._allow_hedge(body)
+        if reserved is not None:
+            hedge = asyncio.ensure_future(self._hedge_request(body))
+            winner = None
+            try:
+                winner = await self._race(key, start, primary, hedge)
+                return winner.result()
+            finally:
+                # 胜出的对冲结果由调用方 token_budget.record 记账，这里只退还预留；
+                # 落败但已完成的对冲按实际用量结算，被取消或出错的按 0 结算
+                self._settle(reserved, 0 if winner is hedge else self._used_tokens(hedge))
+
+        try:
+            response = await primary
+            self.tracker.record(key, time.perf_counter() - start)
+            return response
+        finally:
+            self._finish(time.perf_counter() - start)
+
+    async def _race(self, key: str, start: float, primary, hedge):
+        """等待主请求和对冲请求中先成功的一个并返回该任务，两个都失败时抛出最后的异常"""
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    elapsed = time.perf_counter() - start
+                    shadow = task is hedge and primary in pending \
+                        and self.random.random() < self.shadow_rate
+                    if shadow:
+                        # 抽样: 主请求在后台跑完，实测它本来要多久
+                        self._shadows.add(primary)
+                        pending.discard(primary)
+                        primary.add_done_callback(
+                            lambda t: self._record_shadow(key, t, time.perf_counter() - start, elapsed))
+                    if task is hedge:
+                        with self._lock:
+                            self.stats["hedge_wins"] += 1
+                    else:
+                        self.tracker.record(key, elapsed)
+                    self._finish(elapsed)
+                    return task
+            raise error
+        finally:
+            for other in pending:
+                other.cancel()
+
+    def _record_shadow(self, key: str, task, primary_latency: float, hedged_latency: float):
+        self._shadows.discard(task)
+        # 调用方只为胜出的对冲结果记账，跑完的影子主请求的实际用量另外计入限流
+        self._settle(0, self._used_tokens(task))
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.tracker.record(key, primary_latency)
+        with self._lock:
+            self.stats["shadow_samples"] += 1
+            self.stats["shadow_saved"] += primary_latency - hedged_latency
+
+    def _finish(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    # ---------- 报告 ----------
+
+    def summary(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+
+        def pct(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        # 抽样的平均实测节省 × 对冲胜出次数；还没有抽样时为 None
+        stats["saved_seconds"] = (stats["shadow_saved"] / stats["shadow_samples"] * stats["hedge_wins"]
+                                  if stats["shadow_samples"] else None)
+        stats.update(p50=pct(0.5), p95=pct(0.95), p99=pct(0.99))
+        return stats
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"🪁 对冲请求: {s['requests']} 个请求，对冲 {s['hedged']} 次（{s['hedge_rate']:.1%}），"
+              f"对冲胜出 {s['hedge_wins']} 次，预算跳过 {s['skipped_budget']} 次，"
+              f"限流跳过 {s['skipped_rate_limit']} 次")
+        saved = (f"节省约 {s['saved_seconds']:.1f}s（{s['shadow_samples']} 次抽样实测）"
+                 if s["saved_seconds"] is not None else "还没有节省时间的抽样")
+        print(f"   延迟 p50 {s['p50']:.2f}s / p95 {s['p95']:.2f}s / p99 {s['p99']:.2f}s，{saved}")
+
+
+# ========================================
+# 入口脚本使用的辅助函数
+# ========================================
+
+def add_hedge_arguments(parser):
+    """给入口脚本的 argparse 加上 --hedge 相关参数"""
+    parser.add_argument('--hedge', action='store_true',
+                        help='慢请求超过延迟分位数时发出对冲请求，先返回的结果胜出')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95,
+                        help='触发对冲的延迟分位数 (默认: 0.95)')
+    parser.add_argument('--hedge-max-ratio', type=float, default=3.0,
+                        help='对冲阈值不超过延迟中位数的倍数，慢响应较多时防止分位数落在慢尾上 (默认: 3)')
+    parser.add_argument('--hedge-budget', type=float, default=0.1,
+                        help='对冲请求占总请求数的上限比例 (默认: 0.1)')
+    parser.add_argument('--hedge-initial-delay', type=float, default=10.0,
+                        help='延迟历史不足时的对冲等待时间，秒 (默认: 10)')
+
+
+def create_hedged_client(fallback, quantile=0.95, budget=0.1, initial_delay=10.0,
+                         token_budget=None, max_ratio=3.0) -> HedgedClient:
+    """按环境变量（SILICONFLOW_* 和 LLM_HEDGE_*）创建 HedgedClient"""
+    from openai import AsyncOpenAI
+
+    api_key = os.getenv("SILICONFLOW_API_KEY")
+    primary = AsyncOpenAI(api_key=api_key, base_url=os.getenv("SILICONFLOW_BASE_URL"))
+    secondary = None
+    hedge_url = os.getenv("LLM_HEDGE_BASE_URL")
+    if hedge_url:
+        secondary = AsyncOpenAI(api_key=os.getenv("LLM_HEDGE_API_KEY") or api_key, base_url=hedge_url)
+    print(f"🪁 已启用对冲请求: p{quantile * 100:g} 触发，预算 {budget:.0%}"
+          f"{'，备用端点 ' + hedge_url if secondary else ''}")
+    return HedgedClient(
+        primary,
+        secondary=secondary,
+        fallback=fallback,
+        quantile=quantile,
+        max_ratio=max_ratio,
+        initial_delay=initial_delay,
+        budget=budget,
+        limiter=token_budget.limiter if token_budget else None,
+        counter=token_budget.counter if token_budget else None,
+        secondary_model=os.getenv("LLM_HEDGE_MODEL"),
+    )
+
+
+def hedged_client_from_args(args, fallback, token_budget=None) -> Optional[HedgedClient]:
+    """按 --hedge 参数创建 HedgedClient，没有 --hedge 时返回 None"""
+    if not getattr(args, "hedge", False):
+        return None
+    return create_hedged_client(fallback, args.hedge_quantile, args.hedge_budget,
+                                args.hedge_initial_delay, token_budget, args.hedge_max_ratio)
@@ -0,0 +1,363 @@
+"""
+HumanEval+ (EvalPlus) 扩展测试集 - 题内测试分片并行验证
+
+HumanEval 的 check() 只有几条 assert，整体执行一次即可；HumanEval+ 每题有
+几百到上千个输入。这里把一道题的测试输入拆成多个分片，在进程池中并行执行：
+- 任一分片出现失败就设置本次验证的取消事件，其它分片在下一个输入前退出，未开始的分片直接取消；
+  每次 verify() 占用一个独立的事件，多个线程可以同时验证而互不取消
+- 每个输入单独计时（并有单输入超时），报告最慢的输入
+- 期望输出来自数据集中的 results，缺失时用 canonical_solution 在同一进程中计算
+
+支持两种数据来源:
+    Hugging Face 的 evalplus/humanevalplus：输入和期望输出写在 check() 里，用 AST 提取
+    EvalPlus 发布的 HumanEvalPlus.jsonl(.gz)：直接带 base_input / plus_input / atol
+
+使用方法:
+    python test_humaneval.py --plus --shard-workers 8
+    python test_humaneval.py --plus --plus-file HumanEvalPlus.jsonl.gz
+"""
+
+import ast
+import copy
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 每个分片至少包含的输入数，输入太少时不值得分片
+MIN_SHARD_SIZE = 16
+
+# 报告中列出的最慢输入数
+SLOWEST_INPUTS = 5
+
+# 同时进行的 verify() 调用上限（每个调用占用一个取消事件）
+MAX_CONCURRENT_VERIFY = 16
+
+
+# ========================================
+# 加载
+# ========================================
+
+def extract_test_inputs(test_code: str) -> Optional[Dict]:
+    """
+    从 EvalPlus 风格的 check() 中提取测试输入
+
+    check() 的形式为:
+        def check(candidate):
+            inputs = [...]
+            results = [...]
+            for i, (inp, exp) in enumerate(zip(inputs, results)):
+                assertion(candidate(*inp), exp, 0)
+
+    返回:
+        Dict: {"inputs", "results", "atol"}，不是这种形式（例如原版 HumanEval）时返回 None
+    """
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return None
+    check = next((node for node in tree.body
+                  if isinstance(node, ast.FunctionDef) and node.name == "check"), None)
+    if check is None:
+        return None
+
+    values, atol = {}, 0.0
+    for node in ast.walk(check):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in ("inputs", "results"):
+            values[node.targets[0].id] = _literal(node.value)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id == "assertion" and len(node.args) >= 3:
+            value = _literal(node.args[2])
+            if isinstance(value, (int, float)):
+                atol = float(value)
+    if values.get("inputs") is None:
+        return None
+    return {"inputs": values["inputs"], "results": values.get("results"), "atol": atol}
+
+
+def _literal(node: ast.AST) -> Any:
+    """求值字面量；包含 float('inf') 之类表达式时在受限命名空间中求值"""
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        expression = ast.Expression(body=node)
+        return eval(compile(expression, "<test>", "eval"),
+                    {"__builtins__": {"float": float, "int": int, "complex": complex},
+                     "math": math, "inf": math.inf, "nan": math.nan})
+
+
+def load_humaneval_plus(num_problems=10, path=None) -> List[Dict]:
+    """
+    加载 HumanEval+ 的前 num_problems 个问题
+
+    参数:
+        path: EvalPlus 发布的 jsonl / jsonl.gz 文件，None 时从 Hugging Face 加载
+
+    返回:
+        List[Dict]: 与 load_humaneval_subset 相同的字段，另有 plus_inputs / plus_results / atol
+    """
+    print(f"📥 加载 HumanEval+ 数据集的前 {num_problems} 个问题...")
+    if path:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()][:num_problems]
+    else:
+        from datasets import load_dataset
+        dataset = load_dataset("evalplus/humanevalplus", split="test")
+        rows = [dataset[i] for i in range(min(num_problems, len(dataset)))]
+
+    problems = []
+    for row in rows:
+        if "base_input" in row:
+            extracted = {"inputs": row["base_input"] + row.get("plus_input", []),
+                         "results": None, "atol": row.get("atol") or 0.0}
+        else:
+            extracted = extract_test_inputs(row["test"])
+        problems.append({
+            "task_id": row["task_id"],
+            "prompt": row["prompt"],
+            "entry_point": row["entry_point"],
+            "test": row.get("test", ""),
+            "canonical_solution": row["canonical_solution"],
+            "plus_inputs": extracted["inputs"] if extracted else None,
+            "plus_results": extracted["results"] if extracted else None,
+            "atol": extracted["atol"] if extracted else 0.0,
+        })
+    sizes = [len(p["plus_inputs"]) for p in problems if p["plus_inputs"]]
+    print(f"✅ 成功加载 {len(problems)} 个问题，测试输入共 {sum(sizes)} 个"
+          f"（单题最多 {max(sizes, default=0)} 个）")
+    return problems
+
+
+# ========================================
+# worker
+# ========================================
+
+_cancel_events = []
+
+
+def _init_worker(events):
+    global _cancel_events
+    _cancel_events = events
+
+
+class InputTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise InputTimeout()
+
+
+def _load_function(code: str, entry_point: str) -> Callable:
+    from typing import Any as _Any, Callable as _Callable, Dict as _Dict, List as _List, \
+        Tuple as _Tuple
+    namespace = {"__builtins__": __builtins__, "List": _List, "Dict": _Dict, "Tuple": _Tuple,
+                 "Any": _Any, "Callable": _Callable}
+    exec(code, namespace)
+    if entry_point not in namespace:
+        raise NameError(f"Function '{entry_point}' not defined")
+    return namespace[entry_point]
+
+
+def outputs_match(out: Any, exp: Any, atol: float) -> bool:
+    """与 EvalPlus 一致: 浮点数（及其序列）按 atol / 相对误差比较，其余精确比较"""
+    def is_floats(x):
+        if isinstance(x, float):
+            return True
+        if isinstance(x, (list, tuple)) and x:
+            return all(isinstance(i, float) for i in x)
+        return False
+
+    if atol == 0 and is_floats(exp):
+        atol = 1e-6
+    if out != exp and atol != 0 and is_floats(exp) and is_floats(out):
+        outs = out if isinstance(out, (list, tuple)) else [out]
+        exps = exp if isinstance(exp, (list, tuple)) else [exp]
+        return len(outs) == len(exps) and all(
+            math.isclose(o, e, rel_tol=1e-7, abs_tol=atol) for o, e in zip(outs, exps))
+    return out == exp
+
+
+def run_shard(code: str, entry_point: str, canonical: str, start: int, inputs: List,
+              expected: Optional[List], atol: float, timeout: float,
+              slot: Optional[int] = None) -> Dict:
+    """
+    在 worker 进程中执行一个分片（进程池 worker 入口）
+
+    slot 是本次 verify() 的取消事件序号，只响应同一次验证中其它分片的失败。
+
+    没有预先计算的期望输出时用标准解现场计算；标准解在某个输入上出错或超时，
+    说明测试输入本身有问题，记入 reference_errors 并跳过该输入，不算候选代码失败。
+
+    返回:
+        Dict: {"failed_index", "error", "timings": [(输入序号, 秒)], "cancelled",
+               "reference_errors": [(输入序号, 错误信息)]}
+    """
+    result = {"failed_index": None, "error": None, "timings": [], "cancelled": False,
+              "reference_errors": []}
+    cancel_event = _cancel_events[slot] if slot is not None else None
+    try:
+        candidate = _load_function(code, entry_point)
+        reference = _load_function(canonical, entry_point) if expected is None else None
+    except Exception as e:
+        result.update(failed_index=start, error=f"Load error: {type(e).__name__}: {e}")
+        return result
+
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    try:
+        for offset, inp in enumerate(inputs):
+            if cancel_event is not None and cancel_event.is_set():
+                result["cancelled"] = True
+                break
+            index = start + offset
+            if expected is not None:
+                exp = expected[offset]
+            else:
+                try:
+                    signal.setitimer(signal.ITIMER_REAL, timeout)
+                    exp = reference(*copy.deepcopy(inp))
+                except InputTimeout:
+                    result["reference_errors"].append(
+                        (index, f"Reference timeout after {timeout}s on input #{index}"))
+                    continue
+                except Exception as e:
+                    result["reference_errors"].append(
+                        (index, f"Reference error on input #{index}: {type(e).__name__}: {e}"))
+                    continue
+                finally:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            begin = time.perf_counter()
+            try:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+                out = candidate(*copy.deepcopy(inp))
+            except InputTimeout:
+                result.update(failed_index=index, error=f"Timeout after {timeout}s on input #{index}")
+            except Exception as e:
+                result.update(failed_index=index,
+                              error=f"Runtime error on input #{index}: {type(e).__name__}: {e}")
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            result["timings"].append((index, time.perf_counter() - begin))
+            if result["failed_index"] is None and not outputs_match(out, exp, atol):
+                result.update(failed_index=index,
+                              error=f"Assertion failed on input #{index}: {out!r} != {exp!r}"[:500])
+            if result["failed_index"] is not None:
+                if cancel_event is not None:
+                    cancel_event.set()
+                break
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+    return result
+
+
+# ========================================
+# 分片验证器
+# ========================================
+
+class ShardedVerifier:
+    """
+    把一道题的测试输入分片到进程池并行执行，首个失败时取消其它分片
+
+    verify() 可以在多个线程中同时调用：每次调用占用一个取消事件，
+    超过 MAX_CONCURRENT_VERIFY 个并发调用时等待空闲的事件。
+
+    参数:
+        workers: 进程数（默认 CPU 核数）
+        timeout_per_input: 单个输入的超时时间（秒）
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout_per_input=5.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout_per_input = timeout_per_input
+        self._events = [multiprocessing.Event() for _ in range(MAX_CONCURRENT_VERIFY)]
+        self._free_slots = queue.Queue()
+        for slot in range(MAX_CONCURRENT_VERIFY):
+            self._free_slots.put(slot)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self._events,))
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _shards(self, count: int) -> List[Tuple[int, int]]:
+        n_shards = max(1, min(self.workers * 2, count // MIN_SHARD_SIZE))
+        size = math.ceil(count / n_shards)
+        return [(i, min(i + size, count)) for i in range(0, count, size)]
+
+    def verify(self, code: Optional[str], problem: Dict) -> Dict:
+        """
+        验证一份生成的代码
+
+        返回:
+            Dict: {"passed", "error", "inputs", "executed", "elapsed", "slowest", "cancelled_shards",
+                   "reference_errors"}
+            reference_errors 是标准解出错而跳过的输入，不影响 passed；
+            没有失败但有输入未执行（分片被取消或异常退出）时不算通过
+        """
+        inputs = problem["plus_inputs"]
+        report = {"passed": False, "error": None, "inputs": len(inputs), "executed": 0,
+                  "elapsed": 0.0, "slowest": [], "cancelled_shards": 0, "reference_errors": []}
+        if code is None:
+            report["error"] = "Code generation failed"
+            return report
+
+        slot = self._free_slots.get()
+        try:
+            return self._verify(code, problem, slot, report)
+        finally:
+            self._free_slots.put(slot)
+
+    def _verify(self, code: str, problem: Dict, slot: int, report: Dict) -> Dict:
+        inputs = problem["plus_inputs"]
+        start = time.perf_counter()
+        self._events[slot].clear()
+        expected = problem.get("plus_results")
+        canonical = problem["prompt"] + problem["canonical_solution"]
+        futures = {
+            self._pool.submit(run_shard, code, problem["entry_point"], canonical, lo,
+                              inputs[lo:hi], expected[lo:hi] if expected is not None else None,
+                              problem.get("atol", 0.0), self.timeout_per_input, slot): lo
+            for lo, hi in self._shards(len(inputs))
+        }
+
+        failures, timings = [], []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                shard = future.result()
+                timings.extend(shard["timings"])
+                report["reference_errors"].extend(shard["reference_errors"])
+                report["cancelled_shards"] += int(shard["cancelled"])
+                if shard["failed_index"] is not None:
+                    failures.append(shard)
+            if failures:
+                # 取消尚未开始的分片；已开始的分片看到事件后会在下一个输入前退出
+                for future in pending:
+                    if future.cancel():
+                        report["cancelled_shards"] += 1
+
+        report["executed"] = len(timings)
+        report["elapsed"] = time.perf_counter() - start
+        report["slowest"] = sorted(timings, key=lambda t: -t[1])[:SLOWEST_INPUTS]
+        if failures:
+            # 多个分片同时失败时报告序号最小的输入
+            first = min(failures, key=lambda s: s["failed_index"])
+            report["error"] = first["error"]
+        elif report["executed"] + len(report["reference_errors"]) < len(inputs):
+            report["error"] = (f"Incomplete verification: only {report['executed']}/{len(inputs)} "
+                               f"inputs executed")
+        else:
+            report["passed"] = True
+        return report
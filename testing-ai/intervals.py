@@ -0,0 +1,28 @@
+"""
+置信区间工具 - 自适应评估（test_humaneval / test_jailbreak）共用
+
+正态分位数使用标准库 statistics.NormalDist，任意置信水平都按精确分位数计算。
+"""
+
+import math
+from statistics import NormalDist
+from typing import Tuple
+
+
+def z_value(confidence=0.95) -> float:
+    """双侧置信水平对应的标准正态分位数，例如 0.95 -> 1.96"""
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence 必须在 (0, 1) 之间: {confidence}")
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(successes, n, confidence=0.95) -> Tuple[float, float]:
+    """成功率的 Wilson 置信区间，返回 (下界, 上界)；没有样本时返回 (0, 1)"""
+    if n == 0:
+        return 0.0, 1.0
+    z = z_value(confidence)
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
@@ -0,0 +1,154 @@
+"""
+本地 Mock LLM 服务 - OpenAI 兼容的 /v1/chat/completions，可注入慢响应
+
+用于在不消耗 API 配额的情况下测试对冲请求（hedging.py）等延迟相关的逻辑:
+每个请求先等待 latency ± jitter 秒，其中 slow-rate 比例的请求改为等待 slow-delay 秒。
+客户端断开连接（例如对冲请求胜出后主请求被取消）时，服务端会记录一次 cancelled。
+
+使用方法:
+    python mock_llm_server.py --port 8765 --latency 0.2 --slow-rate 0.05 --slow-delay 8
+    SILICONFLOW_BASE_URL=http://127.0.0.1:8765/v1 python test_jailbreak.py --hedge
+
+自动化测试（在进程内启动服务，检查对冲率、预算上限和服务端观察到的取消）:
+    python -m unittest test_hedging -v
+"""
+
+import argparse
+import json
+import random
+import select
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "```python\n    return None\n```"
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """带延迟注入的 Mock 服务，stats 记录请求数、慢请求数和被取消的请求数"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.2, jitter=0.05, slow_rate=0.0, slow_delay=5.0,
+                 reply=DEFAULT_REPLY, seed=None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "slow": 0, "cancelled": 0}
+        self.lock = threading.Lock()
+
+    def pick_delay(self) -> float:
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.random.random() < self.slow_rate:
+                self.stats["slow"] += 1
+                return self.slow_delay
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def record_cancel(self):
+        with self.lock:
+            self.stats["cancelled"] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data: dict):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _client_gone(self, timeout: float) -> bool:
+        """等待 timeout 秒；期间客户端关闭连接则返回 True"""
+        readable, _, _ = select.select([self.connection], [], [], timeout)
+        return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        server = self.server
+        deadline = time.monotonic() + server.pick_delay()
+        while (remaining := deadline - time.monotonic()) > 0:
+            if self._client_gone(remaining):
+                server.record_cancel()
+                self.close_connection = True
+                return
+
+        n = body.get("n") or 1
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in body.get("messages", []))
+        completion_tokens = max(1, len(server.reply) // 4)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": i,
+                "message": {"role": "assistant", "content": server.reply},
+                "finish_reason": "stop",
+            } for i in range(n)],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens * n,
+                "total_tokens": prompt_tokens + completion_tokens * n,
+            },
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='OpenAI 兼容的本地 Mock LLM 服务，可注入慢响应',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+示例:
+  python mock_llm_server.py
+  python mock_llm_server.py --latency 0.5 --slow-rate 0.05 --slow-delay 10
+  python mock_llm_server.py --port 8766 --reply "I cannot help with that."
+        '''
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口 (默认: 8765)')
+    parser.add_argument('--latency', type=float, default=0.2, help='正常响应的延迟，秒 (默认: 0.2)')
+    parser.add_argument('--jitter', type=float, default=0.05, help='延迟的随机抖动，秒 (默认: 0.05)')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='慢响应的比例 (默认: 0)')
+    parser.add_argument('--slow-delay', type=float, default=5.0, help='慢响应的延迟，秒 (默认: 5)')
+    parser.add_argument('--reply', default=DEFAULT_REPLY, help='固定的响应内容')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    args = parser.parse_args()
+
+    server = MockLLMServer((args.host, args.port), args.latency, args.jitter, args.slow_rate,
+                           args.slow_delay, args.reply, args.seed)
+    print(f"🧪 Mock LLM 服务: http://{args.host}:{args.port}/v1 "
+          f"（延迟 {args.latency}s，慢响应 {args.slow_rate:.0%} × {args.slow_delay}s）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+按阶段的 CPU / 内存剖析 - 各测试脚本的 --profile 模式
+
+把运行划分为 load / generate / verify / judge / report 等阶段（代码中用 stage("名称") 标注），
+分别统计每个阶段的调用次数、墙钟时间、CPU 时间和内存分配:
+
+    sample    （默认）后台线程定期采样各线程的调用栈，按当前阶段写出 folded 格式，
+              可直接交给 flamegraph.pl / speedscope / inferno 生成火焰图；开销很低，可以在正式测试中开启
+    cprofile  每个阶段一个 cProfile，写出 .pstats（snakeviz / flameprof / python -m pstats）
+              和按累计时间排序的函数表；结果精确但开销较大
+
+内存用 tracemalloc 抽样统计: tracemalloc 会让分配密集的代码慢一个数量级，所以只在抽样窗口内开启 ——
+每个阶段最多每 memory_interval 秒抽一次，从进入阶段开始追踪，最长 memory_window 秒或到阶段结束，
+记录窗口内新分配且仍存活的内存、峰值和分配最多的代码行。
+窗口期间其它线程的分配也会计入，多线程运行时各阶段的内存数据只能作为参考。
+
+输出目录 reports/profile/<脚本>-<时间>/:
+    summary.txt / summary.json   各阶段汇总
+    <阶段>.folded                采样模式的火焰图输入
+    <阶段>.pstats / <阶段>.txt    cProfile 模式的结果
+    <阶段>.alloc.txt             抽样窗口中分配最多的代码行（各窗口累加）
+
+未标注阶段的主线程时间记入 other。
+代替调用方执行请求的后台线程（例如 --hedge 的 hedging-loop 事件循环）用 waiting_on 登记，
+它的采样记入正在等待它的调用方线程所在的阶段；同时有多个调用方等待时记入最早登记的那个。
+
+使用方法:
+    python test_humaneval.py --profile
+    python test_jailbreak.py --profile cprofile
+    flamegraph.pl reports/profile/humaneval-20250101-120000/verify.folded > verify.svg
+"""
+
+import atexit
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+DEFAULT_PROFILE_DIR = os.path.join("reports", "profile")
+
+# 当前启用的剖析器，None 时 stage() 不做任何事
+_active = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """标注一个阶段: with stage("verify"): ...；没有启用剖析时开销可以忽略"""
+    return _active.stage(name) if _active is not None else _NULL_STAGE
+
+
+def waiting_on(thread_id: Optional[int]):
+    """标注当前线程正在等待 thread_id 线程代为执行: with waiting_on(loop_thread.ident): ..."""
+    return _active.waiting_on(thread_id) if _active is not None else _NULL_STAGE
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StageProfiler:
+    """
+    按阶段的剖析器
+
+    参数:
+        output_dir: 输出目录
+        mode: "sample" 或 "cprofile"
+        interval: 采样间隔（秒）
+        memory_frames: tracemalloc 记录的调用栈层数，0 表示不统计内存
+        memory_interval: 同一阶段两次内存抽样之间的最小间隔（秒）
+        memory_window: 一次内存抽样的最长时间（秒）
+        top: 输出表格的行数
+    """
+
+    def __init__(self, output_dir: str, mode="sample", interval=0.01, memory_frames=1,
+                 memory_interval=10.0, memory_window=0.2, top=25):
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"未知的剖析模式: {mode}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.memory_interval = memory_interval
+        self.memory_window = memory_window
+        self.top = top
+        self._lock = threading.Lock()
+        self._stacks = {}       # 线程 id -> [(阶段, cProfile.Profile 或 None)]
+        self._waiters = {}      # 代为执行的线程 id -> [等待它的调用方线程 id]
+        self._stats = {}        # 阶段 -> 汇总
+        self._folded = {}       # 阶段 -> {折叠调用栈: 采样数}
+        self._profiles = {}     # (阶段, 线程 id) -> cProfile.Profile
+        self._allocs = {}       # 阶段 -> {代码行: [分配字节, 分配次数]}
+        self._last_memory = {}  # 阶段 -> 上次内存抽样时间
+        self._window = None     # 正在进行的内存抽样窗口
+        self._main_thread = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started = None
+
+    # ---------- 启动与阶段 ----------
+
+    def start(self):
+        self._started = time.perf_counter()
+        # 后台线程负责采样调用栈，并按时结束内存抽样窗口（cprofile 模式只做后者）
+        self._sampler = threading.Thread(target=self._sample_loop, name="stage-sampler",
+                                         daemon=True)
+        self._sampler.start()
+
+    def _stage_stats(self, name: str) -> Dict:
+        return self._stats.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                             "memory_samples": 0, "alloc_net": 0, "peak": 0})
+
+    def _open_window(self, name: str) -> bool:
+        """需要时为这次进入阶段开启内存抽样窗口"""
+        if not self.memory_frames:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._window is not None or tracemalloc.is_tracing():
+                return False
+            if now - self._last_memory.get(name, float("-inf")) < self.memory_interval:
+                return False
+            self._last_memory[name] = now
+            self._window = {"stage": name, "deadline": now + self.memory_window, "snapshot": None}
+            tracemalloc.start(self.memory_frames)
+            return True
+
+    def _close_window(self):
+        """结束追踪并保存快照（调用方持有锁）"""
+        window = self._window
+        if window is None or window["snapshot"] is not None:
+            return
+        window["current"], window["peak"] = tracemalloc.get_traced_memory()
+        window["snapshot"] = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        tracemalloc.stop()
+
+    def _record_window(self, stats: Dict, name: str):
+        """把窗口内的分配记入阶段统计（调用方持有锁）"""
+        self._close_window()
+        window, self._window = self._window, None
+        stats["memory_samples"] += 1
+        stats["alloc_net"] += window["current"]
+        stats["peak"] = max(stats["peak"], window["peak"])
+        allocs = self._allocs.setdefault(name, {})
+        for stat in window["snapshot"].statistics("lineno"):
+            entry = allocs.setdefault(str(stat.traceback[0]), [0, 0])
+            entry[0] += stat.size
+            entry[1] += stat.count
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        tid = threading.get_ident()
+        stack = self._stacks.setdefault(tid, [])
+        if stack and stack[-1][0] == name:
+            # 同名阶段嵌套（例如 verify_code 内再次进入 verify）只计外层
+            stack.append(stack[-1])
+            try:
+                yield
+            finally:
+                stack.pop()
+            return
+
+        sampled = self._open_window(name)
+        profile = None
+        if self.mode == "cprofile":
+            # 每个线程同时只能有一个 profiler，内层阶段期间暂停外层的
+            if stack and stack[-1][1] is not None:
+                stack[-1][1].disable()
+            with self._lock:
+                profile = self._profiles.setdefault((name, tid), cProfile.Profile())
+            profile.enable()
+
+        stack.append((name, profile))
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+                if stack and stack[-1][1] is not None:
+                    stack[-1][1].enable()
+            with self._lock:
+                stats = self._stage_stats(name)
+                stats["calls"] += 1
+                stats["wall"] += wall
+                stats["cpu"] += cpu
+                if sampled:
+                    self._record_window(stats, name)
+
+    @contextlib.contextmanager
+    def waiting_on(self, thread_id: Optional[int]):
+        caller = threading.get_ident()
+        with self._lock:
+            self._waiters.setdefault(thread_id, []).append(caller)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiters[thread_id].remove(caller)
+
+    def _current_stage(self, tid: int) -> Optional[str]:
+        # stage() 在各自线程中不加锁地 append / pop；切片是原子的，空栈时得到 []，不会 IndexError
+        top = self._stacks.get(tid, [])[-1:]
+        return top[0][0] if top else None
+
+    # ---------- 采样 ----------
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            window = self._window
+            if window is not None and time.monotonic() >= window["deadline"]:
+                with self._lock:
+                    self._close_window()
+            if self.mode != "sample":
+                continue
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid == own:
+                    continue
+                name = self._current_stage(tid)
+                if name is None:
+                    # 代为执行的线程按等待它的调用方所在阶段计
+                    with self._lock:
+                        waiters = list(self._waiters.get(tid, ()))
+                    name = next(filter(None, map(self._current_stage, waiters)), None)
+                if name is None:
+                    if tid != self._main_thread:
+                        # 没有进入任何阶段的后台线程（空闲的线程池等）不计
+                        continue
+                    name = "other"
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                key = ";".join(reversed(labels))
+                with self._lock:
+                    folded = self._folded.setdefault(name, {})
+                    folded[key] = folded.get(key, 0) + 1
+            del frames
+
+    # ---------- 输出 ----------
+
+    def finish(self) -> str:
+        """停止剖析并写出全部结果，返回输出目录"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        with self._lock:
+            self._close_window()
+            self._window = None
+        os.makedirs(self.output_dir, exist_ok=True)
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+
+        with self._lock:
+            for name, folded in self._folded.items():
+                self._write_folded(name, folded)
+            by_stage = {}
+            for (name, _), profile in self._profiles.items():
+                by_stage.setdefault(name, []).append(profile)
+            for name, profiles in by_stage.items():
+                self._write_pstats(name, profiles)
+            for name, allocs in self._allocs.items():
+                self._write_allocs(name, allocs)
+            summary = {"mode": self.mode, "elapsed": elapsed, "stages": self._stats}
+
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        table = self.format_summary(summary)
+        with open(os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(table + "\n")
+        print(table)
+        print(f"🔬 剖析结果已保存到: {self.output_dir}")
+        return self.output_dir
+
+    def _write_folded(self, name: str, folded: Dict[str, int]):
+        path = os.path.join(self.output_dir, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for key, count in sorted(folded.items()):
+                f.write(f"{name};{key} {count}\n")
+
+    def _write_pstats(self, name: str, profiles):
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(os.path.join(self.output_dir, f"{name}.pstats"))
+        with open(os.path.join(self.output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(self.top)
+
+    def _write_allocs(self, name: str, allocs: Dict[str, list]):
+        rows = sorted(allocs.items(), key=lambda item: -item[1][0])[:self.top]
+        with open(os.path.join(self.output_dir, f"{name}.alloc.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{'KiB':>10} {'次数':>8}  代码行\n")
+            for line, (size, count) in rows:
+                f.write(f"{size / 1024:10.1f} {count:8d}  {line}\n")
+
+    @staticmethod
+    def format_summary(summary: Dict) -> str:
+        lines = [f"{'阶段':<12}{'调用':>8}{'墙钟(s)':>11}{'CPU(s)':>10}{'内存抽样':>10}"
+                 f"{'平均存活(KiB)':>15}{'峰值(KiB)':>12}"]
+        for name, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["wall"]):
+            average = s["alloc_net"] / s["memory_samples"] if s["memory_samples"] else 0.0
+            lines.append(f"{name:<12}{s['calls']:>8}{s['wall']:>11.3f}{s['cpu']:>10.3f}"
+                         f"{s['memory_samples']:>10}{average / 1024:>15.1f}{s['peak'] / 1024:>12.1f}")
+        lines.append(f"总用时 {summary['elapsed']:.3f}s（{summary['mode']} 模式）")
+        return "\n".join(lines)
+
+
+# ========================================
+# 入口脚本使用的辅助函数
+# ========================================
+
+def add_profile_arguments(parser):
+    """给入口脚本的 argparse 加上 --profile 相关参数"""
+    parser.add_argument('--profile', nargs='?', const='sample', default=None,
+                        choices=['sample', 'cprofile'],
+                        help='按阶段剖析 CPU 和内存 (默认模式: sample)')
+    parser.add_argument('--profile-interval', type=float, default=0.01,
+                        help='采样模式的采样间隔，秒 (默认: 0.01)')
+    parser.add_argument('--profile-memory-frames', type=int, default=1,
+                        help='tracemalloc 记录的调用栈层数，0 表示不统计内存 (默认: 1)')
+
+
+def enable_profiling(name: str, mode="sample", interval=0.01, memory_frames=1,
+                     output_dir: Optional[str] = None, at_exit=True) -> StageProfiler:
+    """启用剖析；at_exit 为 True 时在进程退出时写出结果"""
+    global _active
+    output_dir = output_dir or os.path.join(
+        DEFAULT_PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    _active = StageProfiler(output_dir, mode=mode, interval=interval, memory_frames=memory_frames)
+    _active.start()
+    print(f"🔬 已启用 {mode} 剖析")
+    if at_exit:
+        atexit.register(finish_profiling)
+    return _active
+
+
+def enable_from_args(args, name: str, at_exit=True) -> Optional[StageProfiler]:
+    """按 add_profile_arguments 的参数启用剖析，没有 --profile 时返回 None"""
+    if not args.profile:
+        return None
+    return enable_profiling(name, args.profile, args.profile_interval,
+                            args.profile_memory_frames, at_exit=at_exit)
+
+
+def finish_profiling() -> Optional[str]:
+    """写出结果并停用剖析（可以重复调用）"""
+    global _active
+    profiler, _active = _active, None
+    return profiler.finish() if profiler is not None else None
@@ -0,0 +1,88 @@
+"""
+紧凑的测试结果记录
+
+逐条结果用 slots dataclass 代替 dict，完整的 prompt / 响应 / 代码只以 sha256 哈希引用
+（文本在 blob_store.BlobStore 中），内存中不再保存截断的副本。
+相同内容的哈希是同一个 str 对象，question / category / strategy 也共享来源数据中的字符串。
+
+记录仍支持 r["is_harmful"]、r.get("latency") 这样的读取方式，
+report_charts、results_db 等按字典读取结果的代码不需要修改。
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+# 报告中的文本预览长度
+PREVIEW_CHARS = 200
+
+
+def preview(text: str, limit=PREVIEW_CHARS) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+class _MappingAccess:
+    """按字段名读取记录，兼容原来的 dict 结果"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+@dataclass(slots=True)
+class JailbreakResult(_MappingAccess):
+    """一次 Jailbreak 测试（目标模型响应 + 评判）"""
+    question: str
+    category: str
+    strategy: str
+    prompt_hash: str
+    response_hash: str
+    is_harmful: bool
+    reason: str
+    latency: Optional[float] = None
+    tokens: Optional[int] = None
+
+    def to_dict(self, store) -> dict:
+        """报告用的字典: 哈希 + 文本预览，完整文本通过 blob_store.py show <哈希> 查看"""
+        record = asdict(self)
+        record["prompt"] = preview(store.get(self.prompt_hash))
+        record["response"] = preview(store.get(self.response_hash))
+        return record
+
+
+@dataclass(slots=True)
+class HumanEvalResult(_MappingAccess):
+    """
+    一个 HumanEval 问题的结果
+
+    固定采样只填前几个字段；自适应采样另外记录样本数、通过数、pass@k 估计和置信区间，
+    固定采样的这些字段为 None（按字典读取时用 r.get("num_samples") is not None 判断）。
+    """
+    task_id: str
+    passed: bool
+    error: Optional[str]
+    samples_tested: int
+    latency: Optional[float] = None
+    tokens: Optional[int] = None
+    code_hashes: Tuple[str, ...] = ()
+    num_samples: Optional[int] = None
+    num_correct: Optional[int] = None
+    rounds: Optional[int] = None
+    pass_at_k: Optional[float] = None
+    ci_low: Optional[float] = None
+    ci_high: Optional[float] = None
+    stopped: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        record = asdict(self)
+        record["code_hashes"] = list(self.code_hashes)
+        return record
@@ -0,0 +1,244 @@
+"""
+安全报告图表 - 后台进程中用 Agg 面向对象 API 渲染
+
+- 每张图是一个独立任务，在进程池中并行渲染；只用 matplotlib.figure.Figure +
+  FigureCanvasAgg，不依赖 pyplot 的全局状态和默认 backend，无显示器也能运行
+- 测试进行中按聚合结果增量更新：只有数据变化的图才重新渲染，且有最小间隔节流
+- 运行结束时大部分图已经是最新的，最后一次更新也在后台进程中完成
+- 额外生成一个 jailbreak_report.html 汇总页，引用各张 PNG
+
+使用方法:
+    renderer = ChartRenderer("./reports")
+    renderer.update(results)          # 每得到一条结果调用一次，不阻塞
+    renderer.close()                  # 提交最后一次更新并等待渲染完成
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+# 图表名称 -> 输出文件名
+CHART_FILES = {
+    "safety": "jailbreak_safety.png",
+    "strategy": "jailbreak_strategy.png",
+    "category": "jailbreak_category.png",
+    "heatmap": "jailbreak_heatmap.png",
+}
+
+HTML_FILE = "jailbreak_report.html"
+
+
+def aggregate_results(results: List[Dict]) -> Dict:
+    """
+    把逐条测试结果聚合为各图表需要的数据
+
+    返回:
+        Dict: {"safe", "harmful", "strategies": {名称: [有害数, 总数]},
+               "categories": {...}, "heatmap": {"strategies", "categories", "matrix"}}
+    """
+    strategies, categories, cells = {}, {}, {}
+    for r in results:
+        harmful = int(r["is_harmful"])
+        for table, key in ((strategies, r["strategy"]), (categories, r["category"]),
+                           (cells, (r["category"], r["strategy"]))):
+            stats = table.setdefault(key, [0, 0])
+            stats[0] += harmful
+            stats[1] += 1
+    harmful_total = sum(int(r["is_harmful"]) for r in results)
+    strategy_list = [s for s in strategies if s != "baseline"]
+    category_list = list(categories)
+    matrix = [[cells[(c, s)][0] / cells[(c, s)][1] if (c, s) in cells else 0.0
+               for s in strategy_list]
+              for c in category_list]
+    return {
+        "safe": len(results) - harmful_total,
+        "harmful": harmful_total,
+        "strategies": strategies,
+        "categories": categories,
+        "heatmap": {"strategies": strategy_list, "categories": category_list, "matrix": matrix},
+    }
+
+
+def chart_inputs(aggregate: Dict) -> Dict[str, Dict]:
+    """每张图只取自己需要的那部分聚合数据，便于判断哪张图需要重画"""
+    return {
+        "safety": {"safe": aggregate["safe"], "harmful": aggregate["harmful"]},
+        "strategy": aggregate["strategies"],
+        "category": aggregate["categories"],
+        "heatmap": aggregate["heatmap"],
+    }
+
+
+# ========================================
+# 渲染（在 worker 进程中执行）
+# ========================================
+
+def _rates(stats: Dict) -> tuple:
+    names = list(stats)
+    return names, [stats[n][0] / stats[n][1] * 100 if stats[n][1] else 0.0 for n in names]
+
+
+def render_chart(kind: str, data: Dict, path: str, dpi: int = 150) -> str:
+    """渲染一张图并原子地写入 path（进程池 worker 入口）"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(7, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+
+    if kind == "safety":
+        if data["safe"] + data["harmful"]:
+            ax.pie([data["safe"], data["harmful"]], labels=["Safe", "Harmful"],
+                   colors=["green", "red"], autopct='%1.1f%%', startangle=90)
+        ax.set_title("Overall Safety Distribution")
+    elif kind == "strategy":
+        names, rates = _rates(data)
+        ax.bar(names, rates, color="orange")
+        ax.set_xlabel("Strategy")
+        ax.set_ylabel("Jailbreak Success Rate (%)")
+        ax.set_title("Jailbreak Success Rate by Strategy")
+        ax.tick_params(axis='x', rotation=45)
+    elif kind == "category":
+        names, rates = _rates(data)
+        ax.bar(names, rates, color="purple")
+        ax.set_xlabel("Category")
+        ax.set_ylabel("Vulnerability (%)")
+        ax.set_title("Vulnerability by Question Category")
+        ax.tick_params(axis='x', rotation=45)
+    elif kind == "heatmap":
+        matrix = data["matrix"]
+        if matrix and matrix[0]:
+            image = ax.imshow(matrix, cmap="Reds", vmin=0, vmax=1, aspect="auto")
+            fig.colorbar(image, ax=ax, label="Success Rate")
+            ax.set_xticks(range(len(data["strategies"])))
+            ax.set_xticklabels(data["strategies"], rotation=45, ha="right")
+            ax.set_yticks(range(len(data["categories"])))
+            ax.set_yticklabels(data["categories"])
+            for i, row in enumerate(matrix):
+                for j, value in enumerate(row):
+                    ax.text(j, i, f"{value:.0%}", ha="center", va="center",
+                            color="white" if value > 0.5 else "black")
+        ax.set_title("Jailbreak Success Rate Heatmap")
+        ax.set_xlabel("Strategy")
+        ax.set_ylabel("Category")
+    else:
+        raise ValueError(f"未知的图表类型: {kind}")
+
+    fig.tight_layout()
+    tmp_path = f"{path}.{os.getpid()}.tmp.png"
+    fig.savefig(tmp_path, dpi=dpi)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_html_index(output_dir: str, aggregate: Dict) -> str:
+    """生成引用各张图的汇总页"""
+    total = aggregate["safe"] + aggregate["harmful"]
+    safety = aggregate["safe"] / total if total else 0.0
+    images = "\n".join(f'  <figure><img src="{name}" alt="{kind}"></figure>'
+                       for kind, name in CHART_FILES.items())
+    html = f"""<!DOCTYPE html>
+<html lang="zh">
+<head>
+<meta charset="utf-8">
+<title>Jailbreak 安全性测试报告</title>
+<style>
+  body {{ font-family: sans-serif; margin: 2em; }}
+  .grid {{ display: grid; grid-template-columns: repeat(2, 1fr); gap: 1em; }}
+  img {{ max-width: 100%; }}
+</style>
+</head>
+<body>
+<h1>Jailbreak 安全性测试报告</h1>
+<p>总测试数 {total}，安全响应 {aggregate['safe']} ({safety:.1%})，有害响应 {aggregate['harmful']}</p>
+<div class="grid">
+{images}
+</div>
+</body>
+</html>
+"""
+    path = os.path.join(output_dir, HTML_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
+
+
+# ========================================
+# 增量渲染器
+# ========================================
+
+class ChartRenderer:
+    """
+    在后台进程池中增量渲染报告图表
+
+    参数:
+        output_dir: 输出目录
+        max_workers: 渲染进程数（默认每张图一个）
+        min_interval: 同一张图两次渲染之间的最小间隔（秒），避免每条结果都重画
+    """
+
+    def __init__(self, output_dir="./reports", max_workers: Optional[int] = None,
+                 min_interval=2.0, dpi=150):
+        self.output_dir = output_dir
+        self.min_interval = min_interval
+        self.dpi = dpi
+        os.makedirs(output_dir, exist_ok=True)
+        self._pool = ProcessPoolExecutor(max_workers=max_workers or len(CHART_FILES))
+        self._rendered = {}     # 图表 -> 已提交渲染的数据摘要
+        self._pending = {}      # 图表 -> Future
+        self._last_submit = {}  # 图表 -> 上次提交时间
+        self._aggregate = None
+
+    def path(self, kind: str) -> str:
+        return os.path.join(self.output_dir, CHART_FILES[kind])
+
+    def _submit_changed(self, force: bool):
+        now = time.monotonic()
+        for kind, data in chart_inputs(self._aggregate).items():
+            digest = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+            if self._rendered.get(kind) == digest:
+                continue
+            pending = self._pending.get(kind)
+            if force and pending is not None:
+                # 等旧的渲染写完，避免它覆盖掉这次更新的结果
+                pending.exception()
+            if not force:
+                # 上一次渲染还没完成或间隔太短时跳过，下一次 update 再提交
+                if pending is not None and not pending.done():
+                    continue
+                if now - self._last_submit.get(kind, float("-inf")) < self.min_interval:
+                    continue
+            future = self._pool.submit(render_chart, kind, data, self.path(kind), self.dpi)
+            future.add_done_callback(lambda f, kind=kind: f.exception() and print(
+                f"⚠️ 图表 {kind} 渲染失败: {f.exception()}"))
+            self._pending[kind] = future
+            self._rendered[kind] = digest
+            self._last_submit[kind] = now
+
+    def update(self, results: List[Dict]):
+        """根据当前全部结果提交数据有变化的图表，立即返回"""
+        self._aggregate = aggregate_results(results)
+        self._submit_changed(force=False)
+
+    def close(self, results: Optional[List[Dict]] = None, wait=True) -> Dict[str, str]:
+        """
+        提交最后一次更新并关闭进程池
+
+        返回:
+            Dict[str, str]: {图表: 文件路径}，渲染失败的图表不包含在内
+        """
+        if results is not None:
+            self._aggregate = aggregate_results(results)
+        if self._aggregate is None:
+            self._aggregate = aggregate_results([])
+        self._submit_changed(force=True)
+        write_html_index(self.output_dir, self._aggregate)
+        self._pool.shutdown(wait=wait)
+        if not wait:
+            return {kind: self.path(kind) for kind in self._pending}
+        return {kind: future.result() for kind, future in self._pending.items()
+                if future.exception() is None}
@@ -0,0 +1,386 @@
+"""
+测试结果仓库 - 跨运行的 SQLite 结果库
+
+test_humaneval.py 和 test_jailbreak.py 每次运行结束后把结果写入 reports/results.db，
+不再需要逐个加载、扫描 JSON 报告就能比较多次运行。
+
+表结构:
+    runs        一次运行: 测试套件、模型、模式、开始时间、配置
+    strategies  策略维表（HumanEval 为 "direct"）
+    tasks       任务维表: 套件 + 名称（HumanEval 的 task_id / Jailbreak 的问题）+ 类别
+    results     事实表: 运行 × 任务 × 策略 的样本数、成功数、延迟、token 数
+
+成功数的含义: HumanEval 为通过测试的样本数，Jailbreak 为有害响应（攻击成功）数。
+
+不同模式的成功率不可直接比较: HumanEval 固定采样按问题记录 pass@N，自适应 / 队列按样本记录通过率；
+Jailbreak 自适应模式会多采不确定的臂。因此 strategy-trend 和 regressions 只比较同一模式的运行，
+默认取最新一次运行的模式（--mode 指定）。
+
+使用方法:
+    python results_db.py runs --suite jailbreak --last 10
+    python results_db.py strategy-trend --last 5
+    python results_db.py regressions --suite humaneval --window 5
+    python results_db.py regressions --suite jailbreak --mode adaptive
+    python results_db.py import-json reports/jailbreak_report.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_DB = os.path.join("reports", "results.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    suite       TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    mode        TEXT,
+    started_at  REAL NOT NULL,
+    config      TEXT
+);
+CREATE TABLE IF NOT EXISTS strategies (
+    id    INTEGER PRIMARY KEY,
+    name  TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id        INTEGER PRIMARY KEY,
+    suite     TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    category  TEXT,
+    UNIQUE (suite, name)
+);
+CREATE TABLE IF NOT EXISTS results (
+    id           INTEGER PRIMARY KEY,
+    run_id       INTEGER NOT NULL REFERENCES runs(id),
+    task_id      INTEGER NOT NULL REFERENCES tasks(id),
+    strategy_id  INTEGER NOT NULL REFERENCES strategies(id),
+    samples      INTEGER NOT NULL,
+    successes    INTEGER NOT NULL,
+    latency      REAL,
+    tokens       INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_runs_suite_model_time ON runs (suite, model, started_at);
+CREATE INDEX IF NOT EXISTS idx_results_run_strategy
+    ON results (run_id, strategy_id, samples, successes);
+CREATE INDEX IF NOT EXISTS idx_results_task_run ON results (task_id, run_id, successes, samples);
+CREATE INDEX IF NOT EXISTS idx_tasks_category ON tasks (category);
+"""
+
+
+class ResultsDB:
+    """SQLite 结果仓库"""
+
+    def __init__(self, path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._ids = {}
+
+    def close(self):
+        self.conn.close()
+
+    def _dimension_id(self, table: str, key: tuple, insert_sql: str, select_sql: str) -> int:
+        cache_key = (table,) + key
+        if cache_key not in self._ids:
+            self.conn.execute(insert_sql, key)
+            self._ids[cache_key] = self.conn.execute(select_sql, key[:2]).fetchone()[0]
+        return self._ids[cache_key]
+
+    def strategy_id(self, name: str) -> int:
+        return self._dimension_id(
+            "strategies", (name,),
+            "INSERT OR IGNORE INTO strategies (name) VALUES (?)",
+            "SELECT id FROM strategies WHERE name = ?")
+
+    def task_id(self, suite: str, name: str, category: Optional[str] = None) -> int:
+        return self._dimension_id(
+            "tasks", (suite, name, category),
+            "INSERT OR IGNORE INTO tasks (suite, name, category) VALUES (?, ?, ?)",
+            "SELECT id FROM tasks WHERE suite = ? AND name = ?")
+
+    def add_run(self, suite: str, model: str, rows: List[Dict], mode: Optional[str] = None,
+                config: Optional[Dict] = None, started_at: Optional[float] = None) -> int:
+        """
+        在一个事务中写入一次运行
+
+        参数:
+            rows: [{"task", "category", "strategy", "samples", "successes", "latency", "tokens"}]
+        返回:
+            int: run_id
+        """
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (suite, model, mode, started_at, config) VALUES (?, ?, ?, ?, ?)",
+                (suite, model, mode, started_at or time.time(),
+                 json.dumps(config or {}, ensure_ascii=False)))
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO results (run_id, task_id, strategy_id, samples, successes, latency, tokens)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id,
+                  self.task_id(suite, row["task"], row.get("category")),
+                  self.strategy_id(row.get("strategy") or "direct"),
+                  row["samples"], row["successes"], row.get("latency"), row.get("tokens"))
+                 for row in rows])
+        return run_id
+
+    # ---------- 查询 ----------
+
+    def latest_mode(self, suite: str, model: Optional[str] = None) -> Optional[str]:
+        """最新一次运行的模式，没有运行时返回 None"""
+        runs = self.last_runs(suite, 1, model)
+        return runs[0]["mode"] if runs else None
+
+    def last_runs(self, suite: str, last: int, model: Optional[str] = None,
+                  mode: Optional[str] = None) -> List[Dict]:
+        """最近 last 次运行（新的在前），mode 不为 None 时只取该模式的运行"""
+        sql = "SELECT id, model, mode, started_at FROM runs WHERE suite = ?"
+        params = [suite]
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        if mode is not None:
+            sql += " AND mode = ?"
+            params.append(mode)
+        sql += " ORDER BY started_at DESC LIMIT ?"
+        params.append(last)
+        rows = self.conn.execute(sql, params).fetchall()
+        return [{"id": r[0], "model": r[1], "mode": r[2], "started_at": r[3]} for r in rows]
+
+    def run_summary(self, run_ids: List[int]) -> Dict[int, Dict]:
+        """每次运行的样本数、成功数、平均延迟和 token 总数"""
+        if not run_ids:
+            return {}
+        marks = ",".join("?" * len(run_ids))
+        rows = self.conn.execute(
+            f"SELECT run_id, SUM(samples), SUM(successes), AVG(latency), SUM(tokens) "
+            f"FROM results WHERE run_id IN ({marks}) GROUP BY run_id", run_ids).fetchall()
+        return {r[0]: {"samples": r[1], "successes": r[2], "latency": r[3], "tokens": r[4],
+                       "rate": r[2] / r[1] if r[1] else 0.0} for r in rows}
+
+    def strategy_trend(self, suite: str, last: int, model: Optional[str] = None,
+                       mode: Optional[str] = None) -> Dict:
+        """
+        最近 last 次同一模式的运行中各策略的成功率，mode 默认取最新一次运行的模式
+
+        返回:
+            Dict: {"mode", "runs": [run 信息], "rates": {策略: {run_id: 成功率}}}
+        """
+        mode = mode or self.latest_mode(suite, model)
+        runs = self.last_runs(suite, last, model, mode)
+        if not runs:
+            return {"mode": mode, "runs": [], "rates": {}}
+        ids = [r["id"] for r in runs]
+        marks = ",".join("?" * len(ids))
+        rows = self.conn.execute(
+            f"SELECT s.name, r.run_id, SUM(r.successes), SUM(r.samples) "
+            f"FROM results r JOIN strategies s ON s.id = r.strategy_id "
+            f"WHERE r.run_id IN ({marks}) GROUP BY s.name, r.run_id", ids).fetchall()
+        rates = {}
+        for name, run_id, successes, samples in rows:
+            rates.setdefault(name, {})[run_id] = successes / samples if samples else 0.0
+        return {"mode": mode, "runs": list(reversed(runs)), "rates": rates}
+
+    def regressions(self, suite: str, window: int, threshold: float,
+                    mode: Optional[str] = None) -> List[Dict]:
+        """
+        每个模型最新一次运行与之前 window 次同一模式运行的成功率中位数比较
+
+        mode 为 None 时每个模型取其最新一次运行的模式，只与该模式的历史运行比较。
+
+        HumanEval 成功率下降、Jailbreak 攻击成功率上升都算回退；
+        同时列出上一次成功（或安全）而最新一次失败（或被攻破）的任务。
+        """
+        higher_is_better = suite == "humaneval"
+        models = [r[0] for r in self.conn.execute(
+            "SELECT DISTINCT model FROM runs WHERE suite = ?", (suite,))]
+        found = []
+        for model in models:
+            model_mode = mode or self.latest_mode(suite, model)
+            runs = self.last_runs(suite, window + 1, model, model_mode)
+            if len(runs) < 2:
+                continue
+            latest, previous = runs[0], runs[1:]
+            summary = self.run_summary([r["id"] for r in runs])
+            current = summary.get(latest["id"], {}).get("rate", 0.0)
+            baseline = statistics.median(summary.get(r["id"], {}).get("rate", 0.0) for r in previous)
+            delta = current - baseline
+            worse = delta < -threshold if higher_is_better else delta > threshold
+
+            # 任务级: 按 (任务, 策略) 比较最新一次和上一次
+            flipped = self.conn.execute(
+                "SELECT t.name, s.name FROM results a "
+                "JOIN results b ON b.task_id = a.task_id AND b.strategy_id = a.strategy_id "
+                "JOIN tasks t ON t.id = a.task_id JOIN strategies s ON s.id = a.strategy_id "
+                "WHERE a.run_id = ? AND b.run_id = ? AND "
+                + ("a.successes = 0 AND b.successes > 0" if higher_is_better
+                   else "a.successes > 0 AND b.successes = 0"),
+                (latest["id"], previous[0]["id"])).fetchall()
+            if worse or flipped:
+                found.append({"model": model, "mode": model_mode, "run_id": latest["id"],
+                              "rate": current,
+                              "baseline": baseline, "delta": delta, "regressed": worse,
+                              "flipped": flipped})
+        return found
+
+
+# ========================================
+# 从测试脚本的结果写入
+# ========================================
+
+def record_jailbreak_run(results: List[Dict], model: str, mode: Optional[str] = None,
+                         config: Optional[Dict] = None, path=DEFAULT_DB) -> int:
+    """把 run_jailbreak_test（及其 batch / adaptive 版本）的结果写入仓库"""
+    rows = [{
+        "task": r["question"],
+        "category": r["category"],
+        "strategy": r["strategy"],
+        "samples": 1,
+        "successes": int(r["is_harmful"]),
+        "latency": r.get("latency"),
+        "tokens": r.get("tokens"),
+    } for r in results]
+    db = ResultsDB(path)
+    try:
+        return db.add_run("jailbreak", model, rows, mode, config)
+    finally:
+        db.close()
+
+
+def record_humaneval_run(results: List[Dict], model: str, mode: Optional[str] = None,
+                         config: Optional[Dict] = None, path=DEFAULT_DB) -> int:
+    """
+    把 HumanEval 的逐题结果写入仓库
+
+    自适应 / 队列结果按 num_samples / num_correct 记录（没有可验证样本的问题记为 1 次失败）；
+    固定采样在第一个通过的样本处停止，samples_tested 是生成的样本数而不是验证过的样本数，
+    所以按问题记录一行（samples=1, successes=是否通过）。
+    """
+    rows = []
+    for r in results:
+        if r.get("num_samples") is not None:
+            samples, successes = max(r["num_samples"], 1), r["num_correct"]
+        else:
+            samples, successes = 1, int(r["passed"])
+        rows.append({
+            "task": r["task_id"],
+            "category": None,
+            "strategy": "direct",
+            "samples": samples,
+            "successes": successes,
+            "latency": r.get("latency"),
+            "tokens": r.get("tokens"),
+        })
+    db = ResultsDB(path)
+    try:
+        return db.add_run("humaneval", model, rows, mode, config)
+    finally:
+        db.close()
+
+
+# ========================================
+# 命令行
+# ========================================
+
+def _format_time(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='查询跨运行的测试结果仓库',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python results_db.py runs --suite jailbreak --last 10
+  python results_db.py strategy-trend --last 5
+  python results_db.py regressions --suite humaneval --window 5 --threshold 0.05
+  python results_db.py strategy-trend --mode fixed
+  python results_db.py import-json reports/jailbreak_report.json --model Qwen/Qwen2.5-7B-Instruct
+        '''
+    )
+    parser.add_argument('--db', default=DEFAULT_DB, help='数据库路径 (默认: reports/results.db)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('runs', help='列出最近的运行')
+    p.add_argument('--suite', choices=['humaneval', 'jailbreak'], default='jailbreak')
+    p.add_argument('--model', default=None)
+    p.add_argument('--mode', default=None, help='只列出该模式的运行 (默认: 全部)')
+    p.add_argument('--last', type=int, default=10)
+
+    p = sub.add_parser('strategy-trend', help='最近 N 次运行中各策略的攻击成功率')
+    p.add_argument('--model', default=None)
+    p.add_argument('--mode', default=None, help='只比较该模式的运行 (默认: 最新一次运行的模式)')
+    p.add_argument('--last', type=int, default=5)
+
+    p = sub.add_parser('regressions', help='每个模型最新一次运行相对历史的回退')
+    p.add_argument('--suite', choices=['humaneval', 'jailbreak'], default='humaneval')
+    p.add_argument('--window', type=int, default=5, help='比较的历史运行次数 (默认: 5)')
+    p.add_argument('--threshold', type=float, default=0.05, help='判定为回退的成功率变化 (默认: 0.05)')
+    p.add_argument('--mode', default=None,
+                   help='只比较该模式的运行 (默认: 每个模型最新一次运行的模式)')
+
+    p = sub.add_parser('import-json', help='导入已有的 jailbreak_report.json')
+    p.add_argument('path')
+    p.add_argument('--model', default='unknown')
+
+    args = parser.parse_args()
+    db = ResultsDB(args.db)
+    start = time.perf_counter()
+
+    if args.command == 'runs':
+        runs = db.last_runs(args.suite, args.last, args.model, args.mode)
+        summary = db.run_summary([r["id"] for r in runs])
+        for r in runs:
+            s = summary.get(r["id"], {})
+            print(f"#{r['id']:<5} {_format_time(r['started_at'])}  {r['model']:<28} "
+                  f"{r['mode'] or '-':<9} 成功率 {s.get('rate', 0) * 100:5.1f}% "
+                  f"({s.get('successes', 0)}/{s.get('samples', 0)})")
+
+    elif args.command == 'strategy-trend':
+        trend = db.strategy_trend("jailbreak", args.last, args.model, args.mode)
+        runs = trend["runs"]
+        print(f"模式: {trend['mode'] or '-'}")
+        print(f"{'策略':<24}" + "".join(f"#{r['id']:<7}" for r in runs))
+        for name, rates in sorted(trend["rates"].items()):
+            cells = "".join(f"{rates[r['id']] * 100:6.1f}% " if r["id"] in rates else "     -  "
+                            for r in runs)
+            print(f"{name:<24}{cells}")
+
+    elif args.command == 'regressions':
+        found = db.regressions(args.suite, args.window, args.threshold, args.mode)
+        if not found:
+            print("✅ 没有发现回退")
+        for f in found:
+            mark = "❌" if f["regressed"] else "⚠️"
+            print(f"{mark} {f['model']} [{f['mode'] or '-'}] 运行 #{f['run_id']}: 成功率 {f['rate'] * 100:.1f}% "
+                  f"(历史中位数 {f['baseline'] * 100:.1f}%，变化 {f['delta'] * 100:+.1f}%)")
+            if f["flipped"]:
+                print(f"   {len(f['flipped'])} 个 (任务, 策略) 相对上一次运行变差:")
+            for task, strategy in f["flipped"][:20]:
+                print(f"     - {task} [{strategy}]")
+
+    elif args.command == 'import-json':
+        with open(args.path, encoding="utf-8") as fh:
+            report = json.load(fh)
+        db.close()
+        run_id = record_jailbreak_run(report["details"], args.model, mode="import",
+                                      config={"source": args.path}, path=args.db)
+        print(f"✅ 已导入 {len(report['details'])} 条结果，运行 #{run_id}")
+        return
+
+    db.close()
+    print(f"\n⏱️ 查询耗时 {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
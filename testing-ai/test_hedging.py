@@ -0,0 +1,160 @@
+"""
+对冲请求测试 - 用本地 MockLLMServer 注入慢响应，检查对冲率、预算上限、服务端观察到的取消和限流配额结算
+
+不需要 API key，也不需要 openai 包: 测试用一个最小的 asyncio HTTP 客户端代替 AsyncOpenAI，
+取消请求时同样会关闭连接。
+
+使用方法:
+    python -m unittest test_hedging -v
+"""
+
+import asyncio
+import json
+import threading
+import time
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from hedging import HedgedClient
+from mock_llm_server import MockLLMServer
+from token_budget import TokenRateLimiter
+
+BODY = {"model": "mock", "messages": [{"role": "user", "content": "def f():"}], "max_tokens": 64}
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{k: _to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(v) for v in value]
+    return value
+
+
+class _AsyncCompletions:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def create(self, **body):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            payload = json.dumps(body).encode("utf-8")
+            writer.write(b"POST /v1/chat/completions HTTP/1.1\r\nHost: mock\r\n"
+                         b"Content-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            data = json.loads(await reader.readexactly(length))
+            if b" 200 " not in status:
+                raise RuntimeError(data)
+            return _to_namespace(data)
+        finally:
+            # 任务被取消时同样走到这里，服务端在等待期间看到连接关闭
+            writer.close()
+
+
+class AsyncMockClient:
+    """接口与 AsyncOpenAI 的 chat.completions.create 相同的最小客户端"""
+
+    def __init__(self, host, port):
+        self.chat = types.SimpleNamespace(completions=_AsyncCompletions(host, port))
+
+
+class CountingLimiter(TokenRateLimiter):
+    """记录 try_acquire 预留和 settle 结算的 token 数"""
+
+    def __init__(self, tpm):
+        super().__init__(tpm=tpm)
+        self.reserved = []
+        self.settled = []
+
+    def try_acquire(self, tokens):
+        ok = super().try_acquire(tokens)
+        if ok:
+            self.reserved.append(tokens)
+        return ok
+
+    def settle(self, reserved, actual):
+        self.settled.append(reserved)
+        super().settle(reserved, actual)
+
+
+class HedgingMockServerTest(unittest.TestCase):
+
+    def start_server(self, **kwargs):
+        server = MockLLMServer(("127.0.0.1", 0), seed=7, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def run_requests(self, hedged, count, concurrency=8):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            responses = list(pool.map(lambda _: hedged.chat.completions.create(**BODY), range(count)))
+        for response in responses:
+            self.assertEqual(response.choices[0].finish_reason, "stop")
+        return hedged.summary()
+
+    def wait_for(self, predicate, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return predicate()
+
+    def test_slow_responses_are_hedged_and_cancelled(self):
+        server = self.start_server(latency=0.03, jitter=0.0, slow_rate=0.25, slow_delay=1.5)
+        address = server.server_address
+        hedged = HedgedClient(AsyncMockClient(*address), min_samples=5, initial_delay=0.3,
+                              budget=0.5, burst=1, shadow_rate=0.0, seed=1)
+
+        stats = self.run_requests(hedged, 40)
+
+        self.assertGreater(stats["hedged"], 0)
+        self.assertGreater(stats["hedge_wins"], 0)
+        self.assertLessEqual(stats["hedged"], 0.5 * stats["requests"] + 1)
+        # 对冲胜出后主请求被取消，服务端在慢等待期间看到连接关闭
+        self.assertTrue(self.wait_for(lambda: server.stats["cancelled"] >= stats["hedge_wins"]),
+                        server.stats)
+        # 主请求先返回时，对冲可能在请求发到服务端之前就被取消，所以服务端计数只有上下界
+        self.assertLessEqual(server.stats["requests"], stats["requests"] + stats["hedged"])
+        self.assertGreaterEqual(server.stats["requests"], stats["requests"] + stats["hedge_wins"])
+
+    def test_budget_caps_hedge_rate(self):
+        server = self.start_server(latency=0.02, jitter=0.0, slow_rate=0.5, slow_delay=0.4)
+        hedged = HedgedClient(AsyncMockClient(*server.server_address), min_samples=1000,
+                              initial_delay=0.05, budget=0.1, burst=1, shadow_rate=0.0, seed=1)
+
+        stats = self.run_requests(hedged, 30, concurrency=1)
+
+        self.assertGreater(stats["hedged"], 0)
+        self.assertLessEqual(stats["hedged"], 0.1 * stats["requests"] + 1)
+        # 慢请求约一半，远超预算，超出的部分被跳过
+        self.assertGreater(stats["skipped_budget"], 0)
+        self.assertLessEqual(server.stats["requests"], stats["requests"] + stats["hedged"])
+        self.assertGreaterEqual(server.stats["requests"], stats["requests"] + stats["hedge_wins"])
+
+    def test_hedge_reservations_are_settled(self):
+        server = self.start_server(latency=0.02, jitter=0.0, slow_rate=0.3, slow_delay=1.0)
+        limiter = CountingLimiter(tpm=10 ** 6)
+        hedged = HedgedClient(AsyncMockClient(*server.server_address), min_samples=1000,
+                              initial_delay=0.1, budget=1.0, burst=1, limiter=limiter,
+                              shadow_rate=0.5, seed=3)
+
+        stats = self.run_requests(hedged, 24)
+        self.assertGreater(stats["hedged"], 0)
+        # 影子主请求跑完后另外按实际用量记账（reserved=0）
+        self.wait_for(lambda: not hedged._shadows)
+        hedge_settles = [r for r in limiter.settled if r != 0]
+        self.assertEqual(sorted(hedge_settles), sorted(r for r in limiter.reserved if r != 0))
+        self.assertEqual(len(limiter.reserved), stats["hedged"])
+
+
+if __name__ == '__main__':
+    unittest.main()
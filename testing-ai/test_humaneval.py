@@ -9,16 +9,32 @@ HumanEval Benchmark 测试 - LLM 代码生成能力评估
 
 使用方法:
     python test_humaneval.py
+    python test_humaneval.py --adaptive --k 1 --budget 100
+    python test_humaneval.py --samples 10 --batch local
+    python test_humaneval.py --profile
+    python test_humaneval.py --hedge
+
+自适应采样 (--adaptive):
+    每个问题按小批次生成样本，pass@k 置信区间足够窄时停止；
+    剩余的样本预算分配给置信区间仍然最宽的问题。
 """
 
 from openai import OpenAI
 import os
+import argparse
+import math
 from dotenv import load_dotenv
 from datasets import load_dataset
 import json
 import time
 import matplotlib.pyplot as plt
 from typing import List, Dict, Tuple, Any, Callable
+from token_budget import TokenBudget
+from blob_store import BlobStore
+from records import HumanEvalResult
+from intervals import wilson_interval
+from hedging import add_hedge_arguments, hedged_client_from_args
+from profiling import add_profile_arguments, enable_from_args, stage
 
 # 加载环境变量
 load_dotenv()
@@ -29,6 +45,15 @@ client = OpenAI(
     base_url=os.getenv("SILICONFLOW_BASE_URL")
 )
 
+# SiliconFlow 支持的模型
+MODEL = "Qwen/Qwen3-8B"
+
+# 本地 token 计数、按任务规划 max_tokens、TPM / RPM 限流
+token_budget = TokenBudget.from_env()
+
+# 生成的代码按内容去重压缩保存，结果中只保留哈希，便于事后审计
+blob_store = BlobStore()
+
 
 def load_humaneval_subset(num_problems=10):
     """
@@ -72,7 +97,32 @@ def load_humaneval_subset(num_problems=10):
         return []
 
 
-def generate_code(client, prompt, temperature=0.2, max_tokens=512, num_samples=1):
+def build_generate_request(prompt, temperature=0.2, max_tokens=None, num_samples=1, task_id=None):
+    """
+    构建代码生成请求的参数（同步调用和 Batch 文件共用）
+    
+    max_tokens 为 None 时根据 prompt 的 token 数和该任务的历史补全长度决定
+    """
+    # 构建系统提示
+    system_prompt = "你是一个专业的Python程序员，请根据用户提供的函数签名和文档字符串，完成函数的实现。只需要返回函数的实现代码，不要添加其他解释或注释。"
+    
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    if max_tokens is None:
+        max_tokens = token_budget.plan_max_tokens(messages, task_id or "humaneval")
+    
+    return {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "n": num_samples
+    }
+
+
+def generate_code(client, prompt, temperature=0.2, max_tokens=None, num_samples=1, task_id=None):
     """
     任务2: 调用 LLM 生成代码
     
@@ -80,38 +130,67 @@ def generate_code(client, prompt, temperature=0.2, max_tokens=512, num_samples=1
         client: OpenAI 客户端
         prompt: 代码提示（包含函数签名和文档字符串）
         temperature: 温度参数
-        max_tokens: 最大生成 token 数
+        max_tokens: 最大生成 token 数，None 表示按 prompt 长度和历史补全长度自动决定
         num_samples: 生成样本数量
+        task_id: 任务 ID，用于记录该任务的补全长度历史
     
     返回:
         List[str]: 生成的代码列表
     """
-    try:
-        # 构建系统提示
-        system_prompt = "你是一个专业的Python程序员，请根据用户提供的函数签名和文档字符串，完成函数的实现。只需要返回函数的实现代码，不要添加其他解释或注释。"
-        
-        # 调用OpenAI API生成代码
-        response = client.chat.completions.create(
-            model="Qwen/Qwen3-8B",  # SiliconFlow 支持的模型
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-            n=num_samples
-        )
-        
-        # 提取生成的代码
-        generated_codes = []
-        for choice in response.choices:
-            generated_codes.append(choice.message.content.strip())
+    key = task_id or "humaneval"
+    with stage("generate"):
+        body = build_generate_request(prompt, temperature, max_tokens, num_samples, task_id)
+        reserved = token_budget.prepare(body, key)
+        try:
+            # 调用OpenAI API生成代码
+            response = client.chat.completions.create(**body)
+            token_budget.record(key, response, reserved, body["max_tokens"])
+            
+            # 提取生成的代码
+            generated_codes = []
+            for choice in response.choices:
+                generated_codes.append(choice.message.content.strip())
+            
+            return generated_codes
         
-        return generated_codes
+        except Exception as e:
+            token_budget.release(reserved)
+            print(f"❌ 代码生成失败: {e}")
+            return [None] * num_samples
+
+
+def generate_codes_batch(problems, backend, temperature=0.2, max_tokens=None, num_samples=1,
+                         batch_path="./reports/humaneval_batch.jsonl"):
+    """
+    Batch 模式: 把所有问题的生成请求写入一个 Batch 文件一次提交
     
-    except Exception as e:
-        print(f"❌ 代码生成失败: {e}")
-        return [None] * num_samples
+    很多 Batch 接口不支持 n > 1，所以每个样本是一个单独的请求，
+    custom_id 为 "<task_id>#<样本序号>"。
+    
+    返回:
+        Dict[str, List[str]]: {task_id: 生成的代码列表}，失败的样本为 None
+    """
+    from batch_jobs import choice_texts, run_batch
+    
+    requests = [
+        (f"{problem['task_id']}#{j}",
+         build_generate_request(problem["prompt"], temperature, max_tokens, num_samples=1,
+                                task_id=problem["task_id"]))
+        for problem in problems
+        for j in range(num_samples)
+    ]
+    with stage("generate"):
+        records = run_batch(backend, requests, batch_path,
+                            keys={custom_id: custom_id.split("#")[0] for custom_id, _ in requests})
+    
+    codes = {}
+    for problem in problems:
+        task_codes = []
+        for j in range(num_samples):
+            text = choice_texts(records.get(f"{problem['task_id']}#{j}"))[0]
+            task_codes.append(text.strip() if text is not None else None)
+        codes[problem["task_id"]] = task_codes
+    return codes
 
 
 def execute_code_with_test(code, test_code, entry_point):
@@ -166,6 +245,66 @@ def execute_code_with_test(code, test_code, entry_point):
         return False, f"Runtime error: {type(e).__name__}: {str(e)}"
 
 
+# HumanEval+ 的分片验证器，使用 --plus 时在 main 中创建
+plus_verifier = None
+
+
+def verify_code(code, problem):
+    """
+    验证一份生成的代码: HumanEval+ 的题目分片并行执行全部测试输入，其余题目执行 check()
+
+    返回:
+        Tuple[bool, str]: (是否通过, 错误信息)
+    """
+    if plus_verifier is None or not problem.get("plus_inputs"):
+        with stage("verify"):
+            return execute_code_with_test(code, problem["test"], problem["entry_point"])
+    with stage("verify"):
+        report = plus_verifier.verify(code, problem)
+    slowest = ", ".join(f"#{index} {seconds * 1000:.1f}ms" for index, seconds in report["slowest"][:3])
+    print(f"   ⏱️ {report['executed']}/{report['inputs']} 个输入，用时 {report['elapsed']:.2f}s"
+          f"，取消 {report['cancelled_shards']} 个分片；最慢: {slowest or '-'}")
+    if report["reference_errors"]:
+        _, error = min(report["reference_errors"])
+        print(f"   ⚠️ 标准解在 {len(report['reference_errors'])} 个输入上出错，已跳过（首个: {error}）")
+    return report["passed"], report["error"]
+
+
+def estimate_pass_at_k(n, c, k):
+    """
+    pass@k 的无偏估计 (Chen et al., 2021): 1 - C(n-c, k) / C(n, k)
+    
+    参数:
+        n: 样本总数
+        c: 通过测试的样本数
+        k: k 值
+    
+    返回:
+        float: 该问题的 pass@k 估计
+    """
+    if n - c < k:
+        return 1.0
+    # 连乘形式，避免组合数溢出
+    prob_all_fail = 1.0
+    for i in range(n - c + 1, n + 1):
+        prob_all_fail *= 1.0 - k / i
+    return 1.0 - prob_all_fail
+
+
+def pass_at_k_interval(n, c, k, confidence=0.95):
+    """
+    pass@k 的置信区间
+    
+    先用 Wilson 区间估计单个样本的通过率 p，再通过单调变换
+    pass@k = 1 - (1 - p)^k 映射到 pass@k 上。
+    
+    返回:
+        Tuple[float, float]: (下界, 上界)
+    """
+    low, high = wilson_interval(c, n, confidence)
+    return 1 - (1 - low) ** k, 1 - (1 - high) ** k
+
+
 def calculate_pass_at_k(results, k=1):
     """
     任务4: 计算 pass@k 指标
@@ -180,6 +319,11 @@ def calculate_pass_at_k(results, k=1):
     if not results:
         return 0.0
     
+    # 记录了样本数和通过数的结果使用无偏估计，样本数可以逐题不同
+    if all(r.get("num_samples") is not None and r["num_samples"] >= k for r in results):
+        return sum(estimate_pass_at_k(r["num_samples"], r["num_correct"], k)
+                   for r in results) / len(results)
+    
     correct = 0
     total = 0
     
@@ -192,18 +336,216 @@ def calculate_pass_at_k(results, k=1):
     return correct / total if total > 0 else 0.0
 
 
+def evaluate_samples(codes, problem):
+    """
+    测试一批生成的代码
+    
+    返回:
+        Tuple[int, int, Optional[str]]: (有效样本数, 通过数, 最后一个错误信息)
+    """
+    valid, correct, error_msg = 0, 0, None
+    for code in codes:
+        if code is None:
+            continue
+        valid += 1
+        success, error = verify_code(code, problem)
+        if success:
+            correct += 1
+        else:
+            error_msg = error
+    return valid, correct, error_msg
+
+
+def run_adaptive(problems, k=1, budget=None, round_size=2, min_samples=None,
+                 max_samples=20, ci_width=0.2, confidence=0.95, temperature=0.8):
+    """
+    自适应采样: 按轮次生成样本，置信区间足够窄时提前停止
+    
+    1. 每个问题先生成 min_samples 个样本（至少 k 个，保证估计量有定义）
+    2. 之后每轮挑选 pass@k 置信区间最宽、且未收敛的问题再生成 round_size 个样本
+    3. 所有问题收敛、达到 max_samples 或样本预算用完时停止
+    
+    所有样本都参与无偏估计，停止规则只决定"还要不要再采"，不丢弃任何样本。
+    每个问题最多检查 looks 次区间，反复检查会抬高假收敛的概率，
+    所以停止规则和报告的区间都使用 Bonferroni 校正后的置信水平 1 - (1 - confidence) / looks。
+    
+    参数:
+        budget: 样本总预算，默认 len(problems) * max_samples（即固定采样的花费）
+        ci_width: 置信区间宽度阈值，小于等于该值视为收敛
+    
+    返回:
+        List[HumanEvalResult]: 每个问题的结果，包含 num_samples / num_correct / pass_at_k / 置信区间，
+        生成的代码与固定采样一样存入 blob_store，只保留 code_hashes
+    """
+    min_samples = max(min_samples or k, k)
+    budget = budget if budget is not None else len(problems) * max_samples
+    # 预热后检查一次，之后每轮 round_size 个样本检查一次
+    looks = 1 + math.ceil(max(0, max_samples - min_samples) / round_size)
+    confidence = 1 - (1 - confidence) / looks
+    states = [{"problem": p, "n": 0, "c": 0, "rounds": 0, "error": None, "failures": 0,
+               "latency": 0.0, "tokens": 0, "code_hashes": []}
+              for p in problems]
+
+    def sample(state, count):
+        problem = state["problem"]
+        start = time.perf_counter()
+        with token_budget.track() as usage:
+            codes = generate_code(client, problem["prompt"], temperature=temperature,
+                                  num_samples=count, task_id=problem["task_id"])
+        state["latency"] += time.perf_counter() - start
+        state["tokens"] += usage["tokens"]
+        valid, correct, error = evaluate_samples(codes, problem)
+        state["code_hashes"] += [blob_store.put(c) for c in codes if c is not None]
+        state["n"] += valid
+        state["c"] += correct
+        state["rounds"] += 1
+        state["error"] = error or state["error"]
+        # 生成全部失败的轮次不计入样本，但连续失败时放弃该问题，避免死循环
+        state["failures"] = state["failures"] + 1 if valid == 0 else 0
+        low, high = pass_at_k_interval(state["n"], state["c"], k, confidence)
+        print(f"  {problem['task_id']}: +{valid} 个样本，共 {state['n']} 个 "
+              f"({state['c']} 通过)，pass@{k} ∈ [{low:.3f}, {high:.3f}]")
+        return count
+
+    def open_width(state):
+        """未收敛问题的置信区间宽度，已收敛或不能再采样的问题返回 None"""
+        if state["n"] >= max_samples or state["failures"] >= 3:
+            return None
+        low, high = pass_at_k_interval(state["n"], state["c"], k, confidence)
+        return None if high - low <= ci_width else high - low
+
+    spent = 0
+    print(f"📐 每个问题最多检查 {looks} 次区间，按 {confidence:.2%} 置信水平判断收敛（Bonferroni 校正）")
+    print(f"🎯 预热: 每个问题 {min_samples} 个样本")
+    for state in states:
+        while state["n"] < min_samples and state["failures"] < 3 and spent < budget:
+            spent += sample(state, min(round_size, min_samples - state["n"], budget - spent))
+
+    print(f"\n🔁 按置信区间宽度分配剩余预算 ({budget - spent} 个样本)")
+    while spent < budget:
+        widths = [(open_width(s), s) for s in states]
+        widths = [(w, s) for w, s in widths if w is not None]
+        if not widths:
+            break
+        _, state = max(widths, key=lambda item: item[0])
+        count = min(round_size, max_samples - state["n"], budget - spent)
+        spent += sample(state, count)
+
+    results = []
+    for state in states:
+        n, c = state["n"], state["c"]
+        low, high = pass_at_k_interval(n, c, k, confidence)
+        if high - low <= ci_width:
+            stopped = "converged"
+        elif n >= max_samples:
+            stopped = "max_samples"
+        elif state["failures"] >= 3:
+            stopped = "generation_failed"
+        else:
+            stopped = "budget"
+        results.append(HumanEvalResult(
+            task_id=state["problem"]["task_id"],
+            passed=c > 0,
+            error=state["error"],
+            samples_tested=n,
+            latency=state["latency"],
+            tokens=state["tokens"],
+            code_hashes=tuple(state["code_hashes"]),
+            num_samples=n,
+            num_correct=c,
+            rounds=state["rounds"],
+            pass_at_k=estimate_pass_at_k(n, c, k) if n >= k else None,
+            ci_low=low,
+            ci_high=high,
+            stopped=stopped
+        ))
+    return results
+
+
+def save_results(results, mode, config):
+    """把本次运行的结果写入 SQLite 结果仓库，便于跨运行比较"""
+    from results_db import record_humaneval_run
+    with stage("report"):
+        try:
+            run_id = record_humaneval_run(results, MODEL, mode=mode, config=config)
+            print(f"🗄️ 结果已写入 reports/results.db（运行 #{run_id}）")
+        except Exception as e:
+            print(f"⚠️ 写入结果仓库失败: {e}")
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(
+        description='HumanEval 代码生成能力测试',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python test_humaneval.py
+  python test_humaneval.py --problems 50 --samples 10 --k 5
+  python test_humaneval.py --adaptive --k 1 --max-samples 20 --ci-width 0.2
+  python test_humaneval.py --samples 10 --batch local
+  python test_humaneval.py --plus --shard-workers 8
+  python test_humaneval.py --profile
+  python test_humaneval.py --hedge --hedge-quantile 0.9
+        '''
+    )
+    parser.add_argument('--problems', type=int, default=10, help='测试问题数量 (默认: 10)')
+    parser.add_argument('--temperature', type=float, default=None,
+                        help='温度参数 (默认: 固定采样 0.2，自适应采样 0.8)')
+    parser.add_argument('--samples', type=int, default=1,
+                        help='固定采样时每个问题生成的样本数 (默认: 1)')
+    parser.add_argument('--k', type=int, default=1, help='pass@k 的 k 值 (默认: 1)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--adaptive', action='store_true', help='使用自适应采样与提前停止')
+    mode.add_argument('--batch', choices=['local', 'openai'], default=None,
+                      help='把全部生成请求作为一个离线 Batch 任务提交 (local: 本地替身)')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='自适应采样的样本总预算 (默认: 问题数 × max-samples)')
+    parser.add_argument('--round-size', type=int, default=2, help='每轮生成的样本数 (默认: 2)')
+    parser.add_argument('--min-samples', type=int, default=None,
+                        help='每个问题的最少样本数 (默认: k)')
+    parser.add_argument('--max-samples', type=int, default=20,
+                        help='每个问题的最多样本数 (默认: 20)')
+    parser.add_argument('--ci-width', type=float, default=0.2,
+                        help='置信区间宽度小于等于该值时停止 (默认: 0.2)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='置信水平 (默认: 0.95)')
+    parser.add_argument('--plus', action='store_true',
+                        help='使用 HumanEval+ 扩展测试集，测试输入分片并行验证')
+    parser.add_argument('--plus-file', default=None,
+                        help='EvalPlus 发布的 HumanEvalPlus.jsonl(.gz) (默认: 从 Hugging Face 加载)')
+    parser.add_argument('--shard-workers', type=int, default=None,
+                        help='分片验证的进程数 (默认: CPU 核数)')
+    parser.add_argument('--input-timeout', type=float, default=5.0,
+                        help='单个测试输入的超时时间，秒 (默认: 5.0)')
+    add_hedge_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    enable_from_args(args, "humaneval")
+
+    # --hedge: 之后的 generate_code 调用都走对冲客户端
+    global client
+    hedged = hedged_client_from_args(args, client, token_budget)
+    if hedged is not None:
+        client = hedged
+
     print("🚀 开始 HumanEval 代码生成能力测试")
     print()
     
     # 配置
-    NUM_PROBLEMS = 10  # 测试问题数量
-    TEMPERATURE = 0.2   # 温度参数
-    NUM_SAMPLES = 1     # 每个问题生成的样本数
+    NUM_PROBLEMS = args.problems  # 测试问题数量
+    TEMPERATURE = args.temperature if args.temperature is not None else (0.8 if args.adaptive else 0.2)
+    NUM_SAMPLES = args.samples    # 每个问题生成的样本数
     
     # 加载数据集
-    problems = load_humaneval_subset(NUM_PROBLEMS)
+    global plus_verifier
+    with stage("load"):
+        if args.plus:
+            from humaneval_plus import ShardedVerifier, load_humaneval_plus
+            problems = load_humaneval_plus(NUM_PROBLEMS, path=args.plus_file)
+            plus_verifier = ShardedVerifier(workers=args.shard_workers,
+                                            timeout_per_input=args.input_timeout)
+        else:
+            problems = load_humaneval_subset(NUM_PROBLEMS)
     
     if not problems:
         print("❌ 无法加载数据集，测试终止")
@@ -211,6 +553,48 @@ def main():
     
     print()
     
+    if args.adaptive:
+        results = run_adaptive(
+            problems,
+            k=args.k,
+            budget=args.budget,
+            round_size=args.round_size,
+            min_samples=args.min_samples,
+            max_samples=args.max_samples,
+            ci_width=args.ci_width,
+            confidence=args.confidence,
+            temperature=TEMPERATURE
+        )
+        used = sum(r["num_samples"] for r in results)
+        fixed = len(problems) * args.max_samples
+        print(f"\n{'='*60}")
+        for r in results:
+            estimate = f"{r['pass_at_k']:.3f}" if r["pass_at_k"] is not None else "  -  "
+            print(f"{r['task_id']:<16} n={r['num_samples']:>3} c={r['num_correct']:>3}  "
+                  f"pass@{args.k}={estimate}  [{r['ci_low']:.3f}, {r['ci_high']:.3f}]  {r['stopped']}")
+        print(f"\n📊 pass@{args.k}: {calculate_pass_at_k(results, k=args.k):.4f}")
+        print(f"💰 使用 {used} 个样本，固定采样 {args.max_samples} 个/题需要 {fixed} 个"
+              f"（节省 {1 - used / fixed:.1%}）" if fixed else "")
+        token_budget.history.save()
+        if plus_verifier is not None:
+            plus_verifier.close()
+        if hedged is not None:
+            hedged.print_summary()
+        save_results(results, "adaptive", vars(args))
+        print("\n✅ 测试完成!")
+        return
+    
+    # Batch 模式: 先一次性生成全部样本，再进入下面的逐题验证
+    batch_codes = None
+    if args.batch:
+        from batch_jobs import create_backend
+        batch_codes = generate_codes_batch(
+            problems,
+            create_backend(args.batch, client, token_budget),
+            temperature=TEMPERATURE,
+            num_samples=NUM_SAMPLES
+        )
+    
     # 测试每个问题
     results = []
     
@@ -225,12 +609,20 @@ def main():
         print()
         
         # 生成代码
-        codes = generate_code(
-            client,
-            problem["prompt"],
-            temperature=TEMPERATURE,
-            num_samples=NUM_SAMPLES
-        )
+        start = time.perf_counter()
+        with token_budget.track() as usage:
+            if batch_codes is not None:
+                codes = batch_codes[problem["task_id"]]
+            else:
+                codes = generate_code(
+                    client,
+                    problem["prompt"],
+                    temperature=TEMPERATURE,
+                    num_samples=NUM_SAMPLES,
+                    task_id=problem["task_id"]
+                )
+        latency = time.perf_counter() - start if batch_codes is None else None
+        tokens = usage["tokens"]
         
         # 测试生成的代码
         passed = False
@@ -241,11 +633,7 @@ def main():
                 continue
             
             print(f"\n测试样本 {j+1}/{len(codes)}...")
-            success, error = execute_code_with_test(
-                code,
-                problem["test"],
-                problem["entry_point"]
-            )
+            success, error = verify_code(code, problem)
             
             if success:
                 print("✅ 测试通过!")
@@ -256,17 +644,26 @@ def main():
                 error_msg = error
         
         # 记录结果
-        results.append({
-            "task_id": problem["task_id"],
-            "passed": passed,
-            "error": error_msg,
-            "samples_tested": len([c for c in codes if c is not None])
-        })  
+        results.append(HumanEvalResult(
+            task_id=problem["task_id"],
+            passed=passed,
+            error=error_msg,
+            samples_tested=len([c for c in codes if c is not None]),
+            latency=latency,
+            tokens=tokens,
+            code_hashes=tuple(blob_store.put(c) for c in codes if c is not None)
+        ))
         
         # 计算并显示 pass@k
         pass_at_1 = calculate_pass_at_k(results, k=1)
         print(f"\n📊 当前 pass@1: {pass_at_1:.4f}")
     
+    token_budget.history.save()
+    if plus_verifier is not None:
+        plus_verifier.close()
+    if hedged is not None:
+        hedged.print_summary()
+    save_results(results, "batch" if args.batch else "fixed", vars(args))
     print("\n✅ 测试完成!")
 
 
@@ -0,0 +1,117 @@
+"""
+工作队列单元测试 - 租约到期重投、迟到完成被拒绝、超过 max_attempts 标记失败
+
+SQLiteQueue 和 RedisQueue(MemoryRedis()) 跑同一组用例，不需要 API key 或 Redis 服务。
+
+使用方法:
+    python -m unittest test_work_queue -v
+"""
+
+import os
+import tempfile
+import unittest
+
+from work_queue import MemoryRedis, RedisQueue, SQLiteQueue
+
+QUEUE = "humaneval.generate"
+SWEEP = "sweep-test"
+
+
+class QueueContract:
+    """两个后端共用的用例；子类实现 make_queue"""
+
+    def make_queue(self, max_attempts=3):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.queue = self.make_queue()
+
+    def status(self, queue, task_id):
+        return next(r for r in queue.results(QUEUE, SWEEP) if r["id"] == task_id)
+
+    def test_expired_lease_is_redelivered(self):
+        task_id = self.queue.put(QUEUE, {"task_id": "HumanEval/0"}, SWEEP)
+        first = self.queue.lease(QUEUE, "w1", lease_seconds=0)
+        self.assertEqual(first["id"], task_id)
+        self.assertEqual(first["attempts"], 1)
+
+        second = self.queue.lease(QUEUE, "w2", lease_seconds=60)
+        self.assertEqual(second["id"], task_id)
+        self.assertEqual(second["attempts"], 2)
+        self.assertEqual(second["payload"], {"task_id": "HumanEval/0"})
+        self.assertIsNone(self.queue.lease(QUEUE, "w3", lease_seconds=60))
+
+    def test_live_lease_is_not_redelivered(self):
+        self.queue.put(QUEUE, {"task_id": "HumanEval/0"}, SWEEP)
+        self.assertIsNotNone(self.queue.lease(QUEUE, "w1", lease_seconds=60))
+        self.assertIsNone(self.queue.lease(QUEUE, "w2", lease_seconds=60))
+
+    def test_late_completion_is_rejected(self):
+        task_id = self.queue.put(QUEUE, {"task_id": "HumanEval/0"}, SWEEP)
+        self.queue.lease(QUEUE, "w1", lease_seconds=0)
+        self.queue.lease(QUEUE, "w2", lease_seconds=60)
+
+        follow_up = [("humaneval.verify", {"code": "late"})]
+        self.assertFalse(self.queue.heartbeat(task_id, "w1", 60))
+        self.assertFalse(self.queue.complete(task_id, "w1", {"codes": ["late"]}, follow_up))
+        self.assertFalse(self.queue.fail(task_id, "w1", "late error", retry_delay=0))
+        self.assertEqual(self.status(self.queue, task_id)["status"], "leased")
+        self.assertEqual(self.queue.results("humaneval.verify", SWEEP), [])
+
+        follow_up = [("humaneval.verify", {"code": "ok"})]
+        self.assertTrue(self.queue.complete(task_id, "w2", {"codes": ["ok"]}, follow_up))
+        row = self.status(self.queue, task_id)
+        self.assertEqual(row["status"], "done")
+        self.assertEqual(row["result"], {"codes": ["ok"]})
+        verify = self.queue.results("humaneval.verify", SWEEP)
+        self.assertEqual([r["payload"] for r in verify], [{"code": "ok"}])
+
+    def test_expired_leases_fail_after_max_attempts(self):
+        queue = self.make_queue(max_attempts=2)
+        task_id = queue.put(QUEUE, {"task_id": "HumanEval/0"}, SWEEP)
+        self.assertEqual(queue.lease(QUEUE, "w1", lease_seconds=0)["attempts"], 1)
+        self.assertEqual(queue.lease(QUEUE, "w2", lease_seconds=0)["attempts"], 2)
+
+        self.assertIsNone(queue.lease(QUEUE, "w3", lease_seconds=60))
+        row = self.status(queue, task_id)
+        self.assertEqual(row["status"], "failed")
+        self.assertEqual(row["error"], "lease expired")
+        self.assertEqual(queue.stats(SWEEP), {QUEUE: {"failed": 1}})
+
+    def test_failures_retry_until_max_attempts(self):
+        queue = self.make_queue(max_attempts=2)
+        task_id = queue.put(QUEUE, {"task_id": "HumanEval/0"}, SWEEP)
+
+        queue.lease(QUEUE, "w1", lease_seconds=60)
+        self.assertTrue(queue.fail(task_id, "w1", "rate limited", retry_delay=0))
+        self.assertEqual(self.status(queue, task_id)["status"], "pending")
+
+        retry = queue.lease(QUEUE, "w2", lease_seconds=60)
+        self.assertEqual(retry["attempts"], 2)
+        self.assertTrue(queue.fail(task_id, "w2", "rate limited again", retry_delay=0))
+        row = self.status(queue, task_id)
+        self.assertEqual(row["status"], "failed")
+        self.assertEqual(row["error"], "rate limited again")
+        self.assertIsNone(queue.lease(QUEUE, "w3", lease_seconds=60))
+
+
+class SQLiteQueueTest(QueueContract, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        super().setUp()
+
+    def make_queue(self, max_attempts=3):
+        path = os.path.join(self.tmp.name, f"queue-{max_attempts}.db")
+        return SQLiteQueue(path, max_attempts=max_attempts)
+
+
+class RedisQueueTest(QueueContract, unittest.TestCase):
+
+    def make_queue(self, max_attempts=3):
+        return RedisQueue(MemoryRedis(), max_attempts=max_attempts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+"""
+Token 预算 - 本地 token 计数、max_tokens 规划与 TPM / RPM 限流
+
+- 离线统计 prompt 的 token 数（安装了 tiktoken 时使用 tiktoken，否则使用启发式估计）
+- 根据 prompt 长度和每个任务的历史补全长度决定每个请求的 max_tokens，
+  代替固定的 512 / 500：长 prompt 不再被截断，短 prompt 不再多占配额
+- 令牌桶限流器按请求的预估 token 数（prompt + max_tokens × n）预留 TPM 配额，
+  响应返回后按 usage 中的实际用量退还多预留的部分
+
+配置（.env）:
+    LLM_TPM_LIMIT   每分钟 token 上限，不设置则不限流
+    LLM_RPM_LIMIT   每分钟请求上限，不设置则不限流
+"""
+
+import contextlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_HISTORY_FILE = os.path.join("reports", "token_history.json")
+
+# 每条消息的格式开销（role、分隔符等），与 OpenAI 的计算方式一致
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 2
+
+# 中日韩字符大多单独成 token
+CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+WORD_RE = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+
+class TokenCounter:
+    """本地 token 计数器"""
+
+    def __init__(self, encoding="cl100k_base"):
+        # Qwen 的分词器与 cl100k_base 不同，但数量级接近，足够用于预算
+        self.encoding = tiktoken.get_encoding(encoding) if tiktoken else None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return self._estimate(text)
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        """启发式估计: CJK 字符每字 1 个，英文单词约每 4 个字母 1 个，数字和符号各 1 个"""
+        cjk = len(CJK_RE.findall(text))
+        rest = CJK_RE.sub(" ", text)
+        tokens = 0
+        for piece in WORD_RE.findall(rest):
+            tokens += math.ceil(len(piece) / 4) if piece[0].isalpha() else 1
+        return cjk + tokens
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        """chat 消息列表的 prompt token 数"""
+        return sum(TOKENS_PER_MESSAGE + self.count(m.get("content") or "")
+                   for m in messages) + TOKENS_PER_REPLY
+
+
+class CompletionHistory:
+    """按任务记录历史补全长度，持久化到 JSON 文件"""
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE, keep=20):
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.lengths = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.lengths = json.load(f)
+
+    def record(self, key: str, completion_tokens: int):
+        with self._lock:
+            self.lengths.setdefault(key, []).append(int(completion_tokens))
+            self.lengths[key] = self.lengths[key][-self.keep:]
+
+    def estimate(self, key: str, quantile=0.9) -> Optional[int]:
+        """历史补全长度的分位数，没有历史时返回 None"""
+        with self._lock:
+            values = sorted(self.lengths.get(key, []))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(quantile * len(values)))]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.lengths, indent=2, ensure_ascii=False)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class TokenRateLimiter:
+    """
+    TPM / RPM 双令牌桶限流器（线程安全）
+
+    acquire 按预估 token 数预留配额，必要时阻塞等待；
+    settle 在拿到实际用量后退还多预留的部分。
+    """
+
+    def __init__(self, tpm: Optional[int] = None, rpm: Optional[int] = None):
+        self.tpm = tpm
+        self.rpm = rpm
+        self._tokens = float(tpm or 0)
+        self._requests = float(rpm or 0)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+
+    def acquire(self, tokens: int) -> float:
+        """预留 tokens 个 token 和 1 个请求，返回等待的秒数"""
+        if not self.tpm and not self.rpm:
+            return 0.0
+        # 单个请求超过整桶容量时按整桶计，否则永远等不到
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if wait <= 0:
+                    self._tokens -= tokens
+                    self._requests -= 1
+                    return time.monotonic() - start
+                self._cond.wait(wait)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """不等待地预留，配额不足时返回 False（用于可以放弃的请求，例如对冲请求）"""
+        if not self.tpm and not self.rpm:
+            return True
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        with self._cond:
+            self._refill()
+            if (self.tpm and self._tokens < tokens) or (self.rpm and self._requests < 1):
+                return False
+            self._tokens -= tokens
+            self._requests -= 1
+            return True
+
+    def settle(self, reserved: int, actual: int):
+        """按实际用量修正预留量（多退少补）"""
+        if not self.tpm:
+            return
+        with self._cond:
+            self._tokens = min(self.tpm, self._tokens + reserved - actual)
+            self._cond.notify_all()
+
+
+class TokenBudget:
+    """
+    请求级的 token 预算: 规划 max_tokens、限流、记录实际补全长度
+
+    参数:
+        context_window: 模型上下文长度
+        default_completion: 没有历史时的补全长度估计
+        min_tokens / max_tokens: max_tokens 的上下限
+        margin: 在历史分位数上乘的安全系数
+    """
+
+    def __init__(self, limiter: Optional[TokenRateLimiter] = None,
+                 history: Optional[CompletionHistory] = None, counter: Optional[TokenCounter] = None,
+                 context_window=32768, default_completion=512, min_tokens=128,
+                 max_tokens=4096, margin=1.3):
+        self.limiter = limiter or TokenRateLimiter()
+        self.history = history or CompletionHistory()
+        self.counter = counter or TokenCounter()
+        self.context_window = context_window
+        self.default_completion = default_completion
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.margin = margin
+        # 本进程累计使用的 token 数（按 usage.total_tokens）；多个线程同时 record，更新时加锁
+        self.used_tokens = 0
+        self._lock = threading.Lock()
+        # 每个线程当前打开的 track() 计数器
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "TokenBudget":
+        """从 LLM_TPM_LIMIT / LLM_RPM_LIMIT 环境变量创建"""
+        def limit(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+        return cls(limiter=TokenRateLimiter(limit("LLM_TPM_LIMIT"), limit("LLM_RPM_LIMIT")),
+                   **kwargs)
+
+    @contextlib.contextmanager
+    def track(self):
+        """
+        统计本线程在 with 块内的 token 用量，其它线程的并发请求不计入
+        
+            with token_budget.track() as usage:
+                call_llm(...)
+            usage["tokens"]
+        """
+        usage = {"tokens": 0}
+        meters = self._local.__dict__.setdefault("meters", [])
+        meters.append(usage)
+        try:
+            yield usage
+        finally:
+            meters.remove(usage)
+
+    def plan_max_tokens(self, messages: List[Dict], key: str) -> int:
+        """根据 prompt 长度和该任务的历史补全长度决定 max_tokens"""
+        prompt_tokens = self.counter.count_messages(messages)
+        past = self.history.estimate(key)
+        wanted = math.ceil(past * self.margin) if past is not None else self.default_completion
+        # prompt 越长，补全通常越长（实现越复杂），没有历史时按 prompt 长度放宽
+        if past is None:
+            wanted = max(wanted, prompt_tokens)
+        room = self.context_window - prompt_tokens
+        return max(1, min(self.max_tokens, room, max(self.min_tokens, wanted)))
+
+    def prepare(self, body: Dict, key: str) -> int:
+        """
+        为请求体填写 max_tokens（未指定时）并预留配额
+
+        返回:
+            int: 预留的 token 数，调用完成后传给 record
+        """
+        if body.get("max_tokens") is None:
+            body["max_tokens"] = self.plan_max_tokens(body["messages"], key)
+        reserved = self.counter.count_messages(body["messages"]) + body["max_tokens"] * body.get("n", 1)
+        self.limiter.acquire(reserved)
+        return reserved
+
+    def record(self, key: str, response, reserved: int, max_tokens: int):
+        """
+        记录实际用量并退还多预留的配额
+
+        被截断（finish_reason == "length"）的补全真实长度未知，按 max_tokens 的 2 倍记录，
+        下次同一任务会得到更大的 max_tokens。
+        """
+        usage = getattr(response, "usage", None)
+        choices = getattr(response, "choices", None) or []
+        if usage is not None:
+            with self._lock:
+                self.used_tokens += usage.total_tokens
+            for meter in getattr(self._local, "meters", ()):
+                meter["tokens"] += usage.total_tokens
+            self.limiter.settle(reserved, usage.total_tokens)
+            if choices:
+                per_choice = usage.completion_tokens / len(choices)
+                if any(getattr(c, "finish_reason", None) == "length" for c in choices):
+                    per_choice = max(per_choice, max_tokens * 2)
+                self.history.record(key, per_choice)
+
+    def release(self, reserved: int):
+        """请求失败时退还全部预留"""
+        self.limiter.settle(reserved, 0)
@@ -0,0 +1,958 @@
+"""
+工作队列 - 把生成、验证、评判拆成可以跨进程 / 跨机器运行的 worker
+
+原来的 main() 在一个循环里依次调用 API 生成、exec 验证、LLM 评判，只能用一台机器。
+这里每个阶段是一个队列，worker 独立地从队列领取任务（带租约），完成后把结果写回共享存储，
+并在同一个事务里把下游任务放入下一个队列:
+
+    HumanEval:  humaneval.generate ──> humaneval.verify
+    Jailbreak:  jailbreak.target   ──> jailbreak.judge
+
+API 受限的生成 worker 和 CPU 密集的验证 worker 可以分别在不同的机器上按需扩容。
+worker 崩溃后租约到期，任务重新投递给其它 worker；超过 max_attempts 次标记为失败。
+租约过期后迟到的完成会被拒绝，因此下游任务不会重复。
+
+队列后端（--queue，或环境变量 WORK_QUEUE_URL）:
+    reports/queue.db     SQLite（默认），同一台机器上任意多个进程；
+                         不要放在 NFS 等网络文件系统上，多机请使用 Redis
+    redis://host:6379/0  Redis 兼容服务（需要 redis 包），多台机器共享
+    memory://            进程内的 Redis 替身，只用于 run 子命令（单进程跑完全部阶段）
+
+使用方法:
+    python work_queue.py enqueue humaneval --problems 164 --samples 10
+    python work_queue.py worker generate --concurrency 8
+    python work_queue.py worker verify --processes 4
+    python work_queue.py status
+    python work_queue.py collect humaneval --sweep <sweep>
+    python work_queue.py --queue memory:// run jailbreak
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import profiling
+from hedging import add_hedge_arguments, create_hedged_client
+
+try:
+    import redis
+    from redis.exceptions import WatchError
+except ImportError:
+    redis = None
+
+    class WatchError(Exception):
+        """WATCH 的键在事务提交前被修改"""
+
+DEFAULT_QUEUE = os.path.join("reports", "queue.db")
+
+# 下游任务: (队列名, payload)
+FollowUps = List[Tuple[str, Dict]]
+
+
+# ========================================
+# SQLite 后端
+# ========================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id             TEXT PRIMARY KEY,
+    queue          TEXT NOT NULL,
+    sweep          TEXT NOT NULL,
+    payload        TEXT NOT NULL,
+    status         TEXT NOT NULL DEFAULT 'pending',
+    attempts       INTEGER NOT NULL DEFAULT 0,
+    owner          TEXT,
+    available_at   REAL NOT NULL,
+    result         TEXT,
+    error          TEXT,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks (queue, status, available_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_sweep ON tasks (sweep, queue, status);
+"""
+
+
+class SQLiteQueue:
+    """
+    SQLite 任务队列
+
+    pending 任务和租约已过期的 leased 任务都可以被领取；available_at 对 leased 任务表示租约到期时间。
+    每个线程使用自己的连接，领取在 BEGIN IMMEDIATE 事务中完成，多个进程不会领到同一个任务。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn, queue: str, payload: Dict, sweep: str) -> str:
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        conn.execute(
+            "INSERT INTO tasks (id, queue, sweep, payload, available_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (task_id, queue, sweep, json.dumps(payload, ensure_ascii=False), now, now))
+        return task_id
+
+    def put(self, queue: str, payload: Dict, sweep: str) -> str:
+        return self._insert(self._conn(), queue, payload, sweep)
+
+    def put_many(self, queue: str, payloads: List[Dict], sweep: str) -> List[str]:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return [self._insert(conn, queue, payload, sweep) for payload in payloads]
+
+    def lease(self, queue: str, worker: str, lease_seconds: float) -> Optional[Dict]:
+        """领取一个任务，没有可领取的任务时返回 None"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            while True:
+                row = conn.execute(
+                    "SELECT id, sweep, payload, attempts FROM tasks "
+                    "WHERE queue = ? AND status IN ('pending', 'leased') AND available_at <= ? "
+                    "ORDER BY available_at LIMIT 1", (queue, now)).fetchone()
+                if row is None:
+                    return None
+                task_id, sweep, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE tasks SET status = 'failed', owner = NULL, updated_at = ?, "
+                        "error = COALESCE(error, 'lease expired') WHERE id = ?", (now, task_id))
+                    continue
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', owner = ?, attempts = attempts + 1, "
+                    "available_at = ?, updated_at = ? WHERE id = ?",
+                    (worker, now + lease_seconds, now, task_id))
+                return {"id": task_id, "queue": queue, "sweep": sweep,
+                        "payload": json.loads(payload), "attempts": attempts + 1}
+
+    def heartbeat(self, task_id: str, worker: str, lease_seconds: float) -> bool:
+        """延长租约，租约已被别的 worker 接手时返回 False"""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE tasks SET available_at = ?, updated_at = ? "
+            "WHERE id = ? AND owner = ? AND status = 'leased'",
+            (now + lease_seconds, now, task_id, worker))
+        return cur.rowcount == 1
+
+    def complete(self, task_id: str, worker: str, result: Dict,
+                 follow_ups: Optional[FollowUps] = None) -> bool:
+        """写入结果并放入下游任务；租约已被别的 worker 接手时丢弃并返回 False"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, owner = NULL, "
+                "updated_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (json.dumps(result, ensure_ascii=False), time.time(), task_id, worker))
+            if cur.rowcount != 1:
+                return False
+            sweep = conn.execute("SELECT sweep FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+            for queue, payload in follow_ups or []:
+                self._insert(conn, queue, payload, sweep)
+            return True
+
+    def fail(self, task_id: str, worker: str, error: str, retry_delay=5.0) -> bool:
+        """记录失败；还有重试次数时延迟 retry_delay 秒后重新投递"""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+            "owner = NULL, available_at = ?, error = ?, updated_at = ? "
+            "WHERE id = ? AND owner = ? AND status = 'leased'",
+            (self.max_attempts, now + retry_delay, error, now, task_id, worker))
+        return cur.rowcount == 1
+
+    def stats(self, sweep: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """{队列: {状态: 任务数}}"""
+        sql = "SELECT queue, status, COUNT(*) FROM tasks"
+        params = ()
+        if sweep:
+            sql += " WHERE sweep = ?"
+            params = (sweep,)
+        stats = {}
+        for queue, status, count in self._conn().execute(sql + " GROUP BY queue, status", params):
+            stats.setdefault(queue, {})[status] = count
+        return stats
+
+    def results(self, queue: str, sweep: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT id, payload, status, result, error FROM tasks WHERE sweep = ? AND queue = ?",
+            (sweep, queue))
+        return [{"id": task_id, "payload": json.loads(payload), "status": status,
+                 "result": json.loads(result) if result else None, "error": error}
+                for task_id, payload, status, result, error in rows]
+
+    def sweeps(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT sweep FROM tasks GROUP BY sweep ORDER BY MIN(updated_at) DESC")
+        return [sweep for (sweep,) in rows]
+
+
+# ========================================
+# Redis 后端
+# ========================================
+
+class RedisQueue:
+    """
+    Redis 任务队列
+
+    键:
+        {prefix}:ready:{queue}   有序集合，分数为可领取时间（leased 任务为租约到期时间）
+        {prefix}:task:{id}       哈希: queue / sweep / payload / status / attempts / owner / result / error
+        {prefix}:sweep:{sweep}   该轮任务的 id 集合
+        {prefix}:sweeps          全部 sweep
+
+    领取、完成、失败都用 WATCH / MULTI 乐观事务，冲突时重试。
+    client 需要 decode_responses=True；MemoryRedis 可以代替真实的 Redis。
+    """
+
+    def __init__(self, client, prefix="llmq", max_attempts=3):
+        self.client = client
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+
+    def _ready(self, queue: str) -> str:
+        return f"{self.prefix}:ready:{queue}"
+
+    def _task(self, task_id: str) -> str:
+        return f"{self.prefix}:task:{task_id}"
+
+    def _queue_put(self, pipe, queue: str, payload: Dict, sweep: str) -> str:
+        task_id = uuid.uuid4().hex
+        pipe.hset(self._task(task_id), mapping={
+            "queue": queue, "sweep": sweep, "payload": json.dumps(payload, ensure_ascii=False),
+            "status": "pending", "attempts": 0,
+        })
+        pipe.sadd(f"{self.prefix}:sweep:{sweep}", task_id)
+        pipe.sadd(f"{self.prefix}:sweeps", sweep)
+        pipe.zadd(self._ready(queue), {task_id: time.time()})
+        return task_id
+
+    def put(self, queue: str, payload: Dict, sweep: str) -> str:
+        return self.put_many(queue, [payload], sweep)[0]
+
+    def put_many(self, queue: str, payloads: List[Dict], sweep: str) -> List[str]:
+        with self.client.pipeline() as pipe:
+            ids = [self._queue_put(pipe, queue, payload, sweep) for payload in payloads]
+            pipe.execute()
+        return ids
+
+    def _transaction(self, key: str, body):
+        """WATCH key 后执行 body(pipe)，被并发修改时重试"""
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    return body(pipe)
+                except WatchError:
+                    continue
+
+    def lease(self, queue: str, worker: str, lease_seconds: float) -> Optional[Dict]:
+        ready = self._ready(queue)
+
+        def claim(pipe):
+            now = time.time()
+            ids = pipe.zrangebyscore(ready, "-inf", now, start=0, num=1)
+            if not ids:
+                return None
+            task_id = ids[0]
+            task = pipe.hgetall(self._task(task_id))
+            attempts = int(task.get("attempts", 0))
+            pipe.multi()
+            if attempts >= self.max_attempts:
+                pipe.zrem(ready, task_id)
+                pipe.hset(self._task(task_id), mapping={
+                    "status": "failed", "owner": "", "error": task.get("error") or "lease expired"})
+                pipe.execute()
+                return "retry"
+            pipe.zadd(ready, {task_id: now + lease_seconds})
+            pipe.hset(self._task(task_id), mapping={
+                "status": "leased", "owner": worker, "attempts": attempts + 1})
+            pipe.execute()
+            return {"id": task_id, "queue": queue, "sweep": task["sweep"],
+                    "payload": json.loads(task["payload"]), "attempts": attempts + 1}
+
+        while True:
+            task = self._transaction(ready, claim)
+            if task != "retry":
+                return task
+
+    def _owned(self, pipe, task_id: str, worker: str) -> Optional[Dict]:
+        task = pipe.hgetall(self._task(task_id))
+        if task.get("owner") != worker or task.get("status") != "leased":
+            return None
+        return task
+
+    def heartbeat(self, task_id: str, worker: str, lease_seconds: float) -> bool:
+        def extend(pipe):
+            task = self._owned(pipe, task_id, worker)
+            if task is None:
+                return False
+            pipe.multi()
+            pipe.zadd(self._ready(task["queue"]), {task_id: time.time() + lease_seconds})
+            pipe.execute()
+            return True
+        return self._transaction(self._task(task_id), extend)
+
+    def complete(self, task_id: str, worker: str, result: Dict,
+                 follow_ups: Optional[FollowUps] = None) -> bool:
+        def finish(pipe):
+            task = self._owned(pipe, task_id, worker)
+            if task is None:
+                return False
+            pipe.multi()
+            pipe.zrem(self._ready(task["queue"]), task_id)
+            pipe.hset(self._task(task_id), mapping={
+                "status": "done", "owner": "", "error": "",
+                "result": json.dumps(result, ensure_ascii=False)})
+            for queue, payload in follow_ups or []:
+                self._queue_put(pipe, queue, payload, task["sweep"])
+            pipe.execute()
+            return True
+        return self._transaction(self._task(task_id), finish)
+
+    def fail(self, task_id: str, worker: str, error: str, retry_delay=5.0) -> bool:
+        def record(pipe):
+            task = self._owned(pipe, task_id, worker)
+            if task is None:
+                return False
+            retry = int(task["attempts"]) < self.max_attempts
+            pipe.multi()
+            if retry:
+                pipe.zadd(self._ready(task["queue"]), {task_id: time.time() + retry_delay})
+            else:
+                pipe.zrem(self._ready(task["queue"]), task_id)
+            pipe.hset(self._task(task_id), mapping={
+                "status": "pending" if retry else "failed", "owner": "", "error": error})
+            pipe.execute()
+            return True
+        return self._transaction(self._task(task_id), record)
+
+    def _tasks(self, sweep: str):
+        for task_id in self.client.smembers(f"{self.prefix}:sweep:{sweep}"):
+            yield task_id, self.client.hgetall(self._task(task_id))
+
+    def stats(self, sweep: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        stats = {}
+        for name in [sweep] if sweep else self.sweeps():
+            for _, task in self._tasks(name):
+                counts = stats.setdefault(task["queue"], {})
+                counts[task["status"]] = counts.get(task["status"], 0) + 1
+        return stats
+
+    def results(self, queue: str, sweep: str) -> List[Dict]:
+        return [{"id": task_id, "payload": json.loads(task["payload"]), "status": task["status"],
+                 "result": json.loads(task["result"]) if task.get("result") else None,
+                 "error": task.get("error") or None}
+                for task_id, task in self._tasks(sweep) if task["queue"] == queue]
+
+    def sweeps(self) -> List[str]:
+        return sorted(self.client.smembers(f"{self.prefix}:sweeps"))
+
+
+class MemoryRedis:
+    """
+    进程内的 Redis 替身，只实现 RedisQueue 用到的命令（含 WATCH / MULTI / EXEC）
+
+    行为与 decode_responses=True 的 redis.Redis 一致，可在没有 Redis 服务时运行和调试 RedisQueue。
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def _touch(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            fields = dict(mapping or {})
+            if key is not None:
+                fields[key] = value
+            self._data.setdefault(name, {}).update({k: str(v) for k, v in fields.items()})
+            self._touch(name)
+            return len(fields)
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._data.get(name, {}))
+
+    def sadd(self, name, *values):
+        with self._lock:
+            self._data.setdefault(name, set()).update(values)
+            self._touch(name)
+            return len(values)
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._data.get(name, set()))
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            self._data.setdefault(name, {}).update({k: float(v) for k, v in mapping.items()})
+            self._touch(name)
+            return len(mapping)
+
+    def zrem(self, name, *values):
+        with self._lock:
+            zset = self._data.get(name, {})
+            removed = sum(zset.pop(v, None) is not None for v in values)
+            self._touch(name)
+            return removed
+
+    def zrangebyscore(self, name, min, max, start=None, num=None):
+        with self._lock:
+            low, high = float(min), float(max)
+            members = sorted((score, member) for member, score in self._data.get(name, {}).items()
+                             if low <= score <= high)
+            members = [member for _, member in members]
+            if start is not None:
+                members = members[start:start + num if num is not None else None]
+            return members
+
+    def pipeline(self):
+        return _MemoryPipeline(self)
+
+
+class _MemoryPipeline:
+    """MemoryRedis 的 pipeline: watch 之后立即执行命令，multi 之后排队到 execute"""
+
+    def __init__(self, db: MemoryRedis):
+        self.db = db
+        self._watched = {}
+        self._queued = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def reset(self):
+        self._watched = {}
+        self._queued = None
+
+    def watch(self, *names):
+        with self.db._lock:
+            for name in names:
+                self._watched[name] = self.db._versions.get(name, 0)
+
+    def multi(self):
+        self._queued = []
+
+    def __getattr__(self, command):
+        method = getattr(self.db, command)
+        if self._queued is None and self._watched:
+            return method
+
+        def queue(*args, **kwargs):
+            if self._queued is None:
+                self._queued = []
+            self._queued.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.db._lock:
+            if any(self.db._versions.get(name, 0) != version
+                   for name, version in self._watched.items()):
+                self.reset()
+                raise WatchError("watched key changed")
+            results = [method(*args, **kwargs) for method, args, kwargs in self._queued or []]
+        self.reset()
+        return results
+
+
+def open_queue(url: Optional[str] = None, max_attempts=3):
+    """按 URL 打开队列: SQLite 文件路径 / redis://... / memory://"""
+    url = url or os.getenv("WORK_QUEUE_URL") or DEFAULT_QUEUE
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if redis is None:
+            raise RuntimeError("使用 Redis 队列需要安装 redis 包: pip install redis")
+        return RedisQueue(redis.Redis.from_url(url, decode_responses=True),
+                          max_attempts=max_attempts)
+    if url == "memory://":
+        return RedisQueue(MemoryRedis(), max_attempts=max_attempts)
+    return SQLiteQueue(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url,
+                       max_attempts=max_attempts)
+
+
+# ========================================
+# 各阶段的处理函数: payload -> (结果, 下游任务)
+# ========================================
+
+def _llm_text(text: str) -> str:
+    """call_llm 出错时返回 "[Error: ...]"，在队列里转成异常以便重新投递"""
+    if text.startswith("[Error:"):
+        raise RuntimeError(text)
+    return text
+
+
+def handle_generate(payload: Dict) -> Tuple[Dict, FollowUps]:
+    from test_humaneval import client, generate_code
+    problem = payload["problem"]
+    start = time.perf_counter()
+    codes = generate_code(client, problem["prompt"], temperature=payload["temperature"],
+                          num_samples=payload["num_samples"], task_id=problem["task_id"])
+    if all(code is None for code in codes):
+        raise RuntimeError("Code generation failed")
+    follow_ups = [("humaneval.verify", {"problem": problem, "sample": j, "code": code})
+                  for j, code in enumerate(codes)]
+    return {"samples": len(codes), "latency": time.perf_counter() - start}, follow_ups
+
+
+def handle_verify(payload: Dict) -> Tuple[Dict, FollowUps]:
+    from test_humaneval import verify_code
+    if payload["code"] is None:
+        return {"passed": False, "valid": False, "error": "Code generation failed"}, []
+    passed, error = verify_code(payload["code"], payload["problem"])
+    return {"passed": passed, "valid": True, "error": error}, []
+
+
+def handle_target(payload: Dict) -> Tuple[Dict, FollowUps]:
+    from test_jailbreak import call_llm, client
+    start = time.perf_counter()
+    response = _llm_text(call_llm(client, payload["prompt"], key=f"target:{payload['strategy']}"))
+    latency = time.perf_counter() - start
+    return {"latency": latency}, [("jailbreak.judge", dict(payload, response=response, latency=latency))]
+
+
+def handle_judge(payload: Dict) -> Tuple[Dict, FollowUps]:
+    from test_jailbreak import build_judge_prompt, call_llm, client, parse_judge_response
+    judge_prompt = build_judge_prompt(payload["response"], payload["question"])
+    is_harmful, reason = parse_judge_response(_llm_text(call_llm(client, judge_prompt, key="judge")))
+    return {"is_harmful": is_harmful, "reason": reason}, []
+
+
+# 阶段 -> (队列名, 处理函数)
+STAGES = {
+    "generate": ("humaneval.generate", handle_generate),
+    "verify": ("humaneval.verify", handle_verify),
+    "target": ("jailbreak.target", handle_target),
+    "judge": ("jailbreak.judge", handle_judge),
+}
+
+SUITE_STAGES = {
+    "humaneval": ["generate", "verify"],
+    "jailbreak": ["target", "judge"],
+}
+
+
+# ========================================
+# worker
+# ========================================
+
+class _Heartbeat:
+    """处理任务期间定期延长租约"""
+
+    def __init__(self, queue, task_id: str, worker: str, lease_seconds: float):
+        self.queue, self.task_id, self.worker = queue, task_id, worker
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.task_id, self.worker, self.lease_seconds):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _worker_loop(queue, stage: str, worker: str, lease_seconds: float, poll_interval: float,
+                 idle_exit: Optional[float], stop: threading.Event, counts: Dict):
+    queue_name, handler = STAGES[stage]
+    idle_since = time.monotonic()
+    while not stop.is_set():
+        with profiling.stage("queue"):
+            task = queue.lease(queue_name, worker, lease_seconds)
+        if task is None:
+            if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                return
+            stop.wait(poll_interval)
+            continue
+        idle_since = time.monotonic()
+        try:
+            with _Heartbeat(queue, task["id"], worker, lease_seconds):
+                result, follow_ups = handler(task["payload"])
+        except Exception as e:
+            with profiling.stage("queue"):
+                queue.fail(task["id"], worker, f"{type(e).__name__}: {e}")
+            counts["failed"] += 1
+            print(f"   ❌ [{stage}] {task['id'][:8]} 第 {task['attempts']} 次失败: {e}")
+            continue
+        with profiling.stage("queue"):
+            completed = queue.complete(task["id"], worker, result, follow_ups)
+        if completed:
+            counts["done"] += 1
+        else:
+            counts["lost"] += 1
+            print(f"   ⚠️ [{stage}] {task['id'][:8]} 租约已过期，结果被丢弃")
+
+
+def run_worker(queue, stage: str, concurrency=1, lease_seconds=300.0, poll_interval=1.0,
+               idle_exit: Optional[float] = None, stop: Optional[threading.Event] = None) -> Dict:
+    """
+    运行一个阶段的 worker（concurrency 个线程），直到 stop 被设置或空闲超过 idle_exit 秒
+
+    返回:
+        Dict: {"done", "failed", "lost"} 任务计数
+    """
+    stop = stop or threading.Event()
+    counts = {"done": 0, "failed": 0, "lost": 0}
+    prefix = f"{socket.gethostname()}:{os.getpid()}:{stage}"
+    threads = [threading.Thread(target=_worker_loop, daemon=True,
+                                args=(queue, stage, f"{prefix}:{i}", lease_seconds, poll_interval,
+                                      idle_exit, stop, counts))
+               for i in range(concurrency)]
+    print(f"👷 {prefix}: {concurrency} 个线程，队列 {STAGES[stage][0]}")
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+    return counts
+
+
+def use_hedging(quantile=0.95, budget=0.1, initial_delay=10.0, max_ratio=3.0):
+    """让本进程的 generate / target / judge 阶段都走同一个对冲客户端"""
+    import test_humaneval
+    import test_jailbreak
+
+    hedged = create_hedged_client(test_humaneval.client, quantile, budget, initial_delay,
+                                  test_humaneval.token_budget, max_ratio)
+    test_humaneval.client = test_jailbreak.client = hedged
+    return hedged
+
+
+def _worker_process(url, max_attempts, stage, concurrency, lease_seconds, poll_interval,
+                    idle_exit, shard_workers, profile=None, hedge=None):
+    # 每个 worker 进程单独剖析，multiprocessing 子进程退出时不执行 atexit，所以显式写出
+    if profile:
+        mode, interval, memory_frames = profile
+        profiling.enable_profiling(f"worker-{stage}", mode, interval, memory_frames, at_exit=False)
+    if shard_workers:
+        import test_humaneval
+        from humaneval_plus import ShardedVerifier
+        # 同一进程的 --concurrency 个线程共用一个验证器：每次 verify() 使用独立的取消事件
+        test_humaneval.plus_verifier = ShardedVerifier(workers=shard_workers)
+    hedged = use_hedging(*hedge) if hedge else None
+    counts = run_worker(open_queue(url, max_attempts), stage, concurrency, lease_seconds,
+                        poll_interval, idle_exit)
+    print(f"✅ worker {os.getpid()} 退出: 完成 {counts['done']}，失败 {counts['failed']}，"
+          f"丢弃 {counts['lost']}")
+    if hedged is not None:
+        hedged.print_summary()
+    profiling.finish_profiling()
+
+
+# ========================================
+# 入队与汇总
+# ========================================
+
+def enqueue_humaneval(queue, problems: List[Dict], num_samples=1, temperature=0.2,
+                      sweep: Optional[str] = None) -> str:
+    sweep = sweep or f"humaneval-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    queue.put_many("humaneval.generate", [
+        {"problem": problem, "num_samples": num_samples, "temperature": temperature}
+        for problem in problems], sweep)
+    return sweep
+
+
+def enqueue_jailbreak(queue, strategies, questions: List[Dict], sweep: Optional[str] = None) -> str:
+    sweep = sweep or f"jailbreak-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    payloads = []
+    for q in questions:
+        payloads.append({"question": q["question"], "category": q["category"],
+                         "strategy": "baseline", "prompt": q["question"]})
+        for strategy in strategies:
+            payloads.append({"question": q["question"], "category": q["category"],
+                             "strategy": strategy.name, "prompt": strategy.apply(q["question"])})
+    queue.put_many("jailbreak.target", payloads, sweep)
+    return sweep
+
+
+def collect_humaneval(queue, sweep: str) -> List[Dict]:
+    """
+    把验证结果汇总为与自适应模式相同格式的逐题结果
+
+    每个入队的问题都有一条结果: 生成失败（或还没完成）的问题记为未通过，不会从分母中消失。
+    """
+    per_task = {}
+    for task in queue.results("humaneval.generate", sweep):
+        task_id = task["payload"]["problem"]["task_id"]
+        result = task["result"] or {}
+        per_task[task_id] = {"task_id": task_id, "num_samples": 0, "num_correct": 0, "error": None,
+                             "latency": result.get("latency"), "tokens": None}
+        if task["status"] == "failed":
+            per_task[task_id]["error"] = f"Code generation failed: {task['error']}"
+        elif task["status"] != "done":
+            per_task[task_id]["error"] = "Code generation not finished"
+    for task in queue.results("humaneval.verify", sweep):
+        r = per_task[task["payload"]["problem"]["task_id"]]
+        result = task["result"] or {"passed": False, "valid": True, "error": task["error"]}
+        if result.get("valid", True):
+            r["num_samples"] += 1
+            r["num_correct"] += int(result["passed"])
+        if not result["passed"]:
+            r["error"] = result["error"]
+    for r in per_task.values():
+        r["passed"] = r["num_correct"] > 0
+    failed = sum(1 for r in per_task.values() if r["num_samples"] == 0)
+    if failed:
+        print(f"⚠️ {failed} 个问题没有可验证的代码（生成失败或未完成），按未通过计入")
+    return sorted(per_task.values(), key=lambda r: r["task_id"])
+
+
+def collect_jailbreak(queue, sweep: str) -> List[Dict]:
+    """
+    把评判结果汇总为 run_jailbreak_test 的结果格式
+
+    失败的目标模型调用和评判与 is_harmful_response 出错时一样按有害计入，并打印数量，
+    不会悄悄缩小分母。
+    """
+    from test_jailbreak import default_strategies, make_result, use_template_dictionary
+    use_template_dictionary(default_strategies())
+    results = []
+    dropped = {"target": 0, "judge": 0}
+
+    def failed_result(p, response, reason):
+        return make_result(p["question"], p["category"], p["strategy"], p["prompt"], response,
+                           True, reason, p.get("latency"))
+
+    for task in queue.results("jailbreak.target", sweep):
+        if task["status"] == "failed":
+            dropped["target"] += 1
+            results.append(failed_result(task["payload"], f"[Error: {task['error']}]",
+                                         f"目标模型调用失败: {task['error']}"))
+    for task in queue.results("jailbreak.judge", sweep):
+        p = task["payload"]
+        if task["result"] is None:
+            if task["status"] == "failed":
+                dropped["judge"] += 1
+                results.append(failed_result(p, p["response"], f"评判过程发生错误: {task['error']}"))
+            continue
+        results.append(make_result(p["question"], p["category"], p["strategy"], p["prompt"],
+                                   p["response"], task["result"]["is_harmful"],
+                                   task["result"]["reason"], p.get("latency")))
+    if dropped["target"] or dropped["judge"]:
+        print(f"⚠️ 目标模型调用失败 {dropped['target']} 个，评判失败 {dropped['judge']} 个，"
+              f"均按有害计入")
+    return results
+
+
+def report_sweep(queue, suite: str, sweep: str, config: Optional[Dict] = None):
+    """打印汇总、生成报告并写入结果仓库"""
+    stats = queue.stats(sweep)
+    unfinished = sum(count for counts in stats.values()
+                     for status, count in counts.items() if status in ("pending", "leased"))
+    if unfinished:
+        print(f"⚠️ {sweep} 还有 {unfinished} 个任务未完成，汇总结果不完整")
+    with profiling.stage("report"):
+        if suite == "humaneval":
+            from results_db import record_humaneval_run
+            from test_humaneval import MODEL, calculate_pass_at_k
+            results = collect_humaneval(queue, sweep)
+            print(f"📊 {len(results)} 个问题，pass@1: {calculate_pass_at_k(results, k=1):.4f}")
+            run_id = record_humaneval_run(results, MODEL, mode="queue", config=config)
+        else:
+            from results_db import record_jailbreak_run
+            from test_jailbreak import MODEL, generate_security_report
+            results = collect_jailbreak(queue, sweep)
+            generate_security_report(results)
+            run_id = record_jailbreak_run(results, MODEL, mode="queue", config=config)
+    print(f"🗄️ 结果已写入 reports/results.db（运行 #{run_id}）")
+
+
+def print_status(queue, sweep: Optional[str] = None):
+    stats = queue.stats(sweep)
+    if not stats:
+        print("队列为空")
+    for name, counts in sorted(stats.items()):
+        print(f"{name:<22} " + "  ".join(f"{status} {counts.get(status, 0):>5}"
+                                          for status in ("pending", "leased", "done", "failed")))
+
+
+# ========================================
+# 命令行
+# ========================================
+
+def _enqueue(queue, args) -> str:
+    if args.suite == "humaneval":
+        if args.plus:
+            from humaneval_plus import load_humaneval_plus
+            problems = load_humaneval_plus(args.problems, path=args.plus_file)
+        else:
+            from test_humaneval import load_humaneval_subset
+            problems = load_humaneval_subset(args.problems)
+        sweep = enqueue_humaneval(queue, problems, args.samples, args.temperature, args.sweep)
+    else:
+        from test_jailbreak import default_strategies, load_sensitive_questions
+        sweep = enqueue_jailbreak(queue, default_strategies(), load_sensitive_questions(), args.sweep)
+    print(f"📥 已入队 sweep {sweep}")
+    return sweep
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='生成 / 验证 / 评判的分布式工作队列',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python work_queue.py enqueue humaneval --problems 164 --samples 10
+  python work_queue.py worker generate --concurrency 8
+  python work_queue.py worker verify --processes 4
+  python work_queue.py --queue redis://10.0.0.5:6379/0 worker judge --concurrency 4
+  python work_queue.py status
+  python work_queue.py collect humaneval --sweep humaneval-20250101-120000-abc123
+  python work_queue.py --queue memory:// run jailbreak
+  python work_queue.py --profile worker verify --processes 4
+  python work_queue.py --hedge worker target --concurrency 8
+        '''
+    )
+    parser.add_argument('--queue', default=None,
+                        help='队列: SQLite 路径 / redis://... / memory:// '
+                             '(默认: $WORK_QUEUE_URL 或 reports/queue.db)')
+    parser.add_argument('--max-attempts', type=int, default=3, help='每个任务最多尝试次数 (默认: 3)')
+    profiling.add_profile_arguments(parser)
+    add_hedge_arguments(parser)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_enqueue_args(p):
+        p.add_argument('suite', choices=['humaneval', 'jailbreak'])
+        p.add_argument('--sweep', default=None, help='sweep 名称 (默认: 自动生成)')
+        p.add_argument('--problems', type=int, default=10, help='HumanEval 问题数量 (默认: 10)')
+        p.add_argument('--samples', type=int, default=1, help='每个问题的样本数 (默认: 1)')
+        p.add_argument('--temperature', type=float, default=0.2, help='温度参数 (默认: 0.2)')
+        p.add_argument('--plus', action='store_true', help='使用 HumanEval+ 扩展测试集')
+        p.add_argument('--plus-file', default=None, help='EvalPlus 发布的 HumanEvalPlus.jsonl(.gz)')
+
+    def add_worker_args(p):
+        p.add_argument('--concurrency', type=int, default=1, help='每个进程的线程数 (默认: 1)')
+        p.add_argument('--lease', type=float, default=300.0, help='租约时长，秒 (默认: 300)')
+        p.add_argument('--poll', type=float, default=1.0, help='队列为空时的轮询间隔，秒 (默认: 1)')
+        p.add_argument('--shard-workers', type=int, default=None,
+                       help='验证 HumanEval+ 时每个进程的分片进程数 (默认: 不分片)')
+
+    p = sub.add_parser('enqueue', help='把一轮测试放入队列')
+    add_enqueue_args(p)
+
+    p = sub.add_parser('worker', help='运行某个阶段的 worker')
+    p.add_argument('stage', choices=list(STAGES))
+    p.add_argument('--processes', type=int, default=1,
+                   help='worker 进程数，CPU 密集的 verify 阶段用多进程 (默认: 1)')
+    p.add_argument('--idle-exit', type=float, default=None, help='空闲超过该秒数后退出 (默认: 不退出)')
+    add_worker_args(p)
+
+    p = sub.add_parser('status', help='各队列的任务数')
+    p.add_argument('--sweep', default=None)
+
+    p = sub.add_parser('collect', help='汇总一轮测试的结果并写入报告和结果仓库')
+    p.add_argument('suite', choices=['humaneval', 'jailbreak'])
+    p.add_argument('--sweep', default=None, help='sweep 名称 (默认: 最近一轮)')
+
+    p = sub.add_parser('run', help='入队后在本进程内运行全部阶段直到完成，再汇总')
+    add_enqueue_args(p)
+    add_worker_args(p)
+
+    args = parser.parse_args()
+    queue = open_queue(args.queue, args.max_attempts)
+
+    if args.command != 'worker':
+        profiling.enable_from_args(args, f"queue-{args.command}")
+
+    if args.command == 'enqueue':
+        _enqueue(queue, args)
+
+    elif args.command == 'worker':
+        profile = (args.profile, args.profile_interval, args.profile_memory_frames) \
+            if args.profile else None
+        hedge = (args.hedge_quantile, args.hedge_budget, args.hedge_initial_delay,
+                 args.hedge_max_ratio) \
+            if args.hedge else None
+        worker_args = (args.queue, args.max_attempts, args.stage, args.concurrency, args.lease,
+                       args.poll, args.idle_exit, args.shard_workers, profile, hedge)
+        if args.processes == 1:
+            _worker_process(*worker_args)
+        else:
+            processes = [multiprocessing.Process(target=_worker_process, args=worker_args)
+                         for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+    elif args.command == 'status':
+        print_status(queue, args.sweep)
+
+    elif args.command == 'collect':
+        sweep = args.sweep or next((s for s in queue.sweeps() if s.startswith(args.suite)), None)
+        if sweep is None:
+            print(f"❌ 队列中没有 {args.suite} 的 sweep")
+            return
+        report_sweep(queue, args.suite, sweep, config={"sweep": sweep})
+
+    elif args.command == 'run':
+        if args.shard_workers:
+            import test_humaneval
+            from humaneval_plus import ShardedVerifier
+            # 各阶段的线程共用一个验证器：每次 verify() 使用独立的取消事件
+            test_humaneval.plus_verifier = ShardedVerifier(workers=args.shard_workers)
+        hedged = use_hedging(args.hedge_quantile, args.hedge_budget, args.hedge_initial_delay,
+                             args.hedge_max_ratio) \
+            if args.hedge else None
+        sweep = _enqueue(queue, args)
+        stop = threading.Event()
+        workers = [threading.Thread(target=run_worker, daemon=True,
+                                    args=(queue, stage, args.concurrency, args.lease, args.poll),
+                                    kwargs={"stop": stop})
+                   for stage in SUITE_STAGES[args.suite]]
+        for worker in workers:
+            worker.start()
+        # 各阶段的 worker 一直运行到本轮没有 pending / leased 任务
+        while any(status in counts for counts in queue.stats(sweep).values()
+                  for status in ("pending", "leased")):
+            time.sleep(args.poll)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        print_status(queue, sweep)
+        if hedged is not None:
+            hedged.print_summary()
+        report_sweep(queue, args.suite, sweep, config=vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,87 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
+import json
+import os
+import sys
 import time
+from web_timing import REPORT_DIR, WebTimer, timed_step
+
+# 一次 execute_script 往返中收集多个元素的状态（是否存在、是否可见、文本）
+SNAPSHOT_SCRIPT = """
+const specs = arguments[0];
+const snapshot = {};
+for (const [key, spec] of Object.entries(specs)) {
+    let el = null;
+    if (spec.by === 'id') {
+        el = document.getElementById(spec.value);
+    } else if (spec.by === 'class') {
+        el = document.getElementsByClassName(spec.value)[0] || null;
+    } else {
+        el = document.querySelector(spec.value);
+    }
+    if (!el) {
+        snapshot[key] = {present: false, displayed: false, text: null};
+        continue;
+    }
+    const style = window.getComputedStyle(el);
+    const displayed = style.display !== 'none' && style.visibility !== 'hidden'
+        && el.getClientRects().length > 0;
+    snapshot[key] = {present: true, displayed: displayed, text: el.innerText.trim()};
+}
+return snapshot;
+"""
+
+# Selenium 定位方式到快照脚本定位方式的映射
+SNAPSHOT_LOCATORS = {
+    By.ID: 'id',
+    By.CLASS_NAME: 'class',
+    By.CSS_SELECTOR: 'css',
+}
+
+# 商品目录文件：[{"name": 商品名, "button_id": 添加按钮 id}, ...]
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json')
+
+# 一次 execute_script 往返中抓取商品列表页上的全部商品及其添加按钮
+SCRAPE_CATALOG_SCRIPT = """
+return Array.from(document.querySelectorAll('.inventory_item')).map(item => {
+    const name = item.querySelector('.inventory_item_name');
+    const button = item.querySelector('button[id^="add-to-cart-"]');
+    return {name: name ? name.innerText.trim() : null, button_id: button ? button.id : null};
+}).filter(entry => entry.name && entry.button_id);
+"""
+
+
+def load_catalog(path=CATALOG_FILE):
+    """从目录文件读取 (商品名, 按钮 id) 列表，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [(entry['name'], entry['button_id']) for entry in json.load(f)]
+
+
+def save_catalog(items, path=CATALOG_FILE):
+    """把 (商品名, 按钮 id) 列表写回目录文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([{'name': name, 'button_id': button_id} for name, button_id in items],
+                  f, indent=2, ensure_ascii=False)
+
+
+# 目录文件缺失或为空时使用的内置商品列表，保证 test_add_to_cart 始终会运行
+DEFAULT_CATALOG = [
+    ("Sauce Labs Backpack", "add-to-cart-sauce-labs-backpack"),
+    ("Sauce Labs Bike Light", "add-to-cart-sauce-labs-bike-light"),
+    ("Sauce Labs Bolt T-Shirt", "add-to-cart-sauce-labs-bolt-t-shirt"),
+    ("Sauce Labs Fleece Jacket", "add-to-cart-sauce-labs-fleece-jacket"),
+    ("Sauce Labs Onesie", "add-to-cart-sauce-labs-onesie"),
+    ("Test.allTheThings() T-Shirt (Red)", "add-to-cart-test.allthethings()-t-shirt-(red)"),
+]
+
+# 参数化用例在导入时从目录文件生成
+FILE_CATALOG = load_catalog()
+if not FILE_CATALOG:
+    print(f"⚠️ 商品目录 {CATALOG_FILE} 缺失或为空，使用内置商品列表")
+CATALOG = FILE_CATALOG or DEFAULT_CATALOG
 
 class ShoppingSystemTests(unittest.TestCase):
 
@@ -15,17 +95,31 @@ class ShoppingSystemTests(unittest.TestCase):
         cls.driver = webdriver.Edge()  # 可以替换为其他驱动，如Firefox等
         cls.driver.maximize_window()
         cls.driver.implicitly_wait(5)  # 隐式等待，避免页面加载问题
+        # 记录每条 WebDriver 命令、步骤和 sleep 的耗时
+        # 只替换本模块的 time 引用，WebDriverWait 的轮询不计入 sleep
+        cls.timer = WebTimer(cls.driver)
+        cls.timer.install(sys.modules[__name__])
+        # tearDownClass 之前出错时同样恢复
+        cls.addClassCleanup(cls.timer.uninstall)
 
     def setUp(self):
         """每个测试前执行，打开购物网站主页"""
-        self.driver.get("https://www.saucedemo.com/")
+        self.timer.begin_test(self._testMethodName)
+        with self.timer.step("open_home"):
+            self.driver.get("https://www.saucedemo.com/")
+
+    def tearDown(self):
+        """每个测试后结束本测试的耗时记录"""
+        self.timer.end_test()
     
+    @timed_step
     def login(self, username, password):
         """封装登录功能，供多个测试使用"""
         self.driver.find_element(By.ID, 'user-name').send_keys(username)
         self.driver.find_element(By.ID, 'password').send_keys(password)
         self.driver.find_element(By.ID, 'login-button').click()
         
+    @timed_step
     def reset_state(self):
         """重置测试状态，确保每个测试之间的独立性"""
         self.driver.get("https://www.saucedemo.com/inventory.html")
@@ -33,11 +127,55 @@ class ShoppingSystemTests(unittest.TestCase):
         reset_link = self.driver.find_element(By.ID, 'reset_sidebar_link')
         reset_link.click()
         
+    @timed_step
     def add_to_cart(self, button_id):
         """封装添加商品到购物车功能，供多个测试使用"""
         add_to_cart_button = self.driver.find_element(By.ID, button_id)
         add_to_cart_button.click()
 
+    @timed_step
+    def scrape_catalog(self):
+        """从商品列表页一次性抓取 (商品名, 按钮 id)，并写入目录文件供下次参数化使用"""
+        self.driver.get("https://www.saucedemo.com/inventory.html")
+        items = [(entry['name'], entry['button_id'])
+                 for entry in self.driver.execute_script(SCRAPE_CATALOG_SCRIPT)]
+        if items:
+            save_catalog(items)
+        return items
+
+    @timed_step
+    def snapshot(self, specs, require=(), timeout=5):
+        """
+        通过一次 execute_script 往返获取页面上多个元素的状态快照
+
+        Args:
+            specs: {名称: (By.ID / By.CLASS_NAME / By.CSS_SELECTOR, 值)}
+            require: 必须存在的元素名称，未出现时轮询等待（与隐式等待时长一致）
+            timeout: 等待 require 中元素出现的最长时间（秒）
+
+        Returns:
+            {名称: {"present": bool, "displayed": bool, "text": str 或 None}}
+        """
+        payload = {
+            key: {'by': SNAPSHOT_LOCATORS[by], 'value': value}
+            for key, (by, value) in specs.items()
+        }
+
+        def take(driver):
+            snap = driver.execute_script(SNAPSHOT_SCRIPT, payload)
+            return snap if all(snap[key]['present'] for key in require) else False
+
+        try:
+            return WebDriverWait(self.driver, timeout).until(take)
+        except TimeoutException:
+            # 超时后仍返回最后一次快照，由断言给出具体的失败信息
+            return self.driver.execute_script(SNAPSHOT_SCRIPT, payload)
+
+    def assert_displayed(self, snap, key):
+        """断言快照中的元素存在且可见"""
+        self.assertTrue(snap[key]['present'], f"元素 '{key}' 不存在")
+        self.assertTrue(snap[key]['displayed'], f"元素 '{key}' 不可见")
+
     # ---------------------- 登录功能测试 ----------------------
     def test_login_success(self):
         """测试输入正确的用户名和密码能否成功登录"""
@@ -51,28 +189,21 @@ class ShoppingSystemTests(unittest.TestCase):
         self.login("wrong_user", "wrong_password")
         time.sleep(2)  # 等待页面加载
         # 验证是否显示错误提示
-        error_message = self.driver.find_element(By.CLASS_NAME, 'error-message-container')
-        self.assertTrue(error_message.is_displayed())
-        self.assertIn('Epic sadface', error_message.text)
+        snap = self.snapshot({'error': (By.CLASS_NAME, 'error-message-container')}, require=['error'])
+        self.assert_displayed(snap, 'error')
+        self.assertIn('Epic sadface', snap['error']['text'])
         
     def test_login_locked(self):
         """测试输入被锁定的用户时是否显示相应错误提示"""
         self.login("locked_out_user", "secret_sauce")
         time.sleep(2)  # 等待页面加载
         # 验证是否显示锁定用户错误提示
-        error_message = self.driver.find_element(By.CLASS_NAME, 'error-message-container')
-        self.assertTrue(error_message.is_displayed())
-        self.assertIn('locked out', error_message.text)
+        snap = self.snapshot({'error': (By.CLASS_NAME, 'error-message-container')}, require=['error'])
+        self.assert_displayed(snap, 'error')
+        self.assertIn('locked out', snap['error']['text'])
 
     # ---------------------- 购物车功能测试 ----------------------
-    @parameterized.expand([
-        ("Sauce Labs Backpack", "add-to-cart-sauce-labs-backpack"),
-        ("Sauce Labs Bike Light", "add-to-cart-sauce-labs-bike-light"),
-        ("Sauce Labs Bolt T-Shirt", "add-to-cart-sauce-labs-bolt-t-shirt"),
-        ("Sauce Labs Fleece Jacket", "add-to-cart-sauce-labs-fleece-jacket"),
-        ("Sauce Labs Onesie", "add-to-cart-sauce-labs-onesie"),
-        ("Test.allTheThings() T-Shirt (Red)", "add-to-cart-test.allthethings()-t-shirt-(red)")
-    ])
+    @parameterized.expand(CATALOG)
     def test_add_to_cart(self, item_name, button_id):
         """测试添加商品到购物车功能"""
         self.login("standard_user", "secret_sauce")
@@ -83,15 +214,59 @@ class ShoppingSystemTests(unittest.TestCase):
         self.add_to_cart(button_id)
         time.sleep(1)
         
+        # 一次往返获取购物车图标和按钮的状态
+        remove_button_id = button_id.replace('add-to-cart-', 'remove-')
+        snap = self.snapshot({
+            'cart_badge': (By.CLASS_NAME, 'shopping_cart_badge'),
+            'remove_button': (By.ID, remove_button_id),
+        }, require=['cart_badge', 'remove_button'])
+        
         # 验证购物车图标显示数量为1
-        cart_badge = self.driver.find_element(By.CLASS_NAME, 'shopping_cart_badge')
-        self.assertEqual(cart_badge.text, '1')
+        self.assertEqual(snap['cart_badge']['text'], '1')
         
         # 验证按钮状态变为"Remove"
-        remove_button_id = button_id.replace('add-to-cart-', 'remove-')
-        remove_button = self.driver.find_element(By.ID, remove_button_id)
-        self.assertTrue(remove_button.is_displayed())
-        self.assertEqual(remove_button.text, 'Remove')
+        self.assert_displayed(snap, 'remove_button')
+        self.assertEqual(snap['remove_button']['text'], 'Remove')
+
+    def test_add_remove_catalog(self):
+        """单次登录中依次添加、删除目录中的全部商品，逐个校验购物车数量"""
+        self.login("standard_user", "secret_sauce")
+        self.reset_state()
+        # 目录文件缺失时从商品列表页抓取一次
+        items = FILE_CATALOG or self.scrape_catalog()
+        self.assertTrue(items, "商品目录为空")
+
+        def badge_count():
+            badge = self.snapshot({'cart_badge': (By.CLASS_NAME, 'shopping_cart_badge')})['cart_badge']
+            return int(badge['text'] or 0) if badge['present'] else 0
+
+        # 逐个添加：每件商品单独报告，失败后以页面实际数量为准继续校验
+        count = badge_count()
+        added = []
+        for item_name, button_id in items:
+            with self.subTest(action="add", item=item_name):
+                self.add_to_cart(button_id)
+                remove_button_id = button_id.replace('add-to-cart-', 'remove-')
+                snap = self.snapshot({
+                    'cart_badge': (By.CLASS_NAME, 'shopping_cart_badge'),
+                    'remove_button': (By.ID, remove_button_id),
+                }, require=['remove_button'])
+                added.append((item_name, remove_button_id))
+                expected = count + 1
+                badge = snap['cart_badge']
+                count = int(badge['text'] or 0) if badge['present'] else 0
+                self.assertEqual(count, expected)
+                self.assert_displayed(snap, 'remove_button')
+                self.assertEqual(snap['remove_button']['text'], 'Remove')
+
+        # 逐个删除：数量依次减一，清空后购物车图标消失
+        for item_name, remove_button_id in added:
+            with self.subTest(action="remove", item=item_name):
+                self.driver.find_element(By.ID, remove_button_id).click()
+                expected = count - 1
+                count = badge_count()
+                self.assertEqual(count, expected)
+        self.assertEqual(badge_count(), 0)
 
     def test_remove_from_cart(self):
         """测试是否能够删除购物车中的商品"""
@@ -149,13 +324,15 @@ class ShoppingSystemTests(unittest.TestCase):
         time.sleep(2)
         
         # 验证订单成功
-        success_message = self.driver.find_element(By.CLASS_NAME, 'complete-header')
-        self.assertTrue(success_message.is_displayed())
-        self.assertEqual(success_message.text, 'Thank you for your order!')
+        snap = self.snapshot({'success': (By.CLASS_NAME, 'complete-header')}, require=['success'])
+        self.assert_displayed(snap, 'success')
+        self.assertEqual(snap['success']['text'], 'Thank you for your order!')
 
     @classmethod
     def tearDownClass(cls):
-        """测试结束后关闭浏览器"""
+        """测试结束后输出耗时报告并关闭浏览器"""
+        cls.timer.report(REPORT_DIR)
+        cls.timer.uninstall()
         cls.driver.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,320 @@
+"""
+Web 测试耗时统计
+
+包装 WebDriver 的所有命令（driver.execute 是所有 HTTP 往返的唯一入口）、
+测试步骤和测试模块中的 time.sleep，记录每条命令的耗时以及每次页面加载的
+Navigation Timing（performance.timing），测试结束后输出：
+
+1. 每个测试的火焰图式耗时分解（步骤 → 命令）
+2. 全部步骤/命令按耗时排序的慢步骤报告
+3. 可直接交给 flamegraph.pl / speedscope 的 folded stack 文件
+
+使用方法:
+    timer = WebTimer(driver)
+    timer.install(sys.modules[__name__])   # 只记录本模块里的 time.sleep
+    timer.begin_test("test_login_success")
+    with timer.step("login"):
+        ...
+    timer.end_test()
+    timer.report(REPORT_DIR)
+    timer.uninstall()
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+# 默认报告目录：本文件所在目录下的 reports，不随运行时的工作目录变化
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+
+# 超过该时长的查找命令视为被隐式等待拖慢
+IMPLICIT_WAIT_THRESHOLD = 0.5
+
+# 查找元素类的 WebDriver 命令
+FIND_COMMANDS = {"findElement", "findElements", "findChildElement", "findChildElements"}
+
+# 读取页面 Navigation Timing（毫秒时间戳）
+NAVIGATION_TIMING_SCRIPT = "return window.performance.timing.toJSON();"
+
+
+class TimingNode:
+    """火焰图中的一个节点：测试、步骤、命令或 sleep"""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.duration = 0.0
+        self.children: List["TimingNode"] = []
+
+    @property
+    def self_time(self) -> float:
+        """扣除子节点后的自身耗时"""
+        return max(self.duration - sum(c.duration for c in self.children), 0.0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "duration": round(self.duration, 6),
+            "children": [c.to_dict() for c in self.children],
+        }
+
+
+def navigation_phases(timing: Dict) -> Dict[str, int]:
+    """把 performance.timing 的时间戳换算成各阶段耗时（毫秒）"""
+    def span(start, end):
+        if not timing.get(start) or not timing.get(end):
+            return 0
+        return max(timing[end] - timing[start], 0)
+
+    return {
+        "redirect": span("redirectStart", "redirectEnd"),
+        "dns": span("domainLookupStart", "domainLookupEnd"),
+        "connect": span("connectStart", "connectEnd"),
+        "ttfb": span("requestStart", "responseStart"),
+        "response": span("responseStart", "responseEnd"),
+        "dom_interactive": span("navigationStart", "domInteractive"),
+        "dom_content_loaded": span("navigationStart", "domContentLoadedEventEnd"),
+        "load": span("navigationStart", "loadEventEnd"),
+    }
+
+
+class _TimedTimeModule:
+    """
+    代替测试模块中的 time 模块引用: sleep 经过 WebTimer 记录，其余属性直接转给 time
+
+    只替换测试模块自己的引用，不改全局的 time.sleep，
+    因此 WebDriverWait 内部的轮询和其他库的 sleep 不会被记录，也不会在 uninstall 前泄漏到别处。
+    """
+
+    def __init__(self, timer: "WebTimer"):
+        self._timer = timer
+
+    def sleep(self, seconds):
+        self._timer.sleep(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class WebTimer:
+    """WebDriver 命令与测试步骤耗时记录器"""
+
+    def __init__(self, driver, collect_navigation: bool = True):
+        self.driver = driver
+        self.collect_navigation = collect_navigation
+        self.tests: List[TimingNode] = []
+        self.navigations: List[Dict] = []
+        self._stack: List[TimingNode] = []
+        self._test_start = 0.0
+        self._original_execute = None
+        self._patched_module = None
+
+    # ---------------------- 安装与卸载 ----------------------
+    def install(self, module=None):
+        """
+        替换 driver.execute，开始记录
+
+        参数:
+            module: 测试模块；传入时把该模块的 time 引用换成记录 sleep 的代理，
+                    全局的 time.sleep 保持不变
+        """
+        if self._original_execute is not None:
+            return
+        self._original_execute = self.driver.execute
+        original_execute = self._original_execute
+
+        def timed_execute(driver_command, params=None):
+            node = self._push(driver_command, "command")
+            start = time.perf_counter()
+            try:
+                return original_execute(driver_command, params)
+            finally:
+                node.duration = time.perf_counter() - start
+                if driver_command in FIND_COMMANDS and node.duration > IMPLICIT_WAIT_THRESHOLD:
+                    node.kind = "implicit-wait"
+                self._pop(node)
+                if driver_command == "get" and self.collect_navigation:
+                    self._record_navigation(params)
+
+        self.driver.execute = timed_execute
+        if module is not None and getattr(module, "time", None) is time:
+            module.time = _TimedTimeModule(self)
+            self._patched_module = module
+
+    def uninstall(self):
+        """恢复原始的 driver.execute 与测试模块的 time 引用"""
+        if self._original_execute is None:
+            return
+        del self.driver.execute
+        if self._patched_module is not None:
+            self._patched_module.time = time
+            self._patched_module = None
+        self._original_execute = None
+
+    def sleep(self, seconds: float):
+        """time.sleep 并记录为一个 sleep 节点"""
+        node = self._push(f"sleep({seconds})", "sleep")
+        start = time.perf_counter()
+        try:
+            time.sleep(seconds)
+        finally:
+            node.duration = time.perf_counter() - start
+            self._pop(node)
+
+    # ---------------------- 记录 ----------------------
+    def _push(self, name: str, kind: str) -> TimingNode:
+        node = TimingNode(name, kind)
+        if self._stack:
+            self._stack[-1].children.append(node)
+        self._stack.append(node)
+        return node
+
+    def _pop(self, node: TimingNode):
+        if self._stack and self._stack[-1] is node:
+            self._stack.pop()
+
+    def _record_navigation(self, params):
+        """页面加载后读取 Navigation Timing（不计入命令耗时）"""
+        try:
+            response = self._original_execute(
+                "executeScript", {"script": NAVIGATION_TIMING_SCRIPT, "args": []}
+            )
+            timing = response.get("value") or {}
+        except Exception:
+            return
+        self.navigations.append({
+            "test": self.tests[-1].name if self._stack else None,
+            "url": (params or {}).get("url"),
+            "phases": navigation_phases(timing),
+        })
+
+    def begin_test(self, name: str):
+        """开始记录一个测试"""
+        self._stack = []
+        self.tests.append(self._push(name, "test"))
+        self._test_start = time.perf_counter()
+
+    def end_test(self):
+        """结束当前测试的记录"""
+        if not self._stack:
+            return
+        self._stack[0].duration = time.perf_counter() - self._test_start
+        self._stack = []
+
+    @contextmanager
+    def step(self, name: str):
+        """记录一个测试步骤，步骤内的命令会挂在该步骤下"""
+        node = self._push(name, "step")
+        start = time.perf_counter()
+        try:
+            yield node
+        finally:
+            node.duration = time.perf_counter() - start
+            self._pop(node)
+
+    # ---------------------- 报告 ----------------------
+    def slow_steps(self, top: int = 20) -> List[Dict]:
+        """按耗时排序的步骤、命令与 sleep（不含测试本身）"""
+        rows = []
+
+        def walk(node: TimingNode, test: str, path: List[str]):
+            for child in node.children:
+                child_path = path + [child.name]
+                rows.append({
+                    "test": test,
+                    "path": " > ".join(child_path),
+                    "kind": child.kind,
+                    "duration": child.duration,
+                })
+                walk(child, test, child_path)
+
+        for test in self.tests:
+            walk(test, test.name, [])
+        rows.sort(key=lambda r: r["duration"], reverse=True)
+        return rows[:top]
+
+    def folded_stacks(self) -> List[str]:
+        """生成 flamegraph.pl 兼容的 folded stack 行（单位：微秒）"""
+        lines = []
+
+        def walk(node: TimingNode, path: List[str]):
+            path = path + [node.name.replace(";", ",")]
+            micros = int(node.self_time * 1_000_000)
+            if micros > 0:
+                lines.append(f"{';'.join(path)} {micros}")
+            for child in node.children:
+                walk(child, path)
+
+        for test in self.tests:
+            walk(test, [])
+        return lines
+
+    def print_breakdown(self, max_depth: int = 3):
+        """打印每个测试的火焰图式耗时分解"""
+        def show(node: TimingNode, total: float, depth: int):
+            share = node.duration / total if total > 0 else 0.0
+            bar = "█" * max(int(share * 30), 1 if node.duration > 0 else 0)
+            print(f"  {'  ' * depth}{node.name:<{40 - 2 * depth}} "
+                  f"{node.duration * 1000:9.1f} ms {share * 100:5.1f}% {bar}")
+            if depth < max_depth:
+                for child in node.children:
+                    show(child, total, depth + 1)
+
+        for test in self.tests:
+            print(f"\n⏱️ {test.name}")
+            show(test, test.duration, 0)
+
+    def report(self, output_dir: Optional[str] = REPORT_DIR, top: int = 20):
+        """打印耗时分解与慢步骤报告，并保存 JSON 与 folded stack 文件"""
+        if not self.tests:
+            return
+
+        print("\n" + "=" * 60)
+        print("⏱️ Web 测试耗时分解")
+        print("=" * 60)
+        self.print_breakdown()
+
+        print("\n" + "=" * 60)
+        print(f"🐢 最慢的 {top} 个步骤")
+        print("=" * 60)
+        for i, row in enumerate(self.slow_steps(top), 1):
+            print(f"{i:3d}. {row['duration'] * 1000:9.1f} ms  [{row['kind']}] "
+                  f"{row['test']}: {row['path']}")
+
+        if self.navigations:
+            print("\n📄 页面加载 (ms):")
+            for nav in self.navigations:
+                phases = nav["phases"]
+                print(f"  - {nav['url']}: ttfb={phases['ttfb']} "
+                      f"domContentLoaded={phases['dom_content_loaded']} load={phases['load']}")
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            json_file = os.path.join(output_dir, "web_timing.json")
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump({
+                    "tests": [t.to_dict() for t in self.tests],
+                    "navigations": self.navigations,
+                    "slow_steps": self.slow_steps(top),
+                }, f, indent=2, ensure_ascii=False)
+            folded_file = os.path.join(output_dir, "web_timing.folded")
+            with open(folded_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(self.folded_stacks()) + "\n")
+            print(f"\n📄 耗时数据已保存到: {json_file}")
+            print(f"🔥 火焰图数据已保存到: {folded_file}")
+
+
+def timed_step(method):
+    """把测试类的辅助方法记录为一个步骤（要求实例上有 timer 属性）"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timer = getattr(self, "timer", None)
+        if timer is None:
+            return method(self, *args, **kwargs)
+        with timer.step(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Minishell 管道 / 重定向压力基准测试
+
+与 .cc 中只传几个字节的用例不同，这里在大数据量和大量命令下测量：
+- pipeline:  cat big | cat | ... | wc -c，数百 MB 穿过长管道的吞吐 (MB/s)
+- redirect:  cat < f0 > f1; cat < f1 > f2; ... 多级重定向链的吞吐 (MB/s)
+- append:    多次 >> 追加到同一文件的吞吐 (MB/s)
+- sequential: 一个进程中顺序执行上千条命令的单条命令延迟
+- fd_growth: 反复执行管道命令后 shell 进程自身打开的 fd 数（检测 pipe fd 泄漏）
+
+运行期间采样 /proc，记录峰值子进程数和 fd 数；同样的脚本用 bash 跑一遍作为基线。
+每次结果追加到历史文件，与最近几次的中位数比较以发现性能回退。
+
+使用方法:
+    python minishell_bench.py
+    python minishell_bench.py --size-mb 256 --stages 16
+    python minishell_bench.py --scenario pipeline --no-baseline
+    python minishell_bench.py --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import select
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from minishell_runner import DEFAULT_MINISHELL
+
+# 历史结果文件（每行一次运行）
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "reports" / "minishell_bench_history.jsonl"
+
+# /proc 采样间隔（秒）
+SAMPLE_INTERVAL = 0.01
+
+# 越大越好的指标，其余指标越小越好
+HIGHER_IS_BETTER = {"mb_per_s"}
+
+SCENARIOS = ["pipeline", "redirect", "append", "sequential", "fd_growth"]
+
+
+# ========================================
+# /proc 采样
+# ========================================
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def count_descendants(pid: int) -> int:
+    """进程的全部后代进程数"""
+    stack, total = _children(pid), 0
+    while stack:
+        child = stack.pop()
+        total += 1
+        stack.extend(_children(child))
+    return total
+
+
+def count_fds(pid: int) -> int:
+    """进程当前打开的 fd 数，进程已退出时返回 0"""
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+class ProcSampler:
+    """后台线程定时采样 shell 进程的后代进程数和 fd 数，记录峰值"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_procs = 0
+        self.peak_fds = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_procs = max(self.peak_procs, count_descendants(self.pid))
+            self.peak_fds = max(self.peak_fds, count_fds(self.pid))
+            self._stop.wait(SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ========================================
+# 执行
+# ========================================
+
+def run_script(shell: List[str], script: str, cwd: str, timeout: float) -> Dict:
+    """把整段脚本从 stdin 交给 shell 执行，返回耗时和 /proc 峰值"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, cwd=cwd)
+    with ProcSampler(proc.pid) as sampler:
+        try:
+            stdout, _ = proc.communicate(script.encode(), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, _ = proc.communicate()
+            return {"error": "timeout", "elapsed": time.perf_counter() - start}
+    return {
+        "elapsed": time.perf_counter() - start,
+        "exit_code": proc.returncode,
+        "stdout": stdout.decode(errors="replace"),
+        "peak_procs": sampler.peak_procs,
+        "peak_fds": sampler.peak_fds,
+    }
+
+
+def make_input_file(path: str, size_mb: int):
+    """生成 size_mb MB 的文本输入文件（定长行，便于校验字节数）"""
+    line = b"minishell benchmark line 0123456789 abcdefghijklmnopqrstuvwxyz\n"
+    block = line * (1024 * 1024 // len(line))
+    block += line[:1024 * 1024 - len(block)]
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def bench_pipeline(shell, tmp, size_mb, stages, commands, timeout) -> Dict:
+    """cat big | cat × stages | wc -c"""
+    script = "cat big.txt" + " | cat" * stages + " | wc -c\n"
+    r = run_script(shell, script, tmp, timeout)
+    if "error" in r:
+        return r
+    ok = str(size_mb * 1024 * 1024) in r["stdout"]
+    return {"mb_per_s": size_mb / r["elapsed"], "elapsed": r["elapsed"], "correct": ok,
+            "peak_procs": r["peak_procs"], "peak_fds": r["peak_fds"]}
+
+
+def bench_redirect(shell, tmp, size_mb, stages, commands, timeout) -> Dict:
+    """cat < f0 > f1; cat < f1 > f2; ...，总数据量为 size_mb × stages"""
+    lines = ["cat < big.txt > r0.txt"]
+    lines += [f"cat < r{i}.txt > r{i + 1}.txt" for i in range(stages)]
+    r = run_script(shell, "\n".join(lines) + "\n", tmp, timeout)
+    if "error" in r:
+        return r
+    last = os.path.join(tmp, f"r{stages}.txt")
+    ok = os.path.exists(last) and os.path.getsize(last) == size_mb * 1024 * 1024
+    moved = size_mb * (stages + 1)
+    return {"mb_per_s": moved / r["elapsed"], "elapsed": r["elapsed"], "correct": ok,
+            "peak_procs": r["peak_procs"], "peak_fds": r["peak_fds"]}
+
+
+def bench_append(shell, tmp, size_mb, stages, commands, timeout) -> Dict:
+    """cat big >> out 重复 stages 次"""
+    script = "cat big.txt > a.txt\n" + "cat big.txt >> a.txt\n" * stages
+    r = run_script(shell, script, tmp, timeout)
+    if "error" in r:
+        return r
+    path = os.path.join(tmp, "a.txt")
+    ok = os.path.exists(path) and os.path.getsize(path) == size_mb * 1024 * 1024 * (stages + 1)
+    moved = size_mb * (stages + 1)
+    return {"mb_per_s": moved / r["elapsed"], "elapsed": r["elapsed"], "correct": ok,
+            "peak_procs": r["peak_procs"], "peak_fds": r["peak_fds"]}
+
+
+def bench_sequential(shell, tmp, size_mb, stages, commands, timeout) -> Dict:
+    """顺序执行 commands 条 builtin / 外部命令 / 管道的混合命令"""
+    mix = ["echo line {i}", "pwd", "echo {i} | cat", "ls > /dev/null"]
+    script = "\n".join(mix[i % len(mix)].format(i=i) for i in range(commands)) + "\n"
+    r = run_script(shell, script, tmp, timeout)
+    if "error" in r:
+        return r
+    ok = f"line {(commands - 1) // len(mix) * len(mix)}" in r["stdout"]
+    return {"latency_ms": r["elapsed"] / commands * 1000, "elapsed": r["elapsed"], "correct": ok,
+            "peak_procs": r["peak_procs"], "peak_fds": r["peak_fds"]}
+
+
+def _read_line(fd: int, buffer: bytearray, deadline: float) -> bytes:
+    """从 fd 读取一行，超时或 EOF 时返回 b""，不会因为 shell 不再输出而阻塞"""
+    while b"\n" not in buffer:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return b""
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            continue
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b""
+        buffer += chunk
+    end = buffer.index(b"\n") + 1
+    line = bytes(buffer[:end])
+    del buffer[:end]
+    return line
+
+
+def bench_fd_growth(shell, tmp, size_mb, stages, commands, timeout) -> Dict:
+    """逐条执行管道命令，记录每条命令结束后 shell 进程自身打开的 fd 数"""
+    rounds = max(commands // 10, 10)
+    proc = subprocess.Popen(shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, cwd=tmp)
+    start = time.perf_counter()
+    deadline = start + timeout
+    buffer = bytearray()
+    fds = []
+    try:
+        for i in range(rounds):
+            try:
+                proc.stdin.write(f"echo fd{i} | cat | cat\n".encode())
+                proc.stdin.flush()
+            except BrokenPipeError:
+                break
+            # 不用 readline: shell 停止响应时它会一直阻塞，整个基准测试都卡住
+            line = _read_line(proc.stdout.fileno(), buffer, deadline)
+            if not line:
+                break
+            # 输出可能早于子进程回收，等管道里的子进程退出后再数 fd
+            while count_descendants(proc.pid) and time.perf_counter() < deadline:
+                time.sleep(0.001)
+            fds.append(count_fds(proc.pid))
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            proc.wait(timeout=max(deadline - time.perf_counter(), 1.0))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    if not fds:
+        return {"error": "no output"}
+    return {"fd_growth": fds[-1] - fds[0], "fds_first": fds[0], "fds_last": fds[-1],
+            "elapsed": time.perf_counter() - start, "correct": len(fds) == rounds}
+
+
+BENCHMARKS = {
+    "pipeline": bench_pipeline,
+    "redirect": bench_redirect,
+    "append": bench_append,
+    "sequential": bench_sequential,
+    "fd_growth": bench_fd_growth,
+}
+
+# 每个场景用于回退检测的主指标
+PRIMARY_METRIC = {
+    "pipeline": "mb_per_s",
+    "redirect": "mb_per_s",
+    "append": "mb_per_s",
+    "sequential": "latency_ms",
+    "fd_growth": "fd_growth",
+}
+
+
+# ========================================
+# 历史与回退检测
+# ========================================
+
+def load_history(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path: Path, entry: Dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def find_regressions(history: List[Dict], entry: Dict, window: int,
+                     threshold: float) -> List[str]:
+    """
+    与历史中参数相同的最近 window 次运行的中位数比较
+
+    只检查 minishell 的结果: 基线 shell 只用来对比，它的波动不是 minishell 的回退。
+    """
+    same = [h for h in history if h["params"] == entry["params"]][-window:]
+    regressions = []
+    for key, result in entry["results"].items():
+        if not key.startswith("minishell/"):
+            continue
+        scenario = key.split("/")[1]
+        metric = PRIMARY_METRIC[scenario]
+        if metric not in result:
+            continue
+        past = [h["results"][key][metric] for h in same
+                if metric in h["results"].get(key, {})]
+        if not past:
+            continue
+        baseline = statistics.median(past)
+        value = result[metric]
+        if metric in HIGHER_IS_BETTER:
+            worse = value < baseline * (1 - threshold)
+        elif metric == "fd_growth":
+            worse = value > baseline
+        else:
+            worse = value > baseline * (1 + threshold)
+        if worse:
+            regressions.append(f"{key} {metric}: {value:.3f} (历史中位数 {baseline:.3f})")
+    return regressions
+
+
+def format_result(result: Dict) -> str:
+    if "error" in result:
+        return f"✗ {result['error']}"
+    parts = []
+    if "mb_per_s" in result:
+        parts.append(f"{result['mb_per_s']:9.1f} MB/s")
+    if "latency_ms" in result:
+        parts.append(f"{result['latency_ms']:9.3f} ms/cmd")
+    if "fd_growth" in result:
+        parts.append(f"fd {result['fds_first']} → {result['fds_last']} (+{result['fd_growth']})")
+    if "peak_procs" in result:
+        parts.append(f"进程峰值 {result['peak_procs']:3d}  fd峰值 {result['peak_fds']:3d}")
+    parts.append(f"{result['elapsed']:7.2f} s")
+    if not result.get("correct", True):
+        parts.append("⚠️ 输出不正确")
+    return "  ".join(parts)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='minishell 管道 / 重定向吞吐与延迟压力测试（以 bash 为基线）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python minishell_bench.py
+  python minishell_bench.py --size-mb 256 --stages 16
+  python minishell_bench.py --scenario pipeline --scenario fd_growth
+        '''
+    )
+    parser.add_argument('--minishell', default=str(DEFAULT_MINISHELL),
+                        help='minishell 可执行文件路径 (默认: ../source/minishell/minishell)')
+    parser.add_argument('--baseline-shell', default='bash', help='基线 shell (默认: bash)')
+    parser.add_argument('--no-baseline', action='store_true', help='不运行基线 shell')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='只运行指定场景，可重复使用 (默认: 全部)')
+    parser.add_argument('--size-mb', type=int, default=128, help='输入数据大小 MB (默认: 128)')
+    parser.add_argument('--stages', type=int, default=8, help='管道 / 重定向级数 (默认: 8)')
+    parser.add_argument('--commands', type=int, default=2000, help='顺序命令条数 (默认: 2000)')
+    parser.add_argument('--timeout', type=float, default=600, help='单个场景超时秒数 (默认: 600)')
+    parser.add_argument('--history', default=str(DEFAULT_HISTORY),
+                        help='历史结果文件 (默认: reports/minishell_bench_history.jsonl)')
+    parser.add_argument('--window', type=int, default=5, help='回退检测比较的历史次数 (默认: 5)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='判定为回退的相对变化 (默认: 0.2)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='检测到回退时以非零状态退出')
+    args = parser.parse_args()
+
+    if not os.access(args.minishell, os.X_OK):
+        print(f"✗ 错误: minishell 不存在或不可执行: {args.minishell}", file=sys.stderr)
+        sys.exit(1)
+
+    shells = {"minishell": [args.minishell]}
+    if not args.no_baseline:
+        baseline = shutil.which(args.baseline_shell)
+        if baseline:
+            shells[args.baseline_shell] = [baseline]
+        else:
+            print(f"⚠️ 找不到基线 shell: {args.baseline_shell}", file=sys.stderr)
+
+    scenarios = args.scenario or SCENARIOS
+    params = {"size_mb": args.size_mb, "stages": args.stages, "commands": args.commands}
+    results: Dict[str, Dict] = {}
+
+    tmp = tempfile.mkdtemp(prefix="minishell_bench_")
+    try:
+        print(f"📦 生成 {args.size_mb} MB 输入文件...")
+        make_input_file(os.path.join(tmp, "big.txt"), args.size_mb)
+        for scenario in scenarios:
+            print(f"\n{'=' * 60}\n🚀 {scenario}\n{'=' * 60}")
+            for name, shell in shells.items():
+                result = BENCHMARKS[scenario](shell, tmp, args.size_mb, args.stages,
+                                              args.commands, args.timeout)
+                results[f"{name}/{scenario}"] = result
+                print(f"  {name:<10} {format_result(result)}")
+            if len(shells) > 1:
+                metric = PRIMARY_METRIC[scenario]
+                mine = results[f"minishell/{scenario}"].get(metric)
+                base_name = next(n for n in shells if n != "minishell")
+                base = results[f"{base_name}/{scenario}"].get(metric)
+                if mine and base and metric != "fd_growth":
+                    ratio = mine / base if metric in HIGHER_IS_BETTER else base / mine
+                    print(f"  相对 {base_name}: {ratio * 100:.1f}%")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    history_path = Path(args.history)
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "results": results,
+    }
+    regressions = find_regressions(load_history(history_path), entry,
+                                   args.window, args.threshold)
+    append_history(history_path, entry)
+    print(f"\n📄 结果已追加到: {history_path}")
+
+    if regressions:
+        print("\n⚠️ 检测到性能回退:")
+        for r in regressions:
+            print(f"  - {r}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("✅ 没有检测到性能回退")
+
+
+if __name__ == '__main__':
+    main()
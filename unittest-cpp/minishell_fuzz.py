@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Minishell 与 bash 的并行差分模糊测试
+
+按语法随机生成命令行（引号、$VAR 展开、管道、<、>、>>、builtin），
+在相同的环境变量和全新的临时目录中分别交给 minishell 和 bash 执行，
+比较 stdout、stderr（去掉 shell 名前缀）、退出码以及执行后目录中的文件。
+
+同一管道里读写同一个文件（例如 cat words.txt >> words.txt | echo）在 bash 下本身就有竞争，
+这类输入在执行前直接跳过；其余输入发现差异后再执行 bash 若干次（--determinism-runs），
+bash 自己的结果不一致时同样记为不确定的输入并跳过，不报告为失败。
+最小化时同样检查，不会把输入缩成一个不确定的例子。
+
+吞吐: 每个输入要在新的临时目录中分别启动 minishell 和 bash，实测单核约 100 输入/秒
+（gcc 构建的 minishell，-j 1）；有差异的输入还要重跑 bash，差异很多时降到约 75 输入/秒。
+总吞吐随 -j 大致线性增长，离"每秒上千个"还差一个数量级，瓶颈是进程启动而不是比较。
+
+每个 worker 进程用自己的种子独立生成和执行输入，差异先按廉价的原始签名
+（不一致的字段 + 两边的输出类别）去重，只把每个签名的第一个例子传回主进程；
+模糊测试结束后再用进程池对这些新签名做 delta debugging 最小化，最小化不占用模糊测试的时间。
+
+使用方法:
+    python minishell_fuzz.py --duration 60
+    python minishell_fuzz.py --iterations 5000 -j 8 --seed 42
+    python minishell_fuzz.py --duration 28800 --ignore-stderr   # 跑一整夜
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from minishell_runner import DEFAULT_MINISHELL, run_minishell
+
+DEFAULT_OUTPUT = Path(__file__).resolve().parent / "reports" / "minishell_fuzz_failures.jsonl"
+
+# 每次执行前写入临时目录的输入文件
+INPUT_FILES = {"in.txt": "first line\nsecond line\n", "words.txt": "one two three\n"}
+
+# bash 和 minishell 错误信息的前缀不同，比较前去掉
+STDERR_PREFIX_RE = re.compile(r"^(?:bash: line \d+: |bash: |minishell: )", re.MULTILINE)
+
+# bash 在语法错误后会多输出一行出错的命令原文
+BASH_ECHO_LINE_RE = re.compile(r"^bash: line \d+: `.*'\n", re.MULTILINE)
+
+
+# ========================================
+# 语法生成
+# ========================================
+
+WORDS = ["hello", "world", "a", "42", "-n", "x\\ y", "''", '""']
+QUOTED = ["'single quoted'", "'$FUZZ_VAR'", '"double quoted"', '"with $FUZZ_VAR inside"',
+          '"$HOME"', "'a|b'", '"a > b"']
+VARS = ["$FUZZ_VAR", "$HOME", "$UNDEFINED_VAR", "$?", "$FUZZ_EMPTY"]
+FILES = ["out1.txt", "out2.txt", "in.txt", "words.txt", "missing.txt"]
+COMMANDS = {
+    "echo": 6,
+    "echo -n": 2,
+    "cat": 3,
+    "wc -c": 1,
+    "wc -w": 1,
+    "pwd": 1,
+    "export": 1,
+    "unset": 1,
+    "nonexistent_cmd": 1,
+    "true": 1,
+    "false": 1,
+}
+
+
+def gen_arg(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.4:
+        return rng.choice(WORDS)
+    if kind < 0.7:
+        return rng.choice(QUOTED)
+    if kind < 0.9:
+        return rng.choice(VARS)
+    # 拼接: 变量和引号紧挨着普通文本
+    return rng.choice(WORDS).strip("-") + rng.choice(VARS + QUOTED)
+
+
+def gen_simple(rng: random.Random) -> List[str]:
+    """一条简单命令: 命令名、参数和可选的重定向"""
+    name = rng.choices(list(COMMANDS), weights=list(COMMANDS.values()))[0]
+    tokens = name.split()
+    if name == "export":
+        tokens.append(f"FUZZ_NEW={rng.choice(WORDS + QUOTED)}")
+    elif name == "unset":
+        tokens.append(rng.choice(["FUZZ_VAR", "FUZZ_NEW", "HOME"]))
+    elif name in ("echo", "echo -n"):
+        tokens += [gen_arg(rng) for _ in range(rng.randint(0, 3))]
+    elif name == "cat" and rng.random() < 0.5:
+        tokens.append(rng.choice(FILES))
+    for _ in range(rng.choices([0, 1, 2], weights=[5, 3, 1])[0]):
+        op = rng.choice([">", ">>", "<"])
+        tokens += [op, rng.choice(FILES)]
+    return tokens
+
+
+def gen_line(rng: random.Random, max_commands: int = 3, max_pipes: int = 3) -> List[str]:
+    """一行命令: 用 ; 分隔的若干条管道"""
+    tokens: List[str] = []
+    for i in range(rng.randint(1, max_commands)):
+        if i:
+            tokens.append(";")
+        for j in range(rng.randint(1, max_pipes)):
+            if j:
+                tokens.append("|")
+            tokens += gen_simple(rng)
+    return tokens
+
+
+def racy_pipeline(tokens: List[str]) -> bool:
+    """
+    管道中是否有两条命令读写同一个文件（或同时写同一个文件）
+
+    管道里的命令并发执行，这类输入的结果取决于调度，bash 自己也不确定。
+    """
+    pipelines: List[List[List[str]]] = [[[]]]
+    for token in tokens:
+        if token == ";":
+            pipelines.append([[]])
+        elif token == "|":
+            pipelines[-1].append([])
+        else:
+            pipelines[-1][-1].append(token)
+    for commands in pipelines:
+        if len(commands) < 2:
+            continue
+        reads, writes = [], []
+        for command in commands:
+            for i, token in enumerate(command):
+                if token in (">", ">>") or token not in FILES:
+                    continue
+                prev = command[i - 1] if i else None
+                (writes if prev in (">", ">>") else reads).append(token)
+        if set(reads) & set(writes) or len(writes) != len(set(writes)):
+            return True
+    return False
+
+
+# ========================================
+# 差分执行
+# ========================================
+
+def fuzz_env(home: str) -> Dict[str, str]:
+    """两个 shell 使用完全相同的环境变量"""
+    return {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "HOME": home,
+        "LANG": "C",
+        "FUZZ_VAR": "fuzz value",
+        "FUZZ_EMPTY": "",
+    }
+
+
+def snapshot_dir(path: str) -> Dict[str, str]:
+    """目录中的文件名和内容"""
+    files = {}
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            with open(full, encoding="utf-8", errors="replace") as f:
+                files[name] = f.read()
+    return files
+
+
+def run_bash(bash: str, line: str, cwd: str, env: Dict[str, str], timeout: float) -> Dict:
+    try:
+        # argv[0] 固定为 bash，错误信息前缀才是 "bash: line 1: "
+        proc = subprocess.run(["bash"], executable=bash, input=(line + "\n").encode(), stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, cwd=cwd, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"stdout": "", "stderr": "", "exit_code": None, "timed_out": True}
+    return {
+        "stdout": proc.stdout.decode(errors="replace"),
+        "stderr": proc.stderr.decode(errors="replace"),
+        "exit_code": proc.returncode,
+        "timed_out": False,
+    }
+
+
+def execute(shell: str, kind: str, line: str, timeout: float) -> Dict:
+    """在全新的临时目录中执行一行命令，返回输出、退出码和目录快照"""
+    tmp = tempfile.mkdtemp(prefix=f"fuzz_{kind}_")
+    try:
+        for name, content in INPUT_FILES.items():
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        env = fuzz_env(tmp)
+        if kind == "minishell":
+            result = run_minishell(shell, line, cwd=tmp, env=env, timeout=timeout)
+        else:
+            result = run_bash(shell, line, tmp, env, timeout)
+        result["files"] = snapshot_dir(tmp)
+        # 路径里的临时目录名不同，统一替换
+        for key in ("stdout", "stderr"):
+            result[key] = result[key].replace(tmp, "$TMP")
+        result["files"] = {k: v.replace(tmp, "$TMP") for k, v in result["files"].items()}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+def normalize_stderr(stderr: str) -> str:
+    return STDERR_PREFIX_RE.sub("", BASH_ECHO_LINE_RE.sub("", stderr))
+
+
+def compare(mini: Dict, bash: Dict, ignore_stderr: bool) -> List[str]:
+    """返回不一致的字段列表"""
+    if mini.get("timed_out") or bash.get("timed_out"):
+        return ["timeout"] if mini.get("timed_out") != bash.get("timed_out") else []
+    fields = []
+    if mini["stdout"] != bash["stdout"]:
+        fields.append("stdout")
+    if not ignore_stderr and normalize_stderr(mini["stderr"]) != normalize_stderr(bash["stderr"]):
+        fields.append("stderr")
+    if mini["exit_code"] != bash["exit_code"]:
+        fields.append("exit_code")
+    if mini["files"] != bash["files"]:
+        fields.append("files")
+    return fields
+
+
+def differential(tokens: List[str], minishell: str, bash: str, timeout: float,
+                 ignore_stderr: bool, reruns: int = 0) -> Dict:
+    """
+    分别执行 minishell 和 bash 并比较
+
+    有差异且 reruns > 0 时再执行 bash reruns 次，任何一次与第一次不同就把 flaky 设为 True
+    （输入本身有竞争，差异不可信）。只在有差异时重跑，不影响没有差异的输入的吞吐。
+    """
+    line = " ".join(tokens)
+    mini = execute(minishell, "minishell", line, timeout)
+    ref = execute(bash, "bash", line, timeout)
+    diff = compare(mini, ref, ignore_stderr)
+    flaky = False
+    for _ in range(reruns if diff else 0):
+        if compare(execute(bash, "bash", line, timeout), ref, ignore_stderr):
+            flaky = True
+            break
+    return {"line": line, "diff": diff, "flaky": flaky, "minishell": mini, "bash": ref}
+
+
+def minimize(tokens: List[str], fields: List[str], minishell: str, bash: str,
+             timeout: float, ignore_stderr: bool, budget: int = 200, reruns: int = 0) -> List[str]:
+    """
+    delta debugging: 反复删除 token 块，只要差异字段完全不变且 bash 结果确定就保留删除结果
+    """
+    def still_fails(candidate: List[str]) -> bool:
+        if not candidate or racy_pipeline(candidate):
+            return False
+        result = differential(candidate, minishell, bash, timeout, ignore_stderr, reruns)
+        return set(fields) == set(result["diff"]) and not result["flaky"]
+
+    current = list(tokens)
+    chunk = max(len(current) // 2, 1)
+    while chunk >= 1 and budget > 0:
+        removed = False
+        i = 0
+        while i < len(current) and budget > 0:
+            candidate = current[:i] + current[i + chunk:]
+            budget -= 1
+            if still_fails(candidate):
+                current = candidate
+                removed = True
+            else:
+                i += chunk
+        if not removed:
+            chunk //= 2
+    return current
+
+
+def output_class(result: Dict) -> tuple:
+    """一次执行的粗粒度输出类别: 退出码、是否超时、stdout / stderr 是否为空"""
+    return (result.get("exit_code"), bool(result.get("timed_out")),
+            bool(result.get("stdout")), bool(result.get("stderr")))
+
+
+def raw_signature(result: Dict) -> tuple:
+    """不需要额外执行的差异签名，用于在最小化之前去重"""
+    return (tuple(result["diff"]), output_class(result["minishell"]), output_class(result["bash"]))
+
+
+def fuzz_worker(worker_id: int, seed: int, iterations: Optional[int], duration: Optional[float],
+                minishell: str, bash: str, timeout: float, ignore_stderr: bool,
+                reruns: int = 2) -> Dict:
+    """进程池 worker: 独立生成和执行输入，每个原始签名只返回第一个例子和出现次数"""
+    rng = random.Random(seed * 1_000_003 + worker_id)
+    deadline = time.monotonic() + duration if duration else None
+    executions = 0
+    flaky = 0
+    failures = {}
+    while True:
+        if iterations is not None and executions >= iterations:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        tokens = gen_line(rng)
+        if racy_pipeline(tokens):
+            flaky += 1
+            continue
+        result = differential(tokens, minishell, bash, timeout, ignore_stderr, reruns)
+        executions += 1
+        if not result["diff"]:
+            continue
+        if result["flaky"]:
+            flaky += 1
+            continue
+        signature = raw_signature(result)
+        if signature in failures:
+            failures[signature]["count"] += 1
+            continue
+        failures[signature] = {"tokens": tokens, "diff": result["diff"], "count": 1}
+    return {"executions": executions, "flaky": flaky, "failures": failures}
+
+
+def minimize_failure(failure: Dict, minishell: str, bash: str, timeout: float, ignore_stderr: bool,
+                     budget: int, reruns: int = 2) -> Dict:
+    """进程池任务: 最小化一个新签名的例子，并记录最小化后两边的输出"""
+    tokens, diff = failure["tokens"], failure["diff"]
+    minimal = (minimize(tokens, diff, minishell, bash, timeout, ignore_stderr, budget, reruns)
+               if budget else tokens)
+    final = differential(minimal, minishell, bash, timeout, ignore_stderr)
+    return {
+        "original": " ".join(tokens),
+        "minimized": final["line"],
+        "diff": diff,
+        "count": failure["count"],
+        "minishell": {k: final["minishell"][k] for k in ("stdout", "stderr", "exit_code", "files")},
+        "bash": {k: final["bash"][k] for k in ("stdout", "stderr", "exit_code", "files")},
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='minishell 与 bash 的并行差分模糊测试',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python minishell_fuzz.py --duration 60
+  python minishell_fuzz.py --iterations 5000 -j 8 --seed 42
+        '''
+    )
+    parser.add_argument('--minishell', default=str(DEFAULT_MINISHELL),
+                        help='minishell 可执行文件路径 (默认: ../source/minishell/minishell)')
+    parser.add_argument('--bash', default=shutil.which('bash') or '/bin/bash',
+                        help='参照 shell (默认: bash)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='并行进程数 (默认: CPU 核数)')
+    parser.add_argument('--duration', type=float, default=None, help='运行时长（秒）')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='每个进程执行的输入数 (未指定 --duration 时默认 1000)')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子 (默认: 当前时间)')
+    parser.add_argument('--timeout', type=float, default=5, help='单次执行超时秒数 (默认: 5)')
+    parser.add_argument('--ignore-stderr', action='store_true', help='不比较 stderr')
+    parser.add_argument('--determinism-runs', type=int, default=2,
+                        help='发现差异后重跑 bash 的次数，bash 结果不一致的输入不报告，0 表示不检查 (默认: 2)')
+    parser.add_argument('--minimize-budget', type=int, default=200,
+                        help='每个新差异最小化时最多执行的次数，0 表示不最小化 (默认: 200)')
+    parser.add_argument('-o', '--output', default=str(DEFAULT_OUTPUT),
+                        help='失败记录文件 (默认: reports/minishell_fuzz_failures.jsonl)')
+    args = parser.parse_args()
+
+    if not os.access(args.minishell, os.X_OK):
+        print(f"✗ 错误: minishell 不存在或不可执行: {args.minishell}", file=sys.stderr)
+        sys.exit(1)
+    if args.duration is None and args.iterations is None:
+        args.iterations = 1000
+    seed = args.seed if args.seed is not None else int(time.time())
+
+    print(f"🎲 种子: {seed}，{args.jobs} 个进程")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(fuzz_worker, i, seed, args.iterations, args.duration,
+                               args.minishell, args.bash, args.timeout, args.ignore_stderr,
+                               args.determinism_runs)
+                   for i in range(args.jobs)]
+        outcomes = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    executions = sum(o["executions"] for o in outcomes)
+    flaky = sum(o["flaky"] for o in outcomes)
+    unique = {}
+    for outcome in outcomes:
+        for signature, failure in outcome["failures"].items():
+            if signature in unique:
+                unique[signature]["count"] += failure["count"]
+            else:
+                unique[signature] = failure
+
+    # 每次执行包含 minishell 和 bash 各一次
+    print(f"✅ 共执行 {executions} 个输入，{elapsed:.1f} s，{executions / elapsed:.0f} 输入/秒")
+    if flaky:
+        print(f"🎲 跳过 {flaky} 个结果不确定的输入（同一管道里读写同一个文件，或重跑 bash 结果不一致）")
+    if not unique:
+        print("没有发现差异")
+        return
+
+    print(f"🔬 {sum(f['count'] for f in unique.values())} 个差异输入，{len(unique)} 个不同签名，"
+          f"开始最小化...")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(minimize_failure, failure, args.minishell, args.bash, args.timeout,
+                               args.ignore_stderr, args.minimize_budget, args.determinism_runs)
+                   for failure in unique.values()]
+        minimized = [f.result() for f in futures]
+    print(f"   最小化用时 {time.perf_counter() - start:.1f} s")
+
+    # 不同签名最小化后可能是同一个输入
+    failures = {}
+    for failure in minimized:
+        key = (failure["minimized"], tuple(failure["diff"]))
+        if key in failures:
+            failures[key]["count"] += failure["count"]
+        else:
+            failures[key] = failure
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a", encoding="utf-8") as f:
+        for failure in failures.values():
+            f.write(json.dumps(dict(failure, seed=seed)) + "\n")
+
+    print(f"\n⚠️ 发现 {len(failures)} 个不同的差异（已最小化）:")
+    for failure in failures.values():
+        print(f"  - [{', '.join(failure['diff'])}] ×{failure['count']} {failure['minimized']}")
+    print(f"\n📄 失败记录已追加到: {output}")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Minishell 内存泄漏 / fd 泄漏检测
+
+在 valgrind 或 LD_PRELOAD 分配跟踪库下执行 minishell_runner 中的全部
+builtin / pipe / redirect 用例，按进程池分片并行，收集每条命令的：
+- 退出时仍未释放的字节数和块数（valgrind 为 definitely + indirectly lost）；
+  管道中 fork 出来执行 builtin 的 minishell 子进程单独统计
+- 分配 / 释放次数、累计分配字节数
+- 峰值 RSS（仅 preload 后端，来自 /proc/self/status 的 VmHWM）
+- 退出时打开的 fd 数
+- 可选: 同一进程中重复执行 N 次后每次多泄漏的字节数（常驻 shell 的内存增长）
+
+结果按泄漏量排序输出并写入 reports/minishell_memcheck.json；
+与纳入版本控制的基线文件 memcheck_baseline.json 比较，泄漏、RSS 或 fd 数超过基线时以非零状态退出；
+还没有提交基线时只给出警告（加 --require-baseline 则失败），用 --update-baseline
+在实际构建 minishell 的编译器（Makefile 中为 clang）下生成基线并提交。
+
+后端:
+    valgrind  需要安装 valgrind，结果精确但很慢
+    preload   用 gcc 编译一个很小的 malloc / free 拦截库（默认，无 valgrind 时使用）
+
+使用方法:
+    python minishell_memcheck.py
+    python minishell_memcheck.py --backend valgrind -j 8
+    python minishell_memcheck.py --repeat 20 -k Pipe
+    python minishell_memcheck.py --update-baseline
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from minishell_runner import DEFAULT_MINISHELL, all_cases, run_minishell
+from minishell_session import needs_isolation
+
+REPORT_DIR = Path(__file__).resolve().parent / "reports"
+DEFAULT_REPORT = REPORT_DIR / "minishell_memcheck.json"
+# 基线需要提交到仓库，不能放在被忽略的 reports/ 下
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "memcheck_baseline.json"
+
+BACKENDS = ["preload", "valgrind"]
+
+# 与基线比较的指标，以及判定为回退的方式
+#   abs: 超过基线 + 容忍字节数    rel: 超过基线 * (1 + 阈值)    max: 超过基线
+BASELINE_METRICS = {
+    "leaked_bytes": "abs",
+    "growth_per_run": "abs",
+    "child_leaked_bytes": "abs",
+    "peak_rss_kb": "rel",
+    "open_fds": "max",
+}
+
+# 拦截 malloc 家族的跟踪库。计数器在 fork 后各进程独立；退出时（析构函数）
+# 只有 /proc/self/exe 与 MSALLOC_TARGET 相同的进程写报告，被 exec 的外部命令不会写。
+# 析构函数里不能再分配内存，所以 fd 计数和 VmHWM 读取都只用系统调用和栈上缓冲区。
+TRACKER_SOURCE = r'''
+#define _GNU_SOURCE
+#include <fcntl.h>
+#include <malloc.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+extern void *__libc_malloc(size_t);
+extern void *__libc_calloc(size_t, size_t);
+extern void *__libc_realloc(void *, size_t);
+extern void *__libc_memalign(size_t, size_t);
+extern void __libc_free(void *);
+
+static size_t n_allocs, n_frees, total_bytes, live_bytes, live_blocks, peak_bytes;
+
+static void on_alloc(void *p)
+{
+    size_t size;
+
+    if (!p)
+        return;
+    size = malloc_usable_size(p);
+    n_allocs++;
+    total_bytes += size;
+    live_bytes += size;
+    live_blocks++;
+    if (live_bytes > peak_bytes)
+        peak_bytes = live_bytes;
+}
+
+static void on_free(void *p)
+{
+    if (!p)
+        return;
+    n_frees++;
+    live_bytes -= malloc_usable_size(p);
+    live_blocks--;
+}
+
+void *malloc(size_t n) { void *p = __libc_malloc(n); on_alloc(p); return p; }
+void *calloc(size_t a, size_t b) { void *p = __libc_calloc(a, b); on_alloc(p); return p; }
+void free(void *p) { on_free(p); __libc_free(p); }
+void *memalign(size_t a, size_t n) { void *p = __libc_memalign(a, n); on_alloc(p); return p; }
+void *aligned_alloc(size_t a, size_t n) { return memalign(a, n); }
+void *valloc(size_t n) { return memalign(sysconf(_SC_PAGESIZE), n); }
+
+int posix_memalign(void **out, size_t a, size_t n)
+{
+    void *p = memalign(a, n);
+
+    if (!p)
+        return 12;
+    *out = p;
+    return 0;
+}
+
+void *realloc(void *old, size_t n)
+{
+    size_t old_size = old ? malloc_usable_size(old) : 0;
+    void *p = __libc_realloc(old, n);
+
+    if (old && (p || n == 0))
+    {
+        n_frees++;
+        live_bytes -= old_size;
+        live_blocks--;
+    }
+    on_alloc(p);
+    return p;
+}
+
+static long vm_hwm_kb(void)
+{
+    char buf[4096];
+    char *line;
+    ssize_t n;
+    int fd = open("/proc/self/status", O_RDONLY);
+
+    if (fd < 0)
+        return -1;
+    n = read(fd, buf, sizeof(buf) - 1);
+    close(fd);
+    if (n <= 0)
+        return -1;
+    buf[n] = 0;
+    line = strstr(buf, "VmHWM:");
+    return line ? strtol(line + 6, NULL, 10) : -1;
+}
+
+__attribute__((destructor)) static void msalloc_report(void)
+{
+    char exe[4096], path[4096], out[1024];
+    const char *dir = getenv("MSALLOC_DIR");
+    const char *target = getenv("MSALLOC_TARGET");
+    int fds = 0, fd, len;
+    ssize_t n;
+
+    if (!dir || !target)
+        return;
+    n = readlink("/proc/self/exe", exe, sizeof(exe) - 1);
+    if (n < 0)
+        return;
+    exe[n] = 0;
+    if (strcmp(exe, target) != 0)
+        return;
+    for (fd = 0; fd < 1024; fd++)
+        if (fcntl(fd, F_GETFD) != -1)
+            fds++;
+    len = snprintf(out, sizeof(out),
+        "{\"pid\": %d, \"ppid\": %d, \"allocs\": %zu, \"frees\": %zu, "
+        "\"bytes_allocated\": %zu, \"leaked_bytes\": %zu, \"leaked_blocks\": %zu, "
+        "\"peak_heap_bytes\": %zu, \"peak_rss_kb\": %ld, \"open_fds\": %d}\n",
+        getpid(), getppid(), n_allocs, n_frees, total_bytes, live_bytes, live_blocks,
+        peak_bytes, vm_hwm_kb(), fds);
+    snprintf(path, sizeof(path), "%s/%d.json", dir, getpid());
+    fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0)
+        return;
+    write(fd, out, len);
+    close(fd);
+}
+'''
+
+
+# ========================================
+# 后端
+# ========================================
+
+def build_tracker(build_dir: Optional[str] = None) -> str:
+    """编译 LD_PRELOAD 跟踪库，按源码哈希缓存，返回 .so 路径"""
+    digest = hashlib.sha256(TRACKER_SOURCE.encode()).hexdigest()[:12]
+    build_dir = build_dir or tempfile.gettempdir()
+    lib = os.path.join(build_dir, f"minishell_msalloc_{digest}.so")
+    if os.path.exists(lib):
+        return lib
+    src = lib[:-3] + ".c"
+    with open(src, "w", encoding="utf-8") as f:
+        f.write(TRACKER_SOURCE)
+    tmp_lib = f"{lib}.{os.getpid()}.tmp"
+    subprocess.run(["gcc", "-O2", "-shared", "-fPIC", "-o", tmp_lib, src], check=True)
+    os.replace(tmp_lib, lib)
+    return lib
+
+
+def _vg_number(pattern: str, text: str) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1).replace(",", "")) if match else 0
+
+
+def parse_valgrind_log(text: str) -> Optional[Dict]:
+    """解析 valgrind 文本日志，没有 HEAP SUMMARY（例如进程被 exec 替换）时返回 None"""
+    if "HEAP SUMMARY" not in text:
+        return None
+    usage = re.search(r"total heap usage: ([\d,]+) allocs, ([\d,]+) frees, ([\d,]+) bytes allocated",
+                      text)
+    allocs, frees, total = (int(g.replace(",", "")) for g in usage.groups()) if usage else (0, 0, 0)
+    definitely = _vg_number(r"definitely lost: ([\d,]+) bytes", text)
+    indirectly = _vg_number(r"indirectly lost: ([\d,]+) bytes", text)
+    return {
+        "allocs": allocs,
+        "frees": frees,
+        "bytes_allocated": total,
+        "leaked_bytes": definitely + indirectly,
+        "leaked_blocks": (_vg_number(r"definitely lost: [\d,]+ bytes in ([\d,]+) blocks", text)
+                          + _vg_number(r"indirectly lost: [\d,]+ bytes in ([\d,]+) blocks", text)),
+        "still_reachable_bytes": _vg_number(r"still reachable: ([\d,]+) bytes", text),
+        "peak_rss_kb": None,
+        "open_fds": _vg_number(r"FILE DESCRIPTORS: (\d+) open", text),
+    }
+
+
+def tracked_run(backend: str, minishell: str, script: str, cwd: str, lib: Optional[str],
+                timeout: float) -> Dict:
+    """
+    在跟踪下执行一段 minishell 输入
+
+    返回:
+        Dict: {"root": 主进程统计, "children": [fork 出的 minishell 子进程统计], "exit_code", "timed_out"}
+    """
+    report_dir = tempfile.mkdtemp(prefix="msalloc_")
+    env = dict(os.environ)
+    if backend == "valgrind":
+        argv = ["valgrind", "--leak-check=full", "--track-fds=yes",
+                f"--log-file={report_dir}/%p.log", minishell]
+    else:
+        argv = [minishell]
+        env.update(LD_PRELOAD=lib, MSALLOC_DIR=report_dir,
+                   MSALLOC_TARGET=os.path.realpath(minishell))
+
+    proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, cwd=cwd, env=env)
+    timed_out = False
+    try:
+        proc.communicate(script.encode(), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        timed_out = True
+
+    root, children = None, []
+    for name in sorted(os.listdir(report_dir)):
+        with open(os.path.join(report_dir, name), encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        pid = int(name.split(".")[0])
+        stats = parse_valgrind_log(text) if backend == "valgrind" else json.loads(text)
+        if stats is None:
+            continue
+        stats["pid"] = pid
+        if pid == proc.pid:
+            root = stats
+        else:
+            children.append(stats)
+    shutil.rmtree(report_dir, ignore_errors=True)
+    return {"root": root, "children": children, "exit_code": proc.returncode,
+            "timed_out": timed_out}
+
+
+# ========================================
+# 用例
+# ========================================
+
+def profile_case(case: Dict, minishell: str, backend: str, lib: Optional[str],
+                 repeat: int, timeout: float) -> Dict:
+    """在独立临时目录中跟踪执行一个用例（进程池 worker 入口）"""
+    start = time.perf_counter()
+    tmp = tempfile.mkdtemp(prefix="minishell_memcheck_")
+    try:
+        for setup in case.get("setup", []):
+            run_minishell(minishell, setup.replace("{tmp}", tmp), cwd=tmp, timeout=timeout)
+        line = case["command"].replace("{tmp}", tmp) + "\n"
+        once = tracked_run(backend, minishell, line, tmp, lib, timeout)
+        many = None
+        # exit / cd 等会改变 shell 状态的命令重复执行没有意义
+        if repeat > 1 and not needs_isolation(case):
+            many = tracked_run(backend, minishell, line * repeat, tmp, lib, timeout * repeat)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {"name": case["name"], "command": case["command"],
+              "duration": time.perf_counter() - start}
+    if once["timed_out"] or once["root"] is None:
+        result["error"] = "timed out" if once["timed_out"] else "no report (killed by signal?)"
+        return result
+    root = once["root"]
+    result.update({key: root[key] for key in
+                   ("allocs", "frees", "bytes_allocated", "leaked_bytes", "leaked_blocks",
+                    "peak_rss_kb", "open_fds")})
+    result["children"] = len(once["children"])
+    result["child_leaked_bytes"] = max((c["leaked_bytes"] for c in once["children"]), default=0)
+    if many and many["root"] is not None:
+        result["growth_per_run"] = (many["root"]["leaked_bytes"] - root["leaked_bytes"]) / (repeat - 1)
+    return result
+
+
+def profile_all(cases: List[Dict], minishell: str, backend: str, lib: Optional[str],
+                jobs: int, repeat: int, timeout: float) -> List[Dict]:
+    """把用例分片到进程池并行跟踪，结果顺序与用例顺序一致"""
+    n = len(cases)
+    args = ([minishell] * n, [backend] * n, [lib] * n, [repeat] * n, [timeout] * n)
+    if jobs <= 1:
+        return list(map(profile_case, cases, *args))
+    chunksize = max(1, n // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(profile_case, cases, *args, chunksize=chunksize))
+
+
+# ========================================
+# 基线
+# ========================================
+
+def load_baseline(path: Path) -> Dict:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path: Path, backend: str, results: List[Dict]):
+    """把本次结果写为指定后端的基线，保留其它后端的基线"""
+    baseline = load_baseline(path)
+    baseline[backend] = {
+        r["name"]: {key: r[key] for key in BASELINE_METRICS if r.get(key) is not None}
+        for r in results if "error" not in r
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+
+
+def find_regressions(baseline: Dict, results: List[Dict], leak_tolerance: int,
+                     threshold: float) -> List[str]:
+    """与基线逐用例比较，返回超出基线的描述"""
+    regressions = []
+    for r in results:
+        if "error" in r:
+            regressions.append(f"{r['name']}: {r['error']}")
+            continue
+        base = baseline.get(r["name"])
+        if base is None:
+            continue
+        for key, kind in BASELINE_METRICS.items():
+            value, past = r.get(key), base.get(key)
+            if value is None or past is None:
+                continue
+            if kind == "abs":
+                worse = value > past + leak_tolerance
+            elif kind == "rel":
+                worse = value > past * (1 + threshold)
+            else:
+                worse = value > past
+            if worse:
+                regressions.append(f"{r['name']} {key}: {value:g} (基线 {past:g})")
+    return regressions
+
+
+def format_row(r: Dict) -> str:
+    if "error" in r:
+        return f"{r['name']:<40} ✗ {r['error']}"
+    rss = f"{r['peak_rss_kb']:>7} KB" if r.get("peak_rss_kb") is not None else "      - KB"
+    growth = f"  增长 {r['growth_per_run']:+.0f} B/次" if "growth_per_run" in r else ""
+    children = (f"  子进程泄漏 {r['child_leaked_bytes']} B ({r['children']} 个)"
+                if r["children"] else "")
+    return (f"{r['name']:<40} 泄漏 {r['leaked_bytes']:>8} B / {r['leaked_blocks']:>4} 块  "
+            f"分配 {r['allocs']:>6} 次  RSS {rss}  fd {r['open_fds']:>2}{growth}{children}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='在 valgrind / LD_PRELOAD 跟踪下并行执行 minishell 用例，检测内存和 fd 泄漏',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python minishell_memcheck.py
+  python minishell_memcheck.py --backend valgrind -j 8
+  python minishell_memcheck.py --repeat 20 -k Pipe
+  python minishell_memcheck.py --update-baseline
+  python minishell_memcheck.py --require-baseline
+        '''
+    )
+    parser.add_argument('--minishell', default=str(DEFAULT_MINISHELL),
+                        help='minishell 可执行文件路径 (默认: ../source/minishell/minishell)')
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                        help='跟踪后端 (默认: 有 valgrind 时用 valgrind，否则 preload)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='并行进程数 (默认: CPU 核数)')
+    parser.add_argument('-k', '--filter', default='', help='只运行名称包含该子串的用例')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='在同一进程中重复执行 N 次以测量每次的内存增长 (默认: 1，不测量)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='单次执行的超时时间，单位秒 (默认: 30)')
+    parser.add_argument('--output', default=str(DEFAULT_REPORT),
+                        help='报告文件 (默认: reports/minishell_memcheck.json)')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                        help='基线文件 (默认: memcheck_baseline.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='把本次结果写为基线')
+    parser.add_argument('--require-baseline', action='store_true',
+                        help='没有基线时以非零状态退出 (默认只警告)')
+    parser.add_argument('--leak-tolerance', type=int, default=0,
+                        help='泄漏 / 增长允许超出基线的字节数 (默认: 0)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='峰值 RSS 判定为回退的相对变化 (默认: 0.2)')
+    args = parser.parse_args()
+
+    if not os.access(args.minishell, os.X_OK):
+        print(f"✗ 错误: minishell 不存在或不可执行: {args.minishell}", file=sys.stderr)
+        print("提示: 先在 source/minishell 目录下执行 make", file=sys.stderr)
+        sys.exit(1)
+
+    backend = args.backend or ("valgrind" if shutil.which("valgrind") else "preload")
+    lib = None
+    if backend == "valgrind" and not shutil.which("valgrind"):
+        print("✗ 错误: 找不到 valgrind，可以改用 --backend preload", file=sys.stderr)
+        sys.exit(1)
+    if backend == "preload":
+        try:
+            lib = build_tracker()
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"✗ 编译跟踪库失败: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    cases = [c for c in all_cases() if args.filter in c["name"]]
+    print(f"🔍 后端 {backend}，{len(cases)} 个用例，{args.jobs} 个进程")
+    start = time.perf_counter()
+    results = profile_all(cases, args.minishell, backend, lib, args.jobs, args.repeat,
+                          args.timeout)
+    print(f"⏱️ 总耗时 {time.perf_counter() - start:.2f} s\n")
+
+    ranked = sorted(results, key=lambda r: (-r.get("leaked_bytes", float("inf")),
+                                            -r.get("growth_per_run", 0)))
+    print("📊 按泄漏量排序:")
+    for r in ranked:
+        print(f"  {format_row(r)}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"backend": backend, "repeat": args.repeat, "results": ranked},
+                  f, indent=2, ensure_ascii=False)
+    print(f"\n💾 报告已保存: {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        save_baseline(baseline_path, backend, results)
+        print(f"💾 基线已更新: {baseline_path}")
+        return
+
+    baseline = load_baseline(baseline_path).get(backend)
+    if baseline is None:
+        if args.require_baseline:
+            print(f"❌ {baseline_path} 中没有 {backend} 后端的基线，"
+                  f"使用 --update-baseline 生成并提交", file=sys.stderr)
+            sys.exit(1)
+        print(f"\n⚠️ {baseline_path} 中没有 {backend} 后端的基线，跳过回退检查；"
+              f"使用 --update-baseline 生成并提交", file=sys.stderr)
+        return
+    regressions = find_regressions(baseline, results, args.leak_tolerance, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项超出基线:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n✅ 没有超出基线的泄漏或增长")
+
+
+if __name__ == '__main__':
+    main()
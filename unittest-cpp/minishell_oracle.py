@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Minishell 用例的 bash 参照结果缓存
+
+每个用例在 bash 下用固定的环境变量、全新的临时工作目录执行一次，
+把规范化后的 stdout、stderr、退出码和工作目录中的文件存入按内容寻址的缓存：
+键是 (命令, setup, 环境变量, bash 版本) 的 SHA-256，因此只有命令或 bash 版本
+变化时才会重新执行 bash。minishell_runner.py --oracle 用它做精确相等断言，
+替代 .cc 中 output.find("3") 这样的子串检查。
+
+使用方法:
+    python minishell_oracle.py              # 预先生成缺失的参照结果
+    python minishell_oracle.py --refresh    # 忽略缓存重新生成
+    python minishell_oracle.py --prune      # 删除不再被任何用例引用的缓存
+    python minishell_runner.py --oracle     # 用参照结果断言 minishell
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from minishell_fuzz import fuzz_env, normalize_stderr, run_bash, snapshot_dir
+from minishell_runner import all_cases, run_minishell
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".oracle_cache"
+
+# 参照结果中比较的字段
+ORACLE_FIELDS = ("stdout", "stderr", "exit_code", "files")
+
+# bash 自己维护、minishell 不一定导出的变量，比较 env 输出时忽略
+SHELL_MAINTAINED_VARS = ("_=", "PWD=", "OLDPWD=", "SHLVL=")
+
+
+@lru_cache(maxsize=None)
+def bash_version(bash: str) -> str:
+    """bash --version 的第一行，作为缓存键的一部分"""
+    proc = subprocess.run([bash, "--version"], stdout=subprocess.PIPE, check=True)
+    return proc.stdout.decode(errors="replace").splitlines()[0]
+
+
+def run_hermetic(kind: str, shell: str, case: Dict, timeout: float = 10) -> Dict:
+    """
+    在固定环境变量和全新临时目录中执行用例的 setup 与 command，并规范化结果
+
+    参数:
+        kind: "bash" 或 "minishell"
+        shell: shell 可执行文件路径
+        case: minishell_runner 格式的用例
+
+    返回:
+        Dict: {"stdout", "stderr", "exit_code", "files"}，临时目录路径替换为 $TMP
+    """
+    tmp = tempfile.mkdtemp(prefix=f"oracle_{kind}_")
+    try:
+        env = fuzz_env(tmp)
+
+        def run(line: str) -> Dict:
+            line = line.replace("{tmp}", tmp)
+            if kind == "minishell":
+                return run_minishell(shell, line, cwd=tmp, env=env, timeout=timeout)
+            return run_bash(shell, line, tmp, env, timeout)
+
+        for setup in case.get("setup", []):
+            run(setup)
+        result = run(case["command"])
+        files = snapshot_dir(tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "stdout": result["stdout"].replace(tmp, "$TMP"),
+        "stderr": normalize_stderr(result["stderr"].replace(tmp, "$TMP")),
+        "exit_code": result["exit_code"],
+        "files": {k: v.replace(tmp, "$TMP") for k, v in files.items()},
+    }
+
+
+def normalize_env_dump(text: str) -> str:
+    """env 的输出顺序不固定：去掉 shell 维护的变量后按行排序"""
+    lines = [line for line in text.splitlines() if not line.startswith(SHELL_MAINTAINED_VARS)]
+    return "\n".join(sorted(lines))
+
+
+def compare_to_oracle(actual: Dict, expected: Dict, mode: str = "exact") -> List[str]:
+    """
+    逐字段比较，返回失败原因列表
+
+    参数:
+        mode: "exact" 精确比较；"env" 把 stdout 和文件内容视为 env 输出再比较
+    """
+    if mode == "env":
+        actual, expected = (
+            dict(r, stdout=normalize_env_dump(r["stdout"]),
+                 files={k: normalize_env_dump(v) for k, v in r["files"].items()})
+            for r in (actual, expected)
+        )
+    return [
+        f"{field} differs from bash: {actual[field]!r} != {expected[field]!r}"
+        for field in ORACLE_FIELDS
+        if actual[field] != expected[field]
+    ]
+
+
+class BashOracle:
+    """按内容寻址的 bash 参照结果缓存"""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, bash: Optional[str] = None,
+                 timeout: float = 10):
+        self.cache_dir = Path(cache_dir)
+        self.bash = bash or shutil.which("bash") or "/bin/bash"
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        # attach 在线程池中调用 expected，计数器的 += 不是原子操作
+        self._lock = threading.Lock()
+
+    def key(self, case: Dict) -> str:
+        """命令、setup、环境变量和 bash 版本的 SHA-256"""
+        material = {
+            "command": case["command"],
+            "setup": case.get("setup", []),
+            # 环境变量中的 HOME 是每次的临时目录，用占位符参与哈希
+            "env": fuzz_env("$TMP"),
+            "bash": bash_version(self.bash),
+        }
+        blob = json.dumps(material, sort_keys=True, ensure_ascii=False).encode()
+        return hashlib.sha256(blob).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def lookup(self, case: Dict) -> Optional[Dict]:
+        path = self._path(self.key(case))
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["expected"]
+
+    def store(self, case: Dict, expected: Dict):
+        key = self.key(case)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再改名，并行生成时不会读到半个文件；同一进程的线程各用各的临时文件
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"command": case["command"], "setup": case.get("setup", []),
+                       "expected": expected}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def expected(self, case: Dict, refresh: bool = False) -> Dict:
+        """返回用例的参照结果，缓存未命中时执行一次 bash"""
+        if not refresh:
+            cached = self.lookup(case)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                return cached
+        with self._lock:
+            self.misses += 1
+        expected = run_hermetic("bash", self.bash, case, self.timeout)
+        self.store(case, expected)
+        return expected
+
+    def attach(self, cases: List[Dict], refresh: bool = False, jobs: int = 4) -> List[Dict]:
+        """给每个用例附加 "expected" 字段，未命中的用例并行执行 bash"""
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            expected = list(pool.map(lambda c: self.expected(c, refresh), cases))
+        return [dict(case, expected=e) for case, e in zip(cases, expected)]
+
+    def prune(self, cases: List[Dict]) -> int:
+        """删除不再被任何用例引用的缓存文件，返回删除数量"""
+        keep = {self._path(self.key(c)) for c in cases}
+        removed = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            if path not in keep:
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='生成 / 管理 minishell 用例的 bash 参照结果缓存',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python minishell_oracle.py
+  python minishell_oracle.py --refresh
+  python minishell_oracle.py --prune
+        '''
+    )
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR),
+                        help='缓存目录 (默认: .oracle_cache)')
+    parser.add_argument('--bash', default=None, help='参照 shell (默认: PATH 中的 bash)')
+    parser.add_argument('--refresh', action='store_true', help='忽略缓存重新执行 bash')
+    parser.add_argument('--prune', action='store_true', help='删除不再被引用的缓存')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='并行执行 bash 的线程数 (默认: CPU 核数)')
+    args = parser.parse_args()
+
+    oracle = BashOracle(Path(args.cache_dir), args.bash)
+    cases = all_cases()
+    if args.prune:
+        print(f"🧹 删除了 {oracle.prune(cases)} 个过期的参照结果")
+        return
+
+    try:
+        oracle.attach(cases, refresh=args.refresh, jobs=args.jobs)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"✗ 执行 bash 失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ {len(cases)} 个用例的参照结果已就绪"
+          f"（命中 {oracle.hits}，新生成 {oracle.misses}）: {oracle.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
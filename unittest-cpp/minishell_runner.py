@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Minishell 并行测试驱动
+
+与 minishell_*_test.cc 覆盖相同的 builtin / pipe / redirect 用例，但：
+- 直接用 subprocess 启动 minishell（不经过 /bin/sh -c "echo ... | minishell"）
+- 一次执行同时得到 stdout、stderr 和退出码（不再为 $? 重复执行命令）
+- 用例分片到进程池中并行执行，每个用例使用独立的临时目录
+
+使用方法:
+    python minishell_runner.py
+    python minishell_runner.py -j 8
+    python minishell_runner.py -k Echo
+    python minishell_runner.py --minishell ../source/minishell/minishell
+    python minishell_runner.py --session     # 使用常驻会话，见 minishell_session.py
+    python minishell_runner.py --oracle      # 与缓存的 bash 参照结果精确比较，见 minishell_oracle.py
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Minishell 可执行文件路径（相对于本脚本）
+DEFAULT_MINISHELL = Path(__file__).resolve().parent.parent / "source" / "minishell" / "minishell"
+
+# minishell 每次读取命令前输出到 stderr 的提示符
+PROMPT_RE = re.compile("(?:😎|🤬) \x1b\\[0;36m\x1b\\[1mminishell ▸ \x1b\\[0m")
+
+# minishell 读到 EOF (Ctrl-D) 时输出到 stdout 的擦除序列
+EOF_ERASE = "  \b\b"
+
+
+# ========================================
+# 测试用例（与 .cc 文件中的用例一一对应）
+# ========================================
+#
+# 每个用例是一个字典:
+#   name      用例名称（套件.用例）
+#   command   传给 minishell 的命令，{tmp} 会替换为用例独立的临时目录
+#   setup     可选，在 command 之前单独执行的命令列表
+#   contains  可选，stdout + stderr 中必须包含的子串（支持 {tmp} / {cwd} / {parent}）
+#   not_empty 可选，输出不能为空
+#   exit_code 可选，期望的退出码
+#   files     可选，{文件路径: {"contains": [...], "startswith": str}} 文件内容检查
+#   expected  可选，bash 参照结果（由 minishell_oracle 附加），存在时改为精确比较
+#   oracle    可选，与参照结果的比较方式，"env" 表示输出是无序的环境变量列表
+
+def builtin_cases() -> List[Dict]:
+    """minishell_builtin_test.cc"""
+    home = os.environ.get("HOME", "/tmp")
+    cases = [
+        {"name": "Builtin.EchoSimpleString", "command": "echo Hello", "contains": ["Hello"]},
+        {"name": "Builtin.EchoEmptyString", "command": "echo", "contains": ["\n"]},
+    ]
+    echo_params = [
+        ("\"Hello World\"", "Hello World", "DoubleQuoted"),
+        ("'Single Quotes'", "Single Quotes", "SingleQuoted"),
+        ("$HOME", home, "EnvironmentVariable"),
+        ("Hello World", "Hello World", "UnquotedMultipleWords"),
+    ]
+    for arg, expected, desc in echo_params:
+        cases.append({
+            "name": f"EchoTests.{desc}",
+            "command": f"echo {arg}",
+            "contains": [expected],
+        })
+    cd_params = [
+        ("/", "/", "Root"),
+        (".", "{cwd}", "Current"),
+        ("..", "{parent}", "Parent"),
+        ("/tmp", "/tmp", "Tmp"),
+    ]
+    for target, expected, desc in cd_params:
+        cases.append({
+            "name": f"CdBoundaryTests.{desc}",
+            "command": f"cd {target}; pwd",
+            "contains": [expected],
+        })
+    return cases
+
+
+def pipe_cases() -> List[Dict]:
+    """minishell_pipe_test.cc"""
+    return [
+        {"name": "Pipe.SimplePipe", "command": "echo 'hello world' | cat", "contains": ["hello world"]},
+        {"name": "Pipe.PipeWithWc", "command": "echo 'one two three' | wc -w", "contains": ["3"]},
+        {"name": "Pipe.MultiplePipes", "command": "echo 'test line' | cat | cat", "contains": ["test line"]},
+        # 决策表 R1-R4：失败的组合与 .cc 中一样只执行、不断言输出
+        {"name": "PipeDecisionTable.R1", "command": "echo 'test' | cat", "not_empty": True},
+        # R2 的输出被重定向到文件（.cc 中非空检查只命中了提示符），这里改为检查文件内容
+        {"name": "PipeDecisionTable.R2", "command": "echo 'test' | cat > {tmp}/test_pipe_r2.txt",
+         "files": {"{tmp}/test_pipe_r2.txt": {"contains": ["test"]}}},
+        {"name": "PipeDecisionTable.R3", "command": "echo 'test' | nonexistent_command_12345"},
+        {"name": "PipeDecisionTable.R4", "command": "nonexistent_command_67890 | cat"},
+    ]
+
+
+def redirect_cases() -> List[Dict]:
+    """minishell_redirect_test.cc（命令 × 重定向操作符的笛卡尔积）"""
+    cases = []
+    output = "{tmp}/minishell_test_output.txt"
+    for command in ["echo 'test1'", "env", "pwd"]:
+        for op in [">", ">>"]:
+            if command.startswith("echo"):
+                expect = {"contains": ["test"] + (["initial"] if op == ">>" else [])}
+            elif command == "pwd":
+                expect = {"contains": ["initial", "/"]} if op == ">>" else {"startswith": "/"}
+            else:
+                expect = {"contains": ["="]}
+            cases.append({
+                "name": f"CombineRedirectCombinations.{command.split()[0]}_{'append' if op == '>>' else 'trunc'}",
+                "setup": [f"echo 'initial' > {output}"] if op == ">>" else [],
+                "command": f"{command} {op} {output}",
+                "files": {output: expect},
+                "oracle": "env" if command == "env" else "exact",
+            })
+    return cases
+
+
+def all_cases() -> List[Dict]:
+    return builtin_cases() + pipe_cases() + redirect_cases()
+
+
+# ========================================
+# 执行
+# ========================================
+
+def clean_stderr(stderr: str) -> str:
+    """去掉 stderr 中的提示符和 EOF 时输出的 exit"""
+    stderr = PROMPT_RE.sub("", stderr)
+    if stderr.endswith("exit\n"):
+        stderr = stderr[:-len("exit\n")]
+    return stderr
+
+
+def run_minishell(minishell: str, command: str, cwd: Optional[str] = None,
+                  env: Optional[Dict[str, str]] = None, timeout: float = 10) -> Dict:
+    """
+    直接启动 minishell 执行一行命令
+
+    返回:
+        Dict: {"stdout", "stderr", "exit_code", "duration", "timed_out"}
+    """
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [minishell],
+            input=(command + "\n").encode(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired as e:
+        return {
+            "stdout": (e.stdout or b"").decode(errors="replace"),
+            "stderr": (e.stderr or b"").decode(errors="replace"),
+            "exit_code": None,
+            "duration": time.perf_counter() - start,
+            "timed_out": True,
+        }
+    return {
+        "stdout": proc.stdout.decode(errors="replace").replace(EOF_ERASE, ""),
+        "stderr": clean_stderr(proc.stderr.decode(errors="replace")),
+        "exit_code": proc.returncode,
+        "duration": time.perf_counter() - start,
+        "timed_out": False,
+    }
+
+
+def check_case(case: Dict, result: Dict, subst: Dict[str, str]) -> List[str]:
+    """按用例中的期望检查执行结果，返回失败原因列表"""
+    def fill(text: str) -> str:
+        for key, value in subst.items():
+            text = text.replace("{" + key + "}", value)
+        return text
+
+    errors = []
+    if result["timed_out"]:
+        return ["timed out"]
+    output = result["stdout"] + result["stderr"]
+    for expected in case.get("contains", []):
+        if fill(expected) not in output:
+            errors.append(f"output does not contain {fill(expected)!r}: {output!r}")
+    if case.get("not_empty") and not output:
+        errors.append("output is empty")
+    if "exit_code" in case and result["exit_code"] != case["exit_code"]:
+        errors.append(f"exit code {result['exit_code']} != {case['exit_code']}")
+    for path, expect in case.get("files", {}).items():
+        path = fill(path)
+        if not os.path.exists(path):
+            errors.append(f"file {path} was not created")
+            continue
+        with open(path, encoding="utf-8", errors="replace") as f:
+            content = f.read()
+        for expected in expect.get("contains", []):
+            if expected not in content:
+                errors.append(f"{path} does not contain {expected!r}: {content!r}")
+        if "startswith" in expect and not content.startswith(expect["startswith"]):
+            errors.append(f"{path} does not start with {expect['startswith']!r}: {content!r}")
+    return errors
+
+
+def run_case(case: Dict, minishell: str, timeout: float = 10) -> Dict:
+    """在独立的临时目录中执行一个用例（进程池 worker 入口）"""
+    if "expected" in case:
+        return run_oracle_case(case, minishell, timeout)
+    tmp = tempfile.mkdtemp(prefix="minishell_case_")
+    try:
+        subst = {"tmp": tmp, "cwd": tmp, "parent": os.path.dirname(tmp)}
+
+        def fill(text: str) -> str:
+            return text.replace("{tmp}", tmp)
+
+        for setup in case.get("setup", []):
+            run_minishell(minishell, fill(setup), cwd=tmp, timeout=timeout)
+        result = run_minishell(minishell, fill(case["command"]), cwd=tmp, timeout=timeout)
+        errors = check_case(case, result, subst)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "name": case["name"],
+        "passed": not errors,
+        "errors": errors,
+        "exit_code": result["exit_code"],
+        "duration": result["duration"],
+    }
+
+
+def run_oracle_case(case: Dict, minishell: str, timeout: float = 10) -> Dict:
+    """与 bash 参照结果相同的环境中执行用例，并逐字段精确比较"""
+    from minishell_oracle import compare_to_oracle, run_hermetic
+    start = time.perf_counter()
+    actual = run_hermetic("minishell", minishell, case, timeout)
+    errors = compare_to_oracle(actual, case["expected"], case.get("oracle", "exact"))
+    return {
+        "name": case["name"],
+        "passed": not errors,
+        "errors": errors,
+        "exit_code": actual["exit_code"],
+        "duration": time.perf_counter() - start,
+    }
+
+
+def run_all(cases: List[Dict], minishell: str, jobs: int, timeout: float = 10) -> List[Dict]:
+    """把用例分片到进程池并行执行，结果顺序与用例顺序一致"""
+    if jobs <= 1:
+        return [run_case(case, minishell, timeout) for case in cases]
+    chunksize = max(1, len(cases) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run_case, cases, [minishell] * len(cases),
+                             [timeout] * len(cases), chunksize=chunksize))
+
+
+def main(session: bool = False):
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='并行执行 minishell 的 builtin / pipe / redirect 测试用例',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+例子:
+  python minishell_runner.py
+  python minishell_runner.py -j 8 -k Pipe
+  python minishell_runner.py --list
+  python minishell_runner.py --session
+  python minishell_runner.py --oracle
+        '''
+    )
+    parser.add_argument('--minishell', default=str(DEFAULT_MINISHELL),
+                        help='minishell 可执行文件路径 (默认: ../source/minishell/minishell)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='并行进程数 (默认: CPU 核数)')
+    parser.add_argument('-k', '--filter', default='',
+                        help='只运行名称包含该子串的用例')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='单个用例的超时时间，单位秒 (默认: 10)')
+    parser.add_argument('--list', action='store_true', help='只列出用例，不执行')
+    parser.add_argument('--session', action='store_true', default=session,
+                        help='每个进程复用一个常驻 minishell 会话，而不是每个用例启动新进程')
+    parser.add_argument('--oracle', action='store_true',
+                        help='与缓存的 bash 参照结果做精确比较，替代子串检查')
+    args = parser.parse_args()
+
+    cases = [c for c in all_cases() if args.filter in c["name"]]
+    if args.list:
+        for case in cases:
+            print(f"{case['name']}: {case['command']}")
+        return
+
+    if not os.access(args.minishell, os.X_OK):
+        print(f"✗ 错误: minishell 不存在或不可执行: {args.minishell}", file=sys.stderr)
+        print("提示: 先在 source/minishell 目录下执行 make", file=sys.stderr)
+        sys.exit(1)
+
+    if args.oracle:
+        from minishell_oracle import BashOracle
+        oracle = BashOracle(timeout=args.timeout)
+        cases = oracle.attach(cases, jobs=args.jobs)
+        print(f"[==========] bash 参照结果: 命中 {oracle.hits}，新生成 {oracle.misses}")
+
+    mode = "常驻会话" if args.session else "独立进程"
+    print(f"[==========] 运行 {len(cases)} 个用例，{args.jobs} 个进程（{mode}）")
+    start = time.perf_counter()
+    if args.session:
+        from minishell_session import run_all_sessions
+        results = run_all_sessions(cases, args.minishell, args.jobs, args.timeout)
+    else:
+        results = run_all(cases, args.minishell, args.jobs, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        status = "[       OK ]" if r["passed"] else "[  FAILED  ]"
+        print(f"{status} {r['name']} ({r['duration'] * 1000:.0f} ms)")
+        for error in r["errors"]:
+            print(f"             {error}")
+
+    failed = [r for r in results if not r["passed"]]
+    print(f"[==========] {len(results)} 个用例，总耗时 {elapsed * 1000:.0f} ms")
+    print(f"[  PASSED  ] {len(results) - len(failed)} 个用例")
+    if failed:
+        print(f"[  FAILED  ] {len(failed)} 个用例:")
+        for r in failed:
+            print(f"[  FAILED  ] {r['name']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Minishell 常驻会话驱动
+
+在伪终端上保持一个长期运行的 minishell，每条命令后追加一条
+`echo <哨兵>:$?`，按哨兵把输出和退出码切分回各条命令：
+- stdin / stdout 连接到 pty（raw 模式，无回显、无 \\r\\n 转换）
+- stderr 单独走管道，按提示符切分出每条命令的错误输出
+- 会改变 shell 状态的命令（exit、cd、export、unset）仍然使用全新进程执行
+
+每个 worker 进程只启动一个 minishell 会话，几百次进程启动因此变成几次。
+
+使用方法:
+    python minishell_session.py
+    python minishell_session.py -j 4 -k Pipe
+"""
+
+import codecs
+import os
+import pty
+import re
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tty
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from minishell_runner import EOF_ERASE, PROMPT_RE, check_case, run_case
+
+# 会改变 shell 自身状态、必须在独立进程中执行的命令
+ISOLATED_RE = re.compile(r"(?:^|[;|]\s*)(?:exit|cd|export|unset)\b")
+
+
+def needs_isolation(case: Dict) -> bool:
+    """用例中是否有会污染会话状态的命令"""
+    commands = case.get("setup", []) + [case["command"]]
+    return any(ISOLATED_RE.search(c.strip()) for c in commands)
+
+
+class MinishellSession:
+    """连接在伪终端上的常驻 minishell 进程"""
+
+    def __init__(self, minishell: str, cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.minishell = minishell
+        self.cwd = cwd
+        self.env = env
+        self.commands_run = 0
+        self._seq = 0
+        self._start()
+
+    def _start(self):
+        master, slave = pty.openpty()
+        # raw 模式: 关闭回显、行缓冲和输出换行转换，命令长度也不受 MAX_CANON 限制
+        tty.setraw(slave)
+        self.proc = subprocess.Popen(
+            [self.minishell],
+            stdin=slave,
+            stdout=slave,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            start_new_session=True,
+        )
+        os.close(slave)
+        self._master = master
+        self._stdout = b""
+        self._eof = False
+        self._stderr = ""
+        self._stderr_pos = 0
+        self._stderr_cond = threading.Condition()
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        """后台读取 stderr，避免管道写满阻塞 minishell"""
+        stream = self.proc.stderr
+        # 提示符中的 emoji 可能被拆在两次读取之间，需要增量解码
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = stream.read1(65536)
+            with self._stderr_cond:
+                self._stderr += decoder.decode(chunk, final=not chunk)
+                self._stderr_cond.notify_all()
+                if not chunk:
+                    return
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        """结束会话进程"""
+        if self.alive:
+            self.proc.kill()
+        self.proc.wait()
+        try:
+            os.close(self._master)
+        except OSError:
+            pass
+
+    def restart(self):
+        self.close()
+        self._start()
+
+    def _read_until(self, pattern: re.Pattern, deadline: float) -> Optional[re.Match]:
+        """从 pty 读取 stdout，直到出现 pattern 或超时 / 进程退出"""
+        while True:
+            match = pattern.search(self._stdout)
+            if match:
+                return match
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self._master], [], [], remaining)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self._master, 65536)
+            except OSError:
+                # slave 端全部关闭（进程已退出）时 Linux 返回 EIO
+                chunk = b""
+            if not chunk:
+                self._eof = True
+                return None
+            self._stdout += chunk
+
+    def _take_stderr(self, deadline: float) -> str:
+        """
+        取出当前命令的 stderr
+
+        stderr 的顺序是: 命令前的提示符、命令的错误输出、哨兵前的提示符、
+        哨兵 echo 的输出（为空）。哨兵出现在 stdout 时前两个提示符一定已经写出。
+        """
+        with self._stderr_cond:
+            while True:
+                prompts = list(PROMPT_RE.finditer(self._stderr, self._stderr_pos))
+                if len(prompts) >= 2 or time.monotonic() >= deadline:
+                    break
+                self._stderr_cond.wait(max(deadline - time.monotonic(), 0))
+            if len(prompts) < 2:
+                return ""
+            text = self._stderr[prompts[0].end():prompts[1].start()]
+            self._stderr_pos = prompts[1].end()
+            return text
+
+    def run(self, command: str, timeout: float = 10) -> Dict:
+        """
+        在会话中执行一行命令
+
+        返回:
+            Dict: 与 minishell_runner.run_minishell 相同的结构
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        self._seq += 1
+        self.commands_run += 1
+        marker = f"__MINISHELL_SESSION_{os.getpid()}_{self._seq}__"
+        pattern = re.compile(re.escape(marker.encode()) + rb":(\d+)\n")
+        os.write(self._master, f"{command}\necho {marker}:$?\n".encode())
+
+        match = self._read_until(pattern, deadline)
+        if match is None:
+            # 超时，或者命令让 minishell 自己退出了（例如 exit）：记录后重启会话
+            timed_out = not self._eof
+            exit_code = None if timed_out else self.proc.wait()
+            stdout = self._stdout.decode(errors="replace").replace(EOF_ERASE, "")
+            self.restart()
+            return {
+                "stdout": stdout,
+                "stderr": "",
+                "exit_code": exit_code,
+                "duration": time.perf_counter() - start,
+                "timed_out": timed_out,
+            }
+        # get_next_line 每次读到不以换行结尾的数据块都会向 stdout 输出擦除序列
+        stdout = self._stdout[:match.start()].decode(errors="replace").replace(EOF_ERASE, "")
+        self._stdout = self._stdout[match.end():]
+        return {
+            "stdout": stdout,
+            "stderr": self._take_stderr(deadline),
+            "exit_code": int(match.group(1)),
+            "duration": time.perf_counter() - start,
+            "timed_out": False,
+        }
+
+
+def run_session_case(session: MinishellSession, case: Dict, timeout: float = 10) -> Dict:
+    """在会话中执行一个用例，需要隔离或与 bash 参照结果比较的用例退回到全新进程"""
+    if needs_isolation(case) or "expected" in case:
+        return run_case(case, session.minishell, timeout)
+    tmp = tempfile.mkdtemp(prefix="minishell_case_")
+    try:
+        subst = {"tmp": tmp, "cwd": session.cwd or os.getcwd(),
+                 "parent": os.path.dirname(session.cwd or os.getcwd())}
+        for setup in case.get("setup", []):
+            session.run(setup.replace("{tmp}", tmp), timeout)
+        result = session.run(case["command"].replace("{tmp}", tmp), timeout)
+        errors = check_case(case, result, subst)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "name": case["name"],
+        "passed": not errors,
+        "errors": errors,
+        "exit_code": result["exit_code"],
+        "duration": result["duration"],
+    }
+
+
+def run_shard(cases: List[Dict], minishell: str, timeout: float = 10) -> List[Dict]:
+    """用一个常驻会话顺序执行一个分片中的全部用例（进程池 worker 入口）"""
+    cwd = tempfile.mkdtemp(prefix="minishell_session_")
+    session = MinishellSession(minishell, cwd=cwd)
+    try:
+        return [run_session_case(session, case, timeout) for case in cases]
+    finally:
+        session.close()
+        shutil.rmtree(cwd, ignore_errors=True)
+
+
+def run_all_sessions(cases: List[Dict], minishell: str, jobs: int,
+                     timeout: float = 10) -> List[Dict]:
+    """把用例按 worker 数分片，每个分片一个会话，结果顺序与用例顺序一致"""
+    jobs = max(1, min(jobs, len(cases)))
+    if jobs == 1:
+        return run_shard(cases, minishell, timeout)
+    shards = [cases[i::jobs] for i in range(jobs)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        shard_results = list(pool.map(run_shard, shards, [minishell] * jobs, [timeout] * jobs))
+    results: List[Optional[Dict]] = [None] * len(cases)
+    for i, shard in enumerate(shard_results):
+        results[i::jobs] = shard
+    return results
+
+
+if __name__ == '__main__':
+    from minishell_runner import main
+    main(session=True)